@@ -3,76 +3,199 @@
 # Converts Bloomberg THRP repo trade file to BOCI-Prudential repo trade file 
 # format.
 # 
-from boci_trustee.trade import toDateTimeString, toStringIfFloat \
-							, getAccountNumber
-from clamc_datafeed.feeder import mergeDictionary
-from utils.iter import firstOf
-from utils.excel import getRawPositions
+from boci_trustee.trade import toStringIfFloat, getAccountNumber
+from boci_trustee.datecodec import excelOrdinalToDateString as toDateTimeString
+from boci_trustee.record import makeRecordType
+from boci_trustee.mapping import field, derived, getHeaders, makeMappingRecordType \
+								, compileMapper
+from boci_trustee.reader import rowsToValues
 from steven_utils.iter import skipN
-from toolz.itertoolz import groupby as groupbyToolz
 from toolz.functoolz import compose
 from functools import partial
-from itertools import dropwhile
+from itertools import dropwhile, groupby
+from tempfile import TemporaryDirectory
+from os.path import join
+import heapq, pickle
 import logging
 logger = logging.getLogger(__name__)
 
 
 
-def getRepoTrades(lines):
+def getRepoTrades(lines, maxGroups=0):
 	"""
-	[Iterator] tickets (Bloomberg REPO tickets) 
+	[Iterator] tickets (Bloomberg REPO tickets),
+	[Int] max number of groups to hold in memory, 0 for no limit
 		=> [Iterator] trades (BOCI trustee REPO trades)
+
+	When maxGroups is given, groups beyond it are spilled to disk and merged 
+	afterwards, then trades come in the order of group key.
+	"""
+	groupFunc = partial(groupTicketsExternal, maxGroups=maxGroups) if maxGroups > 0 else \
+				groupTickets
+
+	return map(ticketToTrade, map(indexToTicket, groupFunc(getRepoTickets(lines))))
+
+
+
+"""
+	[Dictionary] ticket => [Tuple] group key
+
+	Tickets of the same repo trade have the same key.
+"""
+groupIdentity = lambda tkt: \
+	( tkt['Fund'], toStringIfFloat(tkt['Trd Dt']), toStringIfFloat(tkt['Stl Date'])
+	, tkt['Crcy'], tkt['Broker ID'], toStringIfFloat(100.0 * tkt['Repo Rte'])
+	, toStringIfFloat(tkt['Unadj Term Money']), tkt['Repo Sta']
+	)
+
+
+
+"""
+	=> [Tuple] fields of a Bloomberg repo ticket used in grouping and
+		ticketToTrade()
+"""
+getRepoTicketFields = lambda: \
+	( 'Fund', 'Type', 'Repo Sta', 'Tkt #', 'Orig Tkt', 'Trd Dt', 'Stl Date'
+	, 'Trm Date', 'Crcy', 'Loan Amount', 'Repo Rte', 'Unadj Term Money'
+	, 'ISIN', 'Amount', 'Broker ID'
+	)
+
+
+
+RepoTicket = makeRecordType('RepoTicket', getRepoTicketFields(), __name__)
+
+
+
+"""
+	[Iterator] lines (from Bloomberg THRP Repo trade file) 
+		=> [Iterator] ([RepoTicket] repo tickets)
+
+	Only the fields in getRepoTicketFields() are read from each row, by
+	position.
+"""
+getRepoTickets = compose(
+	partial(map, RepoTicket)
+  , partial(rowsToValues, getRepoTicketFields())
+  , partial(dropwhile, lambda L: len(L) == 0 or L[0] == '')
+  , partial(skipN, 2)
+)
+
+
+
+def groupTickets(tickets):
+	"""
+	[Iterable] tickets => [Iterable] ([Dictionary] ticket type -> ticket)
+
+	Group tickets by groupIdentity, indexing each group by ticket type as
+	tickets arrive. Groups are in the order of their first ticket.
 	"""
-	groupIdentity = lambda tkt: \
-		tkt['Fund'] + toStringIfFloat(tkt['Trd Dt']) + toStringIfFloat(tkt['Stl Date']) + \
-		tkt['Crcy'] + tkt['Broker ID'] + toStringIfFloat(100.0 * tkt['Repo Rte']) + \
-		toStringIfFloat(tkt['Unadj Term Money']) + tkt['Repo Sta']
+	groups = {}
+	for tkt in tickets:
+		groups.setdefault(groupIdentity(tkt), {}).setdefault(tkt['Type'], tkt)
+
+	return groups.values()
+
+
+
+"""
+	[Tuple] (group key, [Dictionary] ticket type -> ticket) => [Tuple] sort key
+
+	Values of a group key may mix float and string, sort them as string.
+"""
+spillKey = lambda t: tuple(map(str, t[0]))
 
 
+
+def spillGroups(groups, file):
 	"""
-		[Iterator] lines (from Bloomberg THRP Repo trade file) 
-			=> [Iterator] repo tickets
+	[Dictionary] group key -> ([Dictionary] ticket type -> ticket),
+	[String] file
+		=> [String] file
+
+	Write the groups to the file, sorted by group key.
 	"""
-	getRepoTickets = compose(
-		getRawPositions
-	  , partial(dropwhile, lambda L: len(L) == 0 or L[0] == '')
-	  , partial(skipN, 2)
-	)
+	with open(file, 'wb') as f:
+		for item in sorted(groups.items(), key=spillKey):
+			pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+
+	return file
+
+
+
+def readSpilledGroups(file):
+	"""
+	[String] file => [Iterator] (group key, [Dictionary] ticket type -> ticket)
+	"""
+	with open(file, 'rb') as f:
+		while True:
+			try:
+				yield pickle.load(f)
+			except EOFError:
+				return
 
 
-	return map( ticketToTrade
-			  , map( groupToTicket
-			  	   , groupbyToolz( groupIdentity
-			  	   				 , getRepoTickets(lines)
-			  	   				 ).values()))
+
+def mergeIndexes(indexes):
+	"""
+	[Iterable] ([Dictionary] ticket type -> ticket) => [Dictionary] merged
+
+	Keep the first ticket of each type, as groupTickets() does.
+	"""
+	merged = {}
+	for index in indexes:
+		for ticketType, tkt in index.items():
+			merged.setdefault(ticketType, tkt)
+
+	return merged
 
 
 
-def groupToTicket(group):
+def groupTicketsExternal(tickets, maxGroups, tempDir=None):
 	"""
-	[List] group of tickets => [Dictionary] ticket
+	[Iterable] tickets,
+	[Int] max number of groups to hold in memory,
+	[String] where to create spill files, None for system temp directory
+		=> [Iterator] ([Dictionary] ticket type -> ticket)
+
+	Same as groupTickets() while the number of groups stays within maxGroups.
+	Beyond that, the groups in memory are written to disk as a sorted run
+	and memory is cleared. At the end all runs are merged by group key, and
+	parts of the same group from different runs are merged in input order.
 	"""
-	isActiveTicket = lambda g: \
-		g[0]['Repo Sta'] == 'Active'
+	with TemporaryDirectory(dir=tempDir) as spillDir:
+		runs = []
+		groups = {}
+		for tkt in tickets:
+			groups.setdefault(groupIdentity(tkt), {}).setdefault(tkt['Type'], tkt)
+			if len(groups) >= maxGroups:
+				runs.append(spillGroups(groups, join(spillDir, str(len(runs)))))
+				groups = {}
 
+		if len(runs) == 0:
+			yield from groups.values()
+			return
 
-	getMrcTicket = lambda g: \
-		firstOf(lambda el: el['Type'] == 'MRC', g)
+		logger.debug('groupTicketsExternal(): merge {0} runs'.format(len(runs) + 1))
+		runs.append(spillGroups(groups, join(spillDir, str(len(runs)))))
+		groups = {}
+		for _, items in groupby( heapq.merge(*map(readSpilledGroups, runs), key=spillKey)
+							   , spillKey):
+			yield mergeIndexes(map(lambda t: t[1], items))
 
-	getRtTicket = lambda g: \
-		firstOf(lambda el: el['Type'] == 'RT', g)
 
-	getKmrTicket = lambda g: \
-		firstOf(lambda el: el['Type'] == 'KMR', g)
 
-	getCrTicket = lambda g: \
-		firstOf(lambda el: el['Type'] == 'CR', g)
+def indexToTicket(index):
+	"""
+	[Dictionary] ticket type -> ticket of a group => [RepoTicket] ticket
+	"""
+	isActiveTicket = lambda index: \
+		next(iter(index.values()))['Repo Sta'] == 'Active'
 
 
 	return \
-	mergeDictionary(getRtTicket(group), {'Tkt #': getMrcTicket(group)['Tkt #']}) \
-	if isActiveTicket(group) else \
-	mergeDictionary(getCrTicket(group), {'Orig Tkt': getKmrTicket(group)['Orig Tkt']})
+	index.get('RT').replace({'Tkt #': index.get('MRC')['Tkt #']}) \
+	if isActiveTicket(index) else \
+	index.get('CR').replace({'Orig Tkt': index.get('KMR')['Orig Tkt']})
 
 
 
@@ -91,55 +214,109 @@ def toNumber(x):
 
 
 
+"""
+	[String] repo status, trade date, settle date => [String] sub type
+"""
+getSubType = lambda status, tradeDate, settleDate: \
+	'Close' if status == 'Closed' else \
+	'Change Rate' if tradeDate > settleDate else \
+	'Open'
+
+
+
+"""
+	[String] sub type ('Open' or 'Close'), trade date, term date
+		=> [String] mature date
+"""
+getMatureDate = lambda subType, tradeDate, termDate: \
+	toDateTimeString(tradeDate) if subType == 'Close' else \
+	'31/12/2049' if termDate == 'OPEN' else \
+	toDateTimeString(termDate)
+
+
+
+"""
+	[String] sub type ('Open' or 'Change Rate'), trade date, settle date
+		=> [String] effective date
+"""
+getEffectiveDate = lambda subType, tradeDate, settleDate: \
+	toDateTimeString(settleDate) if subType == 'Open' else \
+	toDateTimeString(tradeDate)
+
+
+
+"""
+	[String] sub type, original ticket, ticket number => [String] customer
+		reference
+"""
+getCustomerReference = lambda subType, origTicket, ticketNumber: \
+	toStringIfFloat(origTicket) if subType == 'Close' else \
+	toStringIfFloat(ticketNumber)
+
+
+
+"""
+	[String or Float] amount in thousands => [Float] quantity
+"""
+toQuantity = lambda amount: 1000 * toNumber(amount)
+
+
+
+"""
+	=> [Tuple] mapping from a Bloomberg repo ticket to a BOCI Prudential
+		repo trade, see mapping.py
+"""
+getRepoMapping = lambda: \
+	( derived('subType', getSubType, ('Repo Sta', 'Trd Dt', 'Stl Date'))
+	, field('Portfolio_code', 'Fund', getAccountNumber)
+	, field('Txn_type', value='REPO')
+	, field('Txn_sub_type', 'subType')
+	, field('Trade_date', 'Trd Dt', toDateTimeString, when=('subType', ('Open', )))
+	, field('Settle_date', 'Stl Date', toDateTimeString, when=('subType', ('Open', )))
+	, field( 'Mature_date', ('subType', 'Trd Dt', 'Trm Date'), getMatureDate
+		   , when=('subType', ('Open', 'Close')))
+	, field('Loan_ccy', 'Crcy', when=('subType', ('Open', 'Close')))
+	, field('Amount', 'Loan Amount', when=('subType', ('Open', 'Close')))
+	, field( 'Eff_date', ('subType', 'Trd Dt', 'Stl Date'), getEffectiveDate
+		   , when=('subType', ('Open', 'Change Rate')))
+	, field('Int_rate', 'Repo Rte', when=('subType', ('Open', 'Change Rate')))
+	, field('Int_mode', value='ACT/360', when=('subType', ('Open', 'Change Rate')))
+	, field('Col_ISIN', 'ISIN', when=('subType', ('Open', 'Close')))
+	, field('Col_SEDOL')
+	, field('Col_Bloomberg')
+	, field('Col_LocalCode')
+	, field('Col_CMUCode')
+	, field('Col_desc')
+	, field('Col_Qty', 'Amount', toQuantity, when=('subType', ('Open', 'Close')))
+	, field('Broker', 'Broker ID', when=('subType', ('Open', 'Close')))
+	, field('Exchange')
+	, field('Cust_ref', ('subType', 'Orig Tkt', 'Tkt #'), getCustomerReference)
+	)
+
+
+
 def ticketToTrade(ticket):
 	"""
 	[Dictionary] REPO trade ticket (Bloomberg)
-		=> [Dictionary] BOCI Prudential trade
-	"""
-	t = {}
-	t['Portfolio_code'] = getAccountNumber(ticket['Fund'])
-	t['Txn_type'] = 'REPO'
-	t['Txn_sub_type'] = 'Close' if ticket['Repo Sta'] == 'Closed' else \
-						'Change Rate' if ticket['Trd Dt'] > ticket['Stl Date'] else \
-						'Open'
-	t['Trade_date'] = toDateTimeString(ticket['Trd Dt']) if t['Txn_sub_type'] == 'Open' \
-						else ''
-	t['Settle_date'] = toDateTimeString(ticket['Stl Date']) if t['Txn_sub_type'] == 'Open' \
-						else ''
-	t['Mature_date'] = '' if t['Txn_sub_type'] == 'Change Rate' else \
-						toDateTimeString(ticket['Trd Dt']) if t['Txn_sub_type'] == 'Close' else \
-						'31/12/2049' if ticket['Trm Date'] == 'OPEN' else \
-						toDateTimeString(ticket['Trm Date'])
-	t['Loan_ccy'] = '' if t['Txn_sub_type'] == 'Change Rate' else ticket['Crcy']
-	t['Amount'] = '' if t['Txn_sub_type'] == 'Change Rate' else ticket['Loan Amount']
-	t['Eff_date'] = '' if t['Txn_sub_type'] == 'Close' else \
-					toDateTimeString(ticket['Stl Date']) if t['Txn_sub_type'] == 'Open' \
-					else toDateTimeString(ticket['Trd Dt'])
-	t['Int_rate'] = '' if t['Txn_sub_type'] == 'Close' else ticket['Repo Rte']
-	t['Int_mode'] = '' if t['Txn_sub_type'] == 'Close' else 'ACT/360'
-	t['Col_ISIN'] = '' if t['Txn_sub_type'] == 'Change Rate' else ticket['ISIN']
-	t['Col_Qty'] = '' if t['Txn_sub_type'] == 'Change Rate' else \
-					1000 * toNumber(ticket['Amount'])
-	t['Broker'] = '' if t['Txn_sub_type'] == 'Change Rate' else ticket['Broker ID']
-	t['Cust_ref'] = toStringIfFloat(ticket['Orig Tkt']) if t['Txn_sub_type'] == 'Close' \
-					else toStringIfFloat(ticket['Tkt #'])
-
-
-	return mergeDictionary( t
-						  , { 'Col_SEDOL': ''
-						    , 'Col_Bloomberg': ''
-						    , 'Col_LocalCode': ''
-						    , 'Col_CMUCode': ''
-						    , 'Col_desc': ''
-						    , 'Exchange': ''
-						    }
-						  )
-
-
-
-getRepoCsvHeaders = lambda: \
-	[ 'Portfolio_code',	'Txn_type',	'Txn_sub_type',	'Trade_date', 'Settle_date'
-	, 'Mature_date', 'Loan_ccy', 'Amount', 'Eff_date', 'Int_rate', 'Int_mode'
-	, 'Col_ISIN', 'Col_SEDOL', 'Col_Bloomberg',	'Col_LocalCode', 'Col_CMUCode'
-	, 'Col_desc', 'Col_Qty', 'Broker', 'Exchange', 'Cust_ref'
-	]
\ No newline at end of file
+		=> [RepoRecord] BOCI Prudential trade
+	"""
+	return toRepoRecord(*map(ticket.__getitem__, getRepoTicketFields()))
+
+
+
+getRepoCsvHeaders = lambda: getHeaders(getRepoMapping())
+
+
+
+RepoRecord = makeMappingRecordType('RepoRecord', getRepoMapping(), __name__)
+
+
+
+"""
+	Values of the Bloomberg repo ticket fields in getRepoTicketFields()
+		=> [RepoRecord] BOCI Prudential trade
+
+	Same as ticketToTrade(), taking the fields by position.
+"""
+toRepoRecord = compileMapper( 'toRepoRecord', getRepoTicketFields(), getRepoMapping()
+							, RepoRecord, module=__name__)
@@ -0,0 +1,411 @@
+# coding=utf-8
+#
+# Benchmark the converters on synthetic input files.
+#
+# Generates Bloomberg THRP trade, fx, repo files and BOCI valuation reports
+# of the given sizes, runs each converter on them and reports per stage time,
+# rows per second and peak memory. Each run appends one json line per case
+# to the results file, so results can be compared over time. The trade file
+# is run through both the per row (trade) and the column at a time
+# (tradeBatch) converters.
+#
+# For example,
+#
+# $python benchmark.py --sizes 1000 100000 1000000 --output benchmark.jsonl
+#
+from boci_trustee.utility import getCurrentDir
+from os.path import join, exists
+from tempfile import TemporaryDirectory
+from datetime import datetime
+from time import perf_counter
+import multiprocessing, platform, json, os
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+getTradeHeaders = lambda: \
+	[ 'Trader Name', 'Sedol1 Number', 'ISIN Number', 'Short Name', 'Buy/Sell'
+	, 'Amount (Pennies)', 'As of Date', 'Settlement Date', 'View in Currency'
+	, 'Trade price', 'Accrued Interest', 'Settlement Total in Settlemen'
+	, 'Ticket Number', 'Firm Account Short Name'
+	]
+
+
+getFXHeaders = lambda: \
+	[ 'Fund', 'Tkt #', 'FX Trade Deal Type', 'Shrt Name', 'B/S', 'As of Dt'
+	, 'Stl Date', 'Amount Pennies', 'Price', 'Crcy'
+	]
+
+
+getRepoHeaders = lambda: \
+	[ 'Tkt #', 'Fund', 'Trd Dt', 'Stl Date', 'Crcy', 'B/S', 'ISIN', 'Amount'
+	, 'Broker ID', 'Repo Rte', 'Unadj Term Money', 'Trm Date', 'Repo'
+	, 'Loan Amount', 'RTT', 'Accrued 4 Repo', 'Repo Sta', 'Orig Tkt', 'Type'
+	]
+
+
+getBrokers = lambda: \
+	['BOCHK-FI', 'JPM-FI', 'UBS-FI', 'BNP-FI', 'GS-FI']
+
+
+getCurrencyPairs = lambda: \
+	['USD/HKD', 'EUR/USD', 'USD/CNH', 'GBP/USD', 'AUD/USD']
+
+
+
+def writeXlsx(file, title, headers, rows):
+	"""
+	[String] file, [String] title, [List] headers, [Iterator] rows
+		=> [String] file
+
+	Write a THRP style sheet: two title lines, the headers, then the rows.
+	"""
+	from openpyxl import Workbook
+	wb = Workbook(write_only=True)
+	ws = wb.create_sheet()
+	ws.append(['China Life Franklin'])
+	ws.append([title])
+	ws.append(headers)
+	for row in rows:
+		ws.append(row)
+
+	wb.save(file)
+	return file
+
+
+
+def tradeRow(i):
+	"""
+	[Int] i => [List] the i-th synthetic bond trade
+	"""
+	quantity = 1000000.0 + 1000 * (i % 500)
+	return \
+	[ '40019', 'BK5JS96', 'XS{0:010d}'.format(i % 2000), 'BOND {0}'.format(i % 2000)
+	, 'B' if i % 2 else 'S', quantity, 44111.0 + i % 5, 44113.0 + i % 5, 'USD'
+	, 100.5, 1234.56, quantity * 1.005 + 1234.56, 300000.0 + i
+	, getBrokers()[i % len(getBrokers())]
+	]
+
+
+
+def fxRow(i):
+	"""
+	[Int] i => [List] the i-th synthetic fx trade
+	"""
+	pair = getCurrencyPairs()[i % len(getCurrencyPairs())]
+	return \
+	[ '40019', 400000.0 + i, 'SPOT' if i % 3 else 'FORWARD'
+	, '{0} R 12/30/20'.format(pair), 'B' if i % 2 else 'S'
+	, '28/12/20', 44195.0 + i % 30 if i % 3 == 0 else '30/12/20'
+	, 10000.0 + i % 1000, 7.75, pair.split('/')[i % 2]
+	]
+
+
+
+def repoRows(i):
+	"""
+	[Int] i => [List] ([List] repo ticket), the i-th synthetic repo group
+
+	Even groups are active repos (MRC and RT tickets), odd groups are closed
+	repos (KMR and CR tickets).
+	"""
+	ticket = 500000.0 + 2 * i
+	common = lambda tkt, isin, amount, term, status, orig, type_: \
+		[ tkt, '40019', 44020.0 + i % 10, 44022.0 + i % 10, 'USD', 'B', isin, amount
+		, getBrokers()[i % len(getBrokers())], 1.2, 1000000.0 + i, term, 'Open'
+		, 2442000.0, 'RR', 3745.17, status, orig, type_]
+
+	return \
+	[ common(ticket, '', 2442.0, 44148.0, 'Active', 0.0, 'MRC')
+	, common(ticket + 1, 'XS{0:010d}'.format(i % 500), '3M', 'OPEN', 'Active', 0.0, 'RT')
+	] if i % 2 == 0 else \
+	[ common(ticket, '', 2442.0, 44148.0, 'Closed', ticket - 1, 'KMR')
+	, common(ticket + 1, 'XS{0:010d}'.format(i % 500), '3M', 'OPEN', 'Closed', 0.0, 'CR')
+	]
+
+
+
+def generateTradeFile(file, rows):
+	"""
+	[String] file, [Int] rows => [String] file, [Int] rows written
+	"""
+	return writeXlsx( file, 'TRADES FOR 40019', getTradeHeaders()
+					, map(tradeRow, range(rows))), rows
+
+
+
+def generateFXFile(file, rows):
+	"""
+	[String] file, [Int] rows => [String] file, [Int] rows written
+	"""
+	return writeXlsx( file, 'FX TRADES FOR 40019', getFXHeaders()
+					, map(fxRow, range(rows))), rows
+
+
+
+"""
+	[Int] rows => [Int] rows of a generated repo file, a whole number of
+		repo trades of two tickets each
+"""
+getRepoRows = lambda rows: rows // 2 * 2
+
+
+
+def generateRepoFile(file, rows):
+	"""
+	[String] file, [Int] rows => [String] file, [Int] rows written
+
+	Rows are tickets, two tickets make one repo trade.
+	"""
+	def tickets():
+		for i in range(getRepoRows(rows) // 2):
+			yield from repoRows(i)
+
+	return writeXlsx( file, 'REPO Trades FOR 40019', getRepoHeaders(), tickets()) \
+		 , getRepoRows(rows)
+
+
+
+"""
+	[Int] rows => [Int] bonds of a generated valuation report
+
+	A bond takes two rows and an xls sheet has at most 65536 rows, so the
+	number of bonds is capped.
+"""
+getValuationRows = lambda rows: min(rows, (65536 - 200) // 2)
+
+
+
+def generateValuationFile(file, rows):
+	"""
+	[String] file, [Int] rows => [String] file, [Int] bonds written
+
+	Copy the sample valuation report, replace its bond positions with the
+	given number of synthetic bonds, see getValuationRows().
+	"""
+	import xlrd, xlwt
+
+	if rows > getValuationRows(rows):
+		logger.warning('generateValuationFile(): {0} bonds capped to {1}'.format(
+						rows, getValuationRows(rows)))
+		rows = getValuationRows(rows)
+
+	sheet = xlrd.open_workbook(
+		join(getCurrentDir(), 'samples', 'sample 2021-01-12.xls')).sheet_by_index(0)
+	lines = list(map(sheet.row_values, range(sheet.nrows)))
+	start = next(filter(lambda i: lines[i][0] == 'Bond', range(len(lines))))
+	end = next(filter(lambda i: lines[i][11] == ' SUBTOTAL ', range(start, len(lines))))
+
+	bond = lambda i: \
+		[ [ 'SYNTHETIC BOND {0} 3% S/A 15NOV2025'.format(i)
+		  , 'XS{0:010d}        '.format(i), 1000000.0 + i, 'USD', 100.5
+		  , 1005000.0, 1005000.0, '', 100.4, '', 1004000.0, '', 1004000.0]
+		, ['', '', '07/11/2019', '3.0000%', '15/11/2025']
+		]
+
+	subtotal = lines[end-1:end+1]
+	subtotal[0][6], subtotal[0][12], subtotal[1][12] = \
+		1005000.0 * rows, 1004000.0 * rows, 1004000.0 * rows
+
+	wb = xlwt.Workbook()
+	ws = wb.add_sheet('Report')
+	out = lines[0:start+5] \
+		+ [line for i in range(rows) for line in bond(i)] \
+		+ subtotal + lines[end+1:]
+	for r, line in enumerate(out):
+		for c, value in enumerate(line):
+			ws.write(r, c, value)
+
+	wb.save(file)
+	return file, rows
+
+
+
+def getPeakRss():
+	"""
+	=> [Int] peak resident memory of this process in KB, None if unknown
+	"""
+	try:
+		import resource
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	except ImportError:
+		return None
+
+
+
+def timeStages(stages):
+	"""
+	[List] ([String] stage name, [Function] value => value)
+		=> [Dictionary] stage name -> seconds
+
+	Run the stages one after another, each takes the output of the previous.
+	"""
+	times = {}
+	value = None
+	for name, func in stages:
+		start = perf_counter()
+		value = func(value)
+		times[name] = perf_counter() - start
+
+	return times
+
+
+
+def getStages(converter, inputFile, outputDir):
+	"""
+	[String] converter, [String] input file, [String] output directory
+		=> [List] ([String] stage name, [Function] value => value)
+	"""
+	from boci_trustee.main import output, getCsvHeaders
+	from steven_utils.excel import fileToLines
+
+	outputFile = join(outputDir, converter + '.csv')
+	read = lambda _: list(fileToLines(inputFile))
+	write = lambda records: output( records
+								  , getCsvHeaders('trade' if converter == 'tradeBatch' else converter)
+								  , outputFile)
+
+	if converter == 'trade':
+		from boci_trustee.trade import getBociTrades
+		return [ ('read', read), ('convert', lambda L: getBociTrades(L)[0])
+			   , ('write', write)]
+
+	elif converter == 'tradeBatch':
+		from boci_trustee.trade import getBociTradesBatch
+		return [ ('read', read), ('convert', lambda L: getBociTradesBatch(L)[0])
+			   , ('write', write)]
+
+	elif converter == 'fx':
+		from boci_trustee.fx import getFXTradesBatch
+		return [ ('read', read), ('convert', getFXTradesBatch)
+			   , ('write', write)]
+
+	elif converter == 'repo':
+		from boci_trustee.OLD_repo import getRepoTrades
+		return [ ('read', read), ('convert', lambda L: list(getRepoTrades(L)))
+			   , ('write', write)]
+
+	else:
+		from boci_trustee.position import getValuationDataFromFile \
+										, createCashReconFile, createPositionReconFile
+		return \
+		[ ('read', lambda _: getValuationDataFromFile(inputFile))
+		, ('write', lambda data: \
+			( createCashReconFile(outputDir, 'benchmark', data[0], data[4])
+			, createPositionReconFile(outputDir, 'benchmark', data[0], data[3])))
+		]
+
+
+
+def runCase(converter, inputFile, rows, outputDir):
+	"""
+	[String] converter, [String] input file,
+	[Int] rows in the input file, [String] output directory
+		=> [Dictionary] result
+
+	Meant to run in a fresh process, so the peak memory is of this case only.
+	"""
+	times = timeStages(getStages(converter, inputFile, outputDir))
+	total = sum(times.values())
+	return \
+	{ 'converter': converter
+	, 'rows': rows
+	, 'stages': times
+	, 'seconds': total
+	, 'rowsPerSecond': rows / total if total > 0 else None
+	, 'peakRssKB': getPeakRss()
+	}
+
+
+
+"""
+	[String] converter => ( [Function] generator, [String] input file name
+						  , [Function] rows asked for => rows the generator writes)
+"""
+getGenerator = lambda converter: \
+	{ 'trade': (generateTradeFile, 'TD_benchmark.xlsx', lambda rows: rows)
+	, 'tradeBatch': (generateTradeFile, 'TD_benchmark.xlsx', lambda rows: rows)
+	, 'fx': (generateFXFile, 'FX_benchmark.xlsx', lambda rows: rows)
+	, 'repo': (generateRepoFile, 'REPO_benchmark.xlsx', getRepoRows)
+	, 'valuation': (generateValuationFile, 'valuation benchmark.xls', getValuationRows)
+	}[converter]
+
+
+
+def benchmark(converters, sizes, workDir):
+	"""
+	[List] converters, [List] sizes, [String] work directory
+		=> [List] ([Dictionary] result)
+
+	Input files are generated into the work directory, and reused if
+	already there. Rows per second are of the rows actually in the input
+	file, which can be fewer than the size asked for.
+	"""
+	context = multiprocessing.get_context('spawn')
+	results = []
+	for converter in converters:
+		for rows in sizes:
+			generator, name, getRows = getGenerator(converter)
+			inputFile = join(workDir, '{0}_{1}'.format(rows, name))
+			if exists(inputFile):
+				rowsWritten = getRows(rows)
+			else:
+				logger.info('benchmark(): generate {0}'.format(inputFile))
+				_, rowsWritten = generator(inputFile, rows)
+
+			with context.Pool(1) as pool:
+				results.append(pool.apply(runCase, (converter, inputFile, rowsWritten, workDir)))
+
+			logger.info('benchmark(): {0}'.format(results[-1]))
+
+	return results
+
+
+
+def saveResults(file, results):
+	"""
+	[String] file, [List] results => [String] file
+
+	Append one json line per result, tagged with the time of run and
+	the platform.
+	"""
+	run = { 'time': datetime.now().isoformat(timespec='seconds')
+		  , 'python': platform.python_version()
+		  , 'platform': platform.platform()
+		  }
+	with open(file, 'a') as f:
+		for result in results:
+			f.write(json.dumps(dict(run, **result)) + '\n')
+
+	return file
+
+
+
+
+if __name__ == '__main__':
+	import argparse
+	parser = argparse.ArgumentParser(description='Benchmark BOCI trustee converters')
+	parser.add_argument( '--converters', nargs='+'
+					   , default=['trade', 'tradeBatch', 'fx', 'repo', 'valuation']
+					   , choices=['trade', 'tradeBatch', 'fx', 'repo', 'valuation'])
+	parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 100000, 1000000])
+	parser.add_argument('--output', default='benchmark.jsonl')
+	parser.add_argument('--workdir', default=None, help='where to keep generated files')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.INFO)
+
+	if args.workdir is None:
+		with TemporaryDirectory() as workDir:
+			results = benchmark(args.converters, args.sizes, workDir)
+	else:
+		os.makedirs(args.workdir, exist_ok=True)
+		results = benchmark(args.converters, args.sizes, args.workdir)
+
+	for r in results:
+		print('{0:10} {1:>9} rows {2:>10.1f} rows/s {3} KB  {4}'.format(
+			r['converter'], r['rows'], r['rowsPerSecond'] or 0, r['peakRssKB']
+		  , ' '.join(map(lambda t: '{0}={1:.3f}s'.format(*t), r['stages'].items()))))
+
+	saveResults(args.output, results)
@@ -0,0 +1,302 @@
+# coding=utf-8
+#
+# Columnar copies of the output files, for analytics.
+#
+# When a columnar format (parquet or arrow) is configured, the records
+# written to a csv file are also collected, in the same pass, into an Arrow
+# table with typed columns: dates as date32, amounts as float64 and the
+# rest as strings, an empty value becomes null. Rows are flushed to the
+# columnar file in batches, which is renamed into place only when the csv
+# file is complete. pyarrow is needed only when a format is configured.
+#
+# The columnar file is a secondary output: a value that cannot be converted
+# becomes null with a warning, and any other failure in writing it is logged
+# and drops the columnar file, the csv file is written all the same.
+#
+from boci_trustee.utility import getColumnarFormat, getColumnarDirectory
+from boci_trustee.writer import getValuesFunction, replaceFile
+from contextlib import contextmanager
+from datetime import date
+from functools import lru_cache
+from tempfile import mkstemp
+from os.path import dirname, basename, splitext, join, exists
+from os import makedirs
+import os
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+"""
+	=> [Dictionary] column name -> [String] type ('date' or 'float'), other
+		columns are strings
+
+	Covers the columns of boci trade, fx, repo and recon files.
+"""
+getColumnTypes = lambda: \
+	{ 'TradeDate': 'date', 'SettlementDate': 'date'
+	, 'Quantity': 'float', 'Price': 'float', 'AccurredInterest': 'float'
+	, 'SettlementAmount': 'float', 'Commission': 'float', 'StampDuty': 'float'
+	, 'TransactionLevy': 'float', 'ClearingFee': 'float', 'SalesTax': 'float'
+	, 'HongKongCCASSFee': 'float'
+
+	, 'Trade Date': 'date', 'Settlement Date': 'date'
+	, 'Client Buy Amount': 'float', 'Client Sell Amount': 'float'
+	, 'Exchange Rate': 'float'
+
+	, 'Trade_date': 'date', 'Settle_date': 'date', 'Mature_date': 'date'
+	, 'Eff_date': 'date', 'Amount': 'float', 'Int_rate': 'float', 'Col_Qty': 'float'
+
+	, 'date': 'date', 'balance': 'float', 'quantity': 'float'
+	}
+
+
+
+@lru_cache(maxsize=4096)
+def toDate(s):
+	"""
+	[String] dd/mm/yyyy or yyyy-mm-dd, or empty => [date] date, None if empty
+	"""
+	if s == '' or s is None:
+		return None
+
+	L = s.split('/')
+	return date(int(L[2]), int(L[1]), int(L[0])) if len(L) == 3 else \
+			date(*map(int, s.split('-')))
+
+
+
+"""
+	[Float or String] x => [Float] x, None if empty
+"""
+toFloat = lambda x: \
+	None if x == '' or x is None else float(x)
+
+
+
+"""
+	[Object] x => [String] x, None if empty
+"""
+toText = lambda x: \
+	None if x == '' or x is None else str(x)
+
+
+
+"""
+	[String] type => [Function] value converter
+"""
+getConverter = lambda columnType: \
+	{'date': toDate, 'float': toFloat}.get(columnType, toText)
+
+
+
+"""
+	[String] format ('parquet' or 'arrow') => [String] file extension
+"""
+getExtension = lambda fmt: \
+	{'parquet': '.parquet', 'arrow': '.arrow'}[fmt]
+
+
+
+def getColumnarFile(outputFile, fmt, directory=''):
+	"""
+	[String] csv file, [String] format, [String] directory, empty for the
+		directory of the csv file
+		=> [String] columnar file
+	"""
+	return join( directory or dirname(outputFile)
+			   , splitext(basename(outputFile))[0] + getExtension(fmt))
+
+
+
+def getSchema(headers):
+	"""
+	[Iterable] headers => [Schema] Arrow schema
+	"""
+	import pyarrow as pa
+	types = getColumnTypes()
+	arrowType = lambda columnType: \
+		{'date': pa.date32(), 'float': pa.float64()}.get(columnType, pa.string())
+
+	return pa.schema(list(map(lambda h: (h, arrowType(types.get(h))), headers)))
+
+
+
+def openArrowWriter(file, schema, fmt):
+	"""
+	[String] file, [Schema] schema, [String] format => Arrow writer, with
+		write_table() and close()
+	"""
+	if fmt == 'parquet':
+		import pyarrow.parquet as pq
+		return pq.ParquetWriter(file, schema)
+	else:
+		import pyarrow as pa
+		return pa.ipc.new_file(file, schema)
+
+
+
+def isArrowAvailable():
+	"""
+	=> [Bool] whether pyarrow can be imported
+	"""
+	try:
+		import pyarrow
+		return True
+	except ImportError:
+		return False
+
+
+
+def tolerantConverter(header, converter, errors):
+	"""
+	[String] header,
+	[Function] value converter,
+	[Dictionary] header -> ([Int] count, [Object] first value) of values
+		that could not be converted
+		=> [Function] value converter, that gives None for a value it cannot
+			convert and counts it in errors
+	"""
+	def convert(value):
+		try:
+			return converter(value)
+		except Exception:
+			count, first = errors.get(header, (0, value))
+			errors[header] = (count + 1, first)
+			return None
+
+	return convert
+
+
+
+def discardColumnarFile(writer, tempFile):
+	"""
+	[Arrow writer] writer or None, [String] temporary file
+	"""
+	try:
+		if writer is not None:
+			writer.close()
+	except Exception:
+		pass
+	if exists(tempFile):
+		os.remove(tempFile)
+
+
+
+@contextmanager
+def columnarSink(file, headers, fmt, batchSize=65536):
+	"""
+	[String] columnar file, empty for none,
+	[List] headers,
+	[String] format ('parquet' or 'arrow'), empty for none,
+	[Int] number of rows per batch
+		=> [Function] ([Dictionary] record => [Dictionary] record)
+
+	The function collects the values of each record passed to it, and
+	returns the record as it is, so it can be mapped over the records on
+	their way to the csv writer. The columnar file appears when the block
+	exits without error. Without a file or format, or without pyarrow, the
+	function does nothing. If writing the columnar file fails, the function
+	does nothing from then on, the block goes on.
+	"""
+	passThrough = lambda record: record
+	if file == '' or fmt == '' or not isArrowAvailable():
+		if file != '' and fmt != '':
+			logger.warning('columnarSink(): pyarrow not available, {0} not written'.format(file))
+		yield passThrough
+		return
+
+	import pyarrow as pa
+	errors = {}
+	state = {'failed': False, 'writer': None}
+	tempFile = ''
+	try:
+		schema = getSchema(headers)
+		converters = list(map( lambda h: tolerantConverter( h, getConverter(getColumnTypes().get(h))
+														 , errors)
+							 , headers))
+		toValues = getValuesFunction(headers)
+		columns = list(map(lambda _: [], headers))
+
+		if dirname(file) != '':
+			makedirs(dirname(file), exist_ok=True)
+		fd, tempFile = mkstemp( dir=dirname(file) or '.'
+							  , prefix='.' + basename(file) + '.', suffix='.tmp')
+		os.close(fd)
+		state['writer'] = openArrowWriter(tempFile, schema, fmt)
+	except Exception:
+		logger.exception('columnarSink(): failed to open {0}'.format(file))
+		discardColumnarFile(state['writer'], tempFile)
+		state['failed'] = True
+
+	if state['failed']:
+		yield passThrough
+		return
+
+
+	def flush():
+		if len(columns) > 0 and len(columns[0]) > 0:
+			state['writer'].write_table(pa.Table.from_arrays(
+				list(map(lambda t: pa.array(t[0], type=t[1].type), zip(columns, schema)))
+			  , schema=schema))
+			for column in columns:
+				column.clear()
+
+
+	def fail():
+		logger.exception('columnarSink(): failed to write {0}'.format(file))
+		state['failed'] = True
+		discardColumnarFile(state['writer'], tempFile)
+
+
+	def sink(record):
+		if state['failed']:
+			return record
+
+		try:
+			for column, converter, value in zip(columns, converters, toValues(record)):
+				column.append(converter(value))
+
+			if len(columns) > 0 and len(columns[0]) >= batchSize:
+				flush()
+		except Exception:
+			fail()
+
+		return record
+
+
+	try:
+		yield sink
+	except:
+		logger.error('columnarSink(): {0} not written'.format(file))
+		if not state['failed']:
+			discardColumnarFile(state['writer'], tempFile)
+		raise
+
+	for header, (count, first) in errors.items():
+		logger.warning('columnarSink(): {0}: {1} values of {2} written as null, '
+					   'the first is {3!r}'.format(file, count, header, first))
+
+	if state['failed']:
+		return
+
+	try:
+		flush()
+		state['writer'].close()
+		replaceFile(tempFile, file)
+		logger.debug('columnarSink(): {0}'.format(file))
+	except Exception:
+		fail()
+
+
+
+def getColumnarSink(outputFile, headers):
+	"""
+	[String] csv file, [List] headers
+		=> columnarSink() of the csv file, in the configured format and
+			directory
+	"""
+	fmt = getColumnarFormat()
+	return columnarSink( '' if fmt == '' else \
+							getColumnarFile(outputFile, fmt, getColumnarDirectory())
+					   , headers, fmt)
@@ -0,0 +1,73 @@
+# coding=utf-8
+#
+# Convert the date formats found in Bloomberg THRP and AIM files to the
+# dd/mm/yyyy format used in BOCI-Prudential files.
+#
+# Results are memoised, because a file usually has only a handful of
+# distinct trade and settlement dates.
+#
+from steven_utils.excel import fromExcelOrdinal
+from functools import lru_cache
+from datetime import datetime
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+@lru_cache(maxsize=4096)
+def excelOrdinalToDateString(x):
+	"""
+	[Float] Excel ordinal => [String] dd/mm/yyyy
+	"""
+	return fromExcelOrdinal(x).strftime('%d/%m/%Y')
+
+
+
+@lru_cache(maxsize=4096)
+def shortDateToDateString(s):
+	"""
+	[String] dd/mm/yy => [String] dd/mm/yyyy
+	"""
+	return datetime.strptime(s, '%d/%m/%y').strftime('%d/%m/%Y')
+
+
+
+@lru_cache(maxsize=4096)
+def isoToDateString(s):
+	"""
+	[String] yyyy-mm-ddTHH:MM:SS => [String] dd/mm/yyyy
+	"""
+	L = s.split('T')[0].split('-')
+	return L[2] + '/' + L[1] + '/' + L[0]
+
+
+
+def bloombergToDateString(x):
+	"""
+	[String or Float] date from Bloomberg THRP file => [String] dd/mm/yyyy
+
+	Bloomberg gives a date either as an Excel ordinal or as a string
+	in dd/mm/yy format.
+	"""
+	return shortDateToDateString(x) if isinstance(x, str) else \
+			excelOrdinalToDateString(x)
+
+
+
+def toDateStrings(values, codec=excelOrdinalToDateString):
+	"""
+	[Iterable] values, [Function] codec => [List] ([String] dd/mm/yyyy)
+
+	Convert a whole column of dates with the codec.
+	"""
+	return list(map(codec, values))
+
+
+
+def clearDateCache():
+	"""
+	Clear the memoised results of all codecs.
+	"""
+	excelOrdinalToDateString.cache_clear()
+	shortDateToDateString.cache_clear()
+	isoToDateString.cache_clear()
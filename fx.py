@@ -3,76 +3,122 @@
 # Converts Bloomberg THRP FX trade file to BOCI-Prudential fx trade file 
 # format.
 # 
-from boci_trustee.trade import toDateTimeString as toDateTimeStringFromFloat \
-							, convert, toStringIfFloat
-from toolz.functoolz import compose
-from functools import partial
-from datetime import datetime
+from boci_trustee.trade import convertRows, toStringIfFloat, pausedGC
+from boci_trustee.datecodec import bloombergToDateString
+from boci_trustee.mapping import field, derived, getSources, getHeaders \
+								, makeMappingRecordType, compileMapper
 import logging
 logger = logging.getLogger(__name__)
 
 
 
-toDateTimeString = lambda x: \
-	datetime.strptime(x, '%d/%m/%y').strftime('%d/%m/%Y') \
-	if isinstance(x, str) else toDateTimeStringFromFloat(x)
+# [String or Float] dd/mm/yy or Excel ordinal => [String] dd/mm/yyyy
+toDateTimeString = bloombergToDateString
+
+
+
+def getCurrencies(shortName, buySell):
+	"""
+	[String] short name, like 'USD/HKD 01/13/21', [String] buy or sell
+		=> ([String] buy currency, [String] sell currency)
+	"""
+	first, second = shortName.split()[0].split('/')
+	return (first, second) if buySell == 'B' else (second, first)
+
+
+
+"""
+	[String] buy currency, [String] trade currency, [Float] amount, [Float] price
+		=> ([Float] buy amount, [Float] sell amount)
+"""
+getAmounts = lambda buyCurrency, currency, amount, price: \
+	(amount, amount*price) if buyCurrency == currency else \
+	(amount*price, amount)
+
+
+
+"""
+	=> [Tuple] mapping from a Bloomberg fx ticket to a BOCI Prudential fx
+		record, see mapping.py
+"""
+getFXMapping = lambda: \
+	( derived( ('buyCurrency', 'sellCurrency'), getCurrencies, ('Shrt Name', 'B/S')
+			 , table=True)
+	, derived( ('buyAmount', 'sellAmount'), getAmounts
+			 , ('buyCurrency', 'Crcy', 'Amount Pennies', 'Price'))
+	, field('Portfolio Code', 'Fund')
+	, field('Settlement Account')
+	, field('FXS Contract No.', 'Tkt #', toStringIfFloat)
+	, field('Spot Deal Ref No.')
+	, field('Trade Date', 'As of Dt', toDateTimeString, table=True)
+	, field('Settlement Date', 'Stl Date', toDateTimeString, table=True)
+	, field('Transaction Type', 'FX Trade Deal Type')
+	, field('Exchange Code')
+	, field('Client Buy Currency', 'buyCurrency')
+	, field('Client Buy Amount', 'buyAmount')
+	, field('Client Sell Currency', 'sellCurrency')
+	, field('Client Sell Amount', 'sellAmount')
+	, field('Exchange Rate')
+	, field('Source Application ID')
+	, field('Broker Code')
+	, field('Class Code')
+	)
+
+
+
+"""
+	=> [Tuple] fields of a Bloomberg fx ticket used by ticketToTrade(), in
+		the order of arguments of toFXRecord()
+"""
+getBlpFXFields = lambda: getSources(getFXMapping())
 
 
 
 def ticketToTrade(ticket):
 	"""
 	[Dictionary] FX trade ticket (Bloomberg)
-		=> [Dictionary] BOCI Prudential fx record
+		=> [FXRecord] BOCI Prudential fx record
+	"""
+	return toFXRecord(*map(ticket.__getitem__, getBlpFXFields()))
+
+
+
+# [Iterable] lines => [Iterable] ([FXRecord] fx record), rows read by position
+getFXTrades = lambda lines: convertRows(toFXRecord, getBlpFXFields(), lines)
+
+
+
+def getFXTradesBatch(lines):
 	"""
-	getBuySellCurrency = lambda ticket: \
-	compose(
-		lambda L: (L[0], L[1]) if ticket['B/S'] == 'B' else (L[1], L[0])
-	  , lambda name: name.split()[0].split('/')
-	)(ticket['Shrt Name'])
-
-	
-	getBuySellAmount = lambda ticket: \
-	compose(
-		lambda t: \
-			(ticket['Amount Pennies'], ticket['Amount Pennies']*ticket['Price']) \
-			if t[0] == ticket['Crcy'] else \
-			(ticket['Amount Pennies']*ticket['Price'], ticket['Amount Pennies'])
-			
-	  , getBuySellCurrency
-	)(ticket)
-
-
-	t = {}
-	t['Portfolio Code'] = ticket['Fund']
-	t['Settlement Account'] = ''
-	t['FXS Contract No.'] = toStringIfFloat(ticket['Tkt #'])
-	t['Spot Deal Ref No.'] = ''
-	t['Trade Date'] = toDateTimeString(ticket['As of Dt'])
-	t['Settlement Date'] = toDateTimeString(ticket['Stl Date'])
-	t['Transaction Type'] = ticket['FX Trade Deal Type']
-	t['Exchange Code'] = ''
-	t['Client Buy Currency'], t['Client Sell Currency'] = \
-		getBuySellCurrency(ticket)
-	t['Client Buy Amount'], t['Client Sell Amount'] = \
-		getBuySellAmount(ticket)
-
-	t['Exchange Rate'] = ''
-	t['Source Application ID'] = ''
-	t['Broker Code'] = ''
-	t['Class Code'] = ''
-
-	return t
-
-
-
-# [Iterable] lines => [Iterable] ([Dictionary] fx record)
-getFXTrades = partial(convert, ticketToTrade)
-
-
-
-getFXCsvHeaders = lambda : \
-	( 'Portfolio Code', 'Settlement Account', 'FXS Contract No.', 'Spot Deal Ref No.'
-	, 'Trade Date', 'Settlement Date', 'Transaction Type', 'Exchange Code'
-	, 'Client Buy Currency', 'Client Buy Amount', 'Client Sell Currency', 'Client Sell Amount'
-	, 'Exchange Rate', 'Source Application ID', 'Broker Code', 'Class Code'
-	)
\ No newline at end of file
+	[Iterable] lines => [List] ([FXRecord] fx record)
+
+	Same result as getFXTrades(), for large files. The mapping is compiled
+	for the file with its tables, so the currency legs of each distinct
+	(short name, buy or sell) and each distinct date are worked out once per
+	file. The cyclic garbage collector is paused while converting, the
+	records hold no cycles and would only be scanned over and over as they
+	pile up.
+	"""
+	toRecord = compileMapper( 'toFXRecordBatch', getBlpFXFields(), getFXMapping()
+							, FXRecord, tables=True)
+	with pausedGC():
+		return list(convertRows(toRecord, getBlpFXFields(), lines))
+
+
+
+getFXCsvHeaders = lambda : tuple(getHeaders(getFXMapping()))
+
+
+
+FXRecord = makeMappingRecordType('FXRecord', getFXMapping(), __name__)
+
+
+
+"""
+	Values of the Bloomberg fx ticket fields in getBlpFXFields()
+		=> [FXRecord] BOCI Prudential fx record
+
+	Same as ticketToTrade(), taking the fields by position.
+"""
+toFXRecord = compileMapper( 'toFXRecord', getBlpFXFields(), getFXMapping()
+						  , FXRecord, module=__name__)
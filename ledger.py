@@ -0,0 +1,243 @@
+# coding=utf-8
+#
+# A processing ledger in a SQLite file, keyed by the content hash of input
+# files, so that a file already converted is not converted (or notified)
+# again.
+#
+# Each input file goes through the stages: converted (output file written),
+# notified (email sent) and archived (moved to the processed folder). A
+# failed conversion is recorded as failed, and tried again next time, its
+# notification is recorded too, so the same failure is not notified twice.
+# If a run stops half way, say after the output file is written but before
+# the notification, the next run picks up from the stage after the last one
+# recorded. The hash of the output file is kept, so a conversion is skipped
+# only if its output file is still the one it wrote. The ticket numbers
+# written to the output file are kept with the entry, so a file that is not
+# converted again still takes part in the check for tickets in more than
+# one file.
+#
+from hashlib import sha256
+from datetime import datetime
+from threading import Lock
+from os import stat, makedirs
+from os.path import dirname
+import sqlite3, json
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+"""
+	Stages of an input file, in order.
+"""
+STAGES = ('failed', 'converted', 'notified', 'archived')
+
+_connections = {}
+_hashes = {}
+_lock = Lock()
+
+
+
+def openLedger(file):
+	"""
+	[String] database file => [Connection] sqlite connection
+
+	Create the ledger table if it does not exist.
+	"""
+	logger.debug('openLedger(): {0}'.format(file))
+
+	if dirname(file) != '':
+		makedirs(dirname(file), exist_ok=True)
+
+	conn = sqlite3.connect(file, timeout=30, check_same_thread=False)
+	conn.execute(
+		'CREATE TABLE IF NOT EXISTS ledger ( '
+		'hash TEXT PRIMARY KEY, '
+		'file TEXT NOT NULL, '
+		'fileType TEXT NOT NULL, '
+		'stage TEXT NOT NULL, '
+		'status INTEGER, '
+		'message TEXT, '
+		'outputFile TEXT, '
+		'seconds REAL, '
+		'updated TEXT NOT NULL)')
+	addColumns( conn
+			  , [('tickets', 'TEXT'), ('outputHash', 'TEXT'), ('notified', 'INTEGER')])
+	conn.commit()
+	return conn
+
+
+
+def addColumns(conn, columns):
+	"""
+	[Connection] sqlite connection,
+	[List] ([String] column name, [String] column type)
+
+	Add the columns that the ledger table does not have yet, i.e., a ledger
+	created by an earlier version.
+	"""
+	existing = set(map(lambda row: row[1], conn.execute('PRAGMA table_info(ledger)')))
+	for name, columnType in filter(lambda t: not t[0] in existing, columns):
+		logger.info('addColumns(): {0}'.format(name))
+		conn.execute('ALTER TABLE ledger ADD COLUMN {0} {1}'.format(name, columnType))
+
+
+
+def getLedger(file):
+	"""
+	[String] database file => [Connection] sqlite connection
+
+	One connection per database file per process.
+	"""
+	with _lock:
+		if not file in _connections:
+			_connections[file] = openLedger(file)
+
+		return _connections[file]
+
+
+
+def closeLedgers():
+	with _lock:
+		for conn in _connections.values():
+			conn.close()
+
+		_connections.clear()
+
+
+
+def getContentHash(file):
+	"""
+	[String] file => [String] sha256 of the file content in hex
+
+	The hash is kept as long as the modification time and size of the file
+	do not change, so hashing a file more than once in a run is free.
+	"""
+	s = stat(file)
+	stamp = (s.st_mtime_ns, s.st_size)
+	with _lock:
+		entry = _hashes.get(file)
+		if entry is not None and entry[0] == stamp:
+			return entry[1]
+
+	h = sha256()
+	with open(file, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024*1024), b''):
+			h.update(chunk)
+
+	with _lock:
+		_hashes[file] = (stamp, h.hexdigest())
+
+	return h.hexdigest()
+
+
+
+def getEntry(conn, hash):
+	"""
+	[Connection] sqlite connection, [String] content hash
+		=> [Dictionary] ledger entry, or None if not found
+
+	The tickets of the entry is a list of ticket numbers, or None if they
+	were not recorded.
+	"""
+	with _lock:
+		cursor = conn.execute(
+			'SELECT hash, file, fileType, stage, status, message, outputFile, '
+			'seconds, updated, tickets, outputHash, notified FROM ledger '
+			'WHERE hash = ?', (hash, ))
+		row = cursor.fetchone()
+
+	if row is None:
+		return None
+
+	entry = dict(zip(map(lambda d: d[0], cursor.description), row))
+	entry['tickets'] = None if entry['tickets'] is None else json.loads(entry['tickets'])
+	return entry
+
+
+
+"""
+	[Dictionary] ledger entry or None, [String] stage => [Bool] stage or a
+		later stage has been recorded
+"""
+isStageDone = lambda entry, stage: \
+	entry is not None and STAGES.index(entry['stage']) >= STAGES.index(stage)
+
+
+
+"""
+	[Dictionary] ledger entry or None => [Bool] the result of the conversion,
+		failed or not, has been notified
+"""
+isNotified = lambda entry: \
+	entry is not None and (entry['notified'] == 1 or isStageDone(entry, 'notified'))
+
+
+
+def recordConversion( conn, hash, file, fileType, status, message, outputFile, seconds
+					, tickets=None, outputHash=None):
+	"""
+	[Connection] sqlite connection,
+	[String] content hash,
+	[String] input file,
+	[String] file type,
+	[Int] status code,
+	[String] message,
+	[String] output file,
+	[Float] seconds taken to convert,
+	[Iterable] ticket numbers written to the output file, None if unknown,
+	[String] content hash of the output file, None if there is none
+
+	Record the result of converting a file, stage is 'failed' if the status
+	code is -1, 'converted' otherwise. If the file was notified of the same
+	result before, it stays notified.
+	"""
+	previous = getEntry(conn, hash)
+	notified = 1 if isNotified(previous) and \
+					(previous['status'], previous['message']) == (status, message) \
+				else 0
+
+	with _lock, conn:
+		conn.execute(
+			'INSERT OR REPLACE INTO ledger (hash, file, fileType, stage, status, '
+			'message, outputFile, seconds, updated, tickets, outputHash, notified) '
+			'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+		  , ( hash, file, fileType, 'failed' if status == -1 else 'converted'
+		  	, status, message, outputFile, seconds
+		  	, datetime.now().isoformat(timespec='seconds')
+		  	, None if tickets is None else json.dumps(sorted(tickets))
+		  	, outputHash, notified))
+
+
+
+def recordStage(conn, hash, stage):
+	"""
+	[Connection] sqlite connection, [String] content hash, [String] stage
+		=> [Bool] the stage is recorded
+
+	Move a converted file to a later stage, or mark a failed file as
+	notified. Nothing is recorded if the file is not in the ledger, or is
+	at that stage already.
+	"""
+	entry = getEntry(conn, hash)
+	if entry is None or (stage == 'notified' and isNotified(entry)):
+		return False
+
+	if stage == 'notified' and not isStageDone(entry, 'converted'):
+		with _lock, conn:
+			conn.execute(
+				'UPDATE ledger SET notified = 1, updated = ? WHERE hash = ?'
+			  , (datetime.now().isoformat(timespec='seconds'), hash))
+
+		return True
+
+	if not isStageDone(entry, 'converted') or isStageDone(entry, stage):
+		return False
+
+	with _lock, conn:
+		conn.execute(
+			'UPDATE ledger SET stage = ?, notified = ?, updated = ? WHERE hash = ?'
+		  , ( stage, 1 if isNotified(entry) or stage == 'notified' else 0
+		  	, datetime.now().isoformat(timespec='seconds'), hash))
+
+	return True
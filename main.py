@@ -5,26 +5,42 @@
 # 
 from boci_trustee.utility import getInputDirectory, getOutputDirectory\
 						, getMailSender, getMailRecipients, getMailServer\
-						, getMailTimeout, getCurrentDir
-from boci_trustee.trade import getBociTrades, getTradeCsvHeaders
+						, getMailTimeout, getCurrentDir, getStreamingInput\
+						, getWorkers, getExecutorType, getBatchMode\
+						, getTimingFile, getCsvBufferSize, getRepoMaxGroups\
+						, getLedgerFile
+from boci_trustee.trade import convertTrades, convertTradesBatch, checkMultipleSSI \
+						, getTradeWithMultipleSSI \
+						, getTradeCsvHeaders, duplidateItems
 from boci_trustee.OLD_repo import getRepoTrades, getRepoCsvHeaders
-from boci_trustee.fx import getFXTrades, getFXCsvHeaders
+from boci_trustee.fx import getFXTrades, getFXTradesBatch, getFXCsvHeaders
+from boci_trustee.reader import fileToLinesStreaming
+from boci_trustee.snapshot import getSnapshotFiles, snapshotRun
+from boci_trustee.writer import writeCsvAtomic
+from boci_trustee.columnar import getColumnarSink
+from boci_trustee.parsecache import readLines, readValue
+from boci_trustee.timing import timeStage, timeIterable, withTimingRecords \
+						, addRecords, saveRunSummary
+from boci_trustee.ledger import getLedger, getContentHash, getEntry, isStageDone \
+						, isNotified, recordConversion, recordStage
 from toolz.functoolz import compose
 from functools import partial
-from steven_utils.file import getFiles
+from itertools import chain
 from steven_utils.mail import sendMail
-from steven_utils.utility import writeCsv
 from steven_utils.excel import fileToLines
-from os.path import join
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from os.path import join, exists
+from time import perf_counter
 import shutil
 import logging
 logger = logging.getLogger(__name__)
 
 
 
-def processFX(inputFile, inputDir, outputDir):
+def processFX(inputFile, inputDir, outputDir, tickets=None):
 	"""
-	[String] inputFile, [String] inputDir, [String] outputDir
+	[String] inputFile, [String] inputDir, [String] outputDir,
+	[Set] to collect the ticket numbers written, or None
 		=> [int] status code, [String] message
 
 	Side effect: produce an output csv file in the output directory;
@@ -34,9 +50,21 @@ def processFX(inputFile, inputDir, outputDir):
 	logger.debug('processFX(): {0}'.format(inputDir))
 
 	try:
-		outputFile = output( getFXTrades(fileToLines(join(inputDir, inputFile)))
-						   , getFXCsvHeaders()
-						   , join(outputDir, changeFileExtension(inputFile)))
+		if getStreamingInput():
+			trades = timeIterable( inputFile, 'convert'
+								 , getFXTrades(readInput(inputDir, inputFile))
+								 , 'read')
+		else:
+			lines = readInput(inputDir, inputFile)
+			with timeStage(inputFile, 'convert') as record:
+				trades = getFXTradesBatch(lines)
+				record['rows'] = len(trades)
+
+		outputFile = timedOutput( inputFile
+								, collectTickets('fx', tickets, trades)
+								, getFXCsvHeaders()
+								, join(outputDir, changeFileExtension(inputFile))
+								, 'convert' if getStreamingInput() else None)
 
 		return (0, 'output fx file: ' + outputFile)
 
@@ -46,9 +74,10 @@ def processFX(inputFile, inputDir, outputDir):
 
 
 
-def processTrade(inputFile, inputDir, outputDir):
+def processTrade(inputFile, inputDir, outputDir, tickets=None):
 	"""
-	[String] inputFile, [String] inputDir, [String] outputDir
+	[String] inputFile, [String] inputDir, [String] outputDir,
+	[Set] to collect the ticket numbers written, or None
 		=> [int] status code, [String] message
 
 	Side effect: produce an output csv file in the output directory;
@@ -58,12 +87,26 @@ def processTrade(inputFile, inputDir, outputDir):
 	logger.debug('processTrade(): {0}'.format(inputFile))
 
 	try:
-		trades, tradesWithMultipleSSI = \
-			getBociTrades(fileToLines(join(inputDir, inputFile)))
-
-		outputFile = output( trades
-						   , getTradeCsvHeaders()
-						   , join(outputDir, changeFileExtension(inputFile)))
+		if getStreamingInput():
+			trades, tradesWithMultipleSSI = checkMultipleSSI(
+				timeIterable( inputFile, 'convert'
+							, convertTrades(readInput(inputDir, inputFile)), 'read'))
+			trades = timeIterable(inputFile, 'ssi', trades, 'convert')
+		else:
+			lines = readInput(inputDir, inputFile)
+			with timeStage(inputFile, 'convert') as record:
+				trades = convertTradesBatch(lines)
+				record['rows'] = len(trades)
+
+			with timeStage(inputFile, 'ssi') as record:
+				tradesWithMultipleSSI = getTradeWithMultipleSSI(trades)
+				record['rows'] = len(trades)
+
+		outputFile = timedOutput( inputFile
+								, collectTickets('trade', tickets, trades)
+								, getTradeCsvHeaders()
+								, join(outputDir, changeFileExtension(inputFile))
+								, 'ssi' if getStreamingInput() else None)
 
 		return \
 		(0, 'output trade file: ' + outputFile) \
@@ -79,9 +122,10 @@ def processTrade(inputFile, inputDir, outputDir):
 
 
 
-def processRepo(inputFile, inputDir, outputDir):
+def processRepo(inputFile, inputDir, outputDir, tickets=None):
 	"""
-	[String] inputFile, [String] inputDir, [String] outputDir
+	[String] inputFile, [String] inputDir, [String] outputDir,
+	[Set] to collect the ticket numbers written, or None
 		=> [int] status code, [String] message
 
 	Side effect: produce an output csv file in the output directory;
@@ -91,9 +135,16 @@ def processRepo(inputFile, inputDir, outputDir):
 	logger.debug('processRepo(): {0}'.format(inputDir))
 
 	try:
-		outputFile = output( getRepoTrades(fileToLines(join(inputDir, inputFile)))
-						   , getRepoCsvHeaders()
-						   , join(outputDir, changeFileExtension(inputFile)))
+		outputFile = timedOutput( inputFile
+								, collectTickets( 'repo', tickets
+												, timeIterable( inputFile, 'convert'
+															  , lazily( getRepoTrades
+															  		  , readInput(inputDir, inputFile)
+															  		  , getRepoMaxGroups())
+															  , getReadStage()))
+								, getRepoCsvHeaders()
+								, join(outputDir, changeFileExtension(inputFile))
+								, 'convert')
 
 		return (0, 'output repo file: ' + outputFile)
 
@@ -103,6 +154,65 @@ def processRepo(inputFile, inputDir, outputDir):
 
 
 
+"""
+	=> [String] the stage that runs inside convert, i.e., read in streaming
+		mode, None otherwise
+"""
+getReadStage = lambda: 'read' if getStreamingInput() else None
+
+
+
+def readInput(inputDir, inputFile):
+	"""
+	[String] inputDir, [String] inputFile => [Iterable] lines
+
+	In streaming mode, lines are read one at a time from the workbook
+	in read only mode, otherwise the whole sheet is loaded into a list, so
+	that parsing is timed in the read stage and not in the stage that uses
+	the lines. Lines of a file parsed before come from the parse cache, if
+	configured. Reading is timed as the read stage of the input file.
+	"""
+	if getStreamingInput():
+		return timeIterable( inputFile, 'read'
+						   , readLines( 'fileToLinesStreaming', fileToLinesStreaming
+						   			  , join(inputDir, inputFile)))
+
+	with timeStage(inputFile, 'read') as record:
+		lines = list(readValue('fileToLines', fileToLines, join(inputDir, inputFile)))
+		record['rows'] = len(lines)
+
+	return lines
+
+
+
+def lazily(func, *args):
+	"""
+	[Function] func, arguments => [Iterator] items of func(*args)
+
+	Call func only when the first item is requested, so that any eager work
+	in func (like grouping repo tickets) is timed in the stage that consumes
+	the items.
+	"""
+	yield from func(*args)
+
+
+
+def timedOutput(inputFile, items, headers, outputFile, inner):
+	"""
+	[String] inputFile, [Iterator] items, [List] headers, [String] outputFile
+	[String] inner stage, the stage that produces items lazily, or None
+		=> [String] outputFile
+
+	Same as output(), timed as the write stage of the input file.
+	"""
+	with timeStage(inputFile, 'write', inner) as record:
+		if hasattr(items, '__len__'):
+			record['rows'] = len(items)
+
+		return output(items, headers, outputFile)
+
+
+
 def sendNotification(fileType, statusCode, message):
 	"""
 	[String] fileType
@@ -118,8 +228,9 @@ def sendNotification(fileType, statusCode, message):
 				if statusCode == 1 else \
 				'Error: 60001 {0} file conversion'.format(fileType)
 
-	sendMail( message, subject, getMailSender(), getMailRecipients()\
-			, getMailServer(), getMailTimeout())
+	with timeStage(fileType, 'notify'):
+		sendMail( message, subject, getMailSender(), getMailRecipients()\
+				, getMailServer(), getMailTimeout())
 
 	# print('send mail: {0}\n{1}'.format(subject, message)) # for debugging only
 	return 0
@@ -141,20 +252,11 @@ def changeFileExtension(filename):
 	[String] file type
 		=> [String] input file
 	
-	Search for the input file based on file type.
+	Search for the input file based on file type, from the snapshot of
+	the input directory.
 """
 getInputFiles = lambda inputDir, fileType: \
-compose(
-	list
-
-  , partial(filter, lambda f: f.startswith('TD') and f.endswith('.xlsx')) \
-	if fileType == 'trade' else \
-	partial(filter, lambda f: f.startswith('REPO') and f.endswith('.xlsx')) \
-	if fileType == 'repo' else \
-	partial(filter, lambda f: f.startswith('FX') and f.endswith('.xlsx'))
-
-  , getFiles
-)(inputDir)
+	getSnapshotFiles(inputDir, fileType)
 
 
 
@@ -165,11 +267,28 @@ def output(items, headers, outputFile):
 	[String] outputFile
 		=> [String] outputFile
 
+	The output file appears only when all items are written. If a columnar
+	format is configured, the items are also written to a columnar file in
+	the same pass.
 	"""
-	dictToValues = lambda d: \
-		map(lambda h: d.get(h, ''), headers)
+	with getColumnarSink(outputFile, headers) as sink:
+		return writeCsvAtomic(outputFile, headers, map(sink, items), getCsvBufferSize())
 
-	return writeCsv(outputFile, map(dictToValues, items))
+
+
+def getProcessResult(handler, fileType, inputFiles, inputDir, outputDir):
+	"""
+	[Function] handler,
+	[String] fileType,
+	[List] inputFiles
+	[String] input directory,
+	[String] output directory
+		=> ([String] fileType, [Int] status code, [String] message)
+	"""
+	return \
+	(fileType, -1, 'there are more one {0} files'.format(fileType)) \
+	if len(inputFiles) > 1 else \
+	(fileType, *(runHandler(handler, fileType, inputFiles[0], inputDir, outputDir)))
 
 
 
@@ -184,14 +303,311 @@ def processFile(handler, fileType, inputFiles, inputDir, outputDir):
 	
 	side effect: send notification email about processing result
 	"""
-	getResult = lambda fileType, inputFiles: \
-		(fileType, -1, 'there are more one {0} files'.format(fileType)) \
-		if len(inputFiles) > 1 else \
-		(fileType, *(handler(inputFiles[0], inputDir, outputDir)))
+	notifyFiles( inputDir, inputFiles
+			   , *getProcessResult(handler, fileType, inputFiles, inputDir, outputDir))
+	return inputFiles
+
+
+
+"""
+	=> [Connection] the processing ledger, None if there is no ledger
+"""
+getProcessingLedger = lambda: \
+	None if getLedgerFile() == '' else getLedger(getLedgerFile())
+
+
+
+def runHandler(handler, fileType, inputFile, inputDir, outputDir, tickets=None):
+	"""
+	[Function] handler,
+	[String] fileType,
+	[String] inputFile,
+	[String] input directory,
+	[String] output directory,
+	[Set] to collect the ticket numbers written, or None
+		=> [Int] status code, [String] message
+
+	Run the handler on the input file, unless the ledger shows a file of
+	the same content was converted before and its output file is still the
+	one written then, then the recorded result and ticket numbers are
+	returned instead.
+	"""
+	ledger = getProcessingLedger()
+	if ledger is None:
+		return handler(inputFile, inputDir, outputDir, tickets)
+
+	hash = getContentHash(join(inputDir, inputFile))
+	entry = getEntry(ledger, hash)
+	if isStageDone(entry, 'converted') and isOutputIntact(entry) \
+		and entry['tickets'] is not None:
+		logger.info('runHandler(): {0} converted already at {1}, stage {2}'.format(
+						inputFile, entry['updated'], entry['stage']))
+		if tickets is not None:
+			tickets.update(entry['tickets'])
+		return entry['status'], entry['message']
+
+	start = perf_counter()
+	written = set()
+	status, message = handler(inputFile, inputDir, outputDir, written)
+	outputFile = join(outputDir, changeFileExtension(inputFile))
+	recordConversion( ledger, hash, inputFile, fileType, status, message
+					, outputFile, perf_counter() - start
+					, None if status == -1 else written
+					, None if status == -1 or not exists(outputFile) else \
+						getContentHash(outputFile))
+	if tickets is not None:
+		tickets.update(written)
+	return status, message
 
 
-	sendNotification(*(getResult(fileType, inputFiles)))
-	return inputFiles
+
+"""
+	[Dictionary] ledger entry => [Bool] its output file is there and has the
+		content written by the conversion
+"""
+isOutputIntact = lambda entry: \
+	entry['outputHash'] is not None and exists(entry['outputFile']) and \
+	getContentHash(entry['outputFile']) == entry['outputHash']
+
+
+
+def notifyFiles(inputDir, inputFiles, fileType, statusCode, message):
+	"""
+	[String] inputDir,
+	[List] inputFiles,
+	[String] fileType,
+	[Int] statusCode,
+	[String] message
+		=> 0 if successful
+
+	Send notification about the input files, unless the ledger shows all of
+	them have been notified before.
+	"""
+	ledger = getProcessingLedger()
+	if ledger is None:
+		return sendNotification(fileType, statusCode, message)
+
+	hashes = list(map(lambda f: getContentHash(join(inputDir, f)), inputFiles))
+	if len(hashes) > 0 and all(map(lambda h: isNotified(getEntry(ledger, h)), hashes)):
+		logger.info('notifyFiles(): notified already: {0}'.format(inputFiles))
+		return 0
+
+	sendNotification(fileType, statusCode, message)
+	for hash in hashes:
+		recordStage(ledger, hash, 'notified')
+
+	return 0
+
+
+
+"""
+	[String] fileType => [Function] handler
+"""
+getHandler = lambda fileType: \
+	{ 'trade': processTrade
+	, 'fx'   : processFX
+	, 'repo' : processRepo
+	}[fileType]
+
+
+
+def getExecutor(workers):
+	"""
+	[Int] workers => [Executor] thread or process pool, as per config
+	"""
+	return ProcessPoolExecutor(max_workers=workers) \
+			if getExecutorType() == 'process' else \
+			ThreadPoolExecutor(max_workers=workers)
+
+
+
+def getTimedResult(future):
+	"""
+	[Future] future of withTimingRecords() => result
+
+	Side effect: keep the timing records from the worker for the run summary.
+	"""
+	result, records = future.result()
+	addRecords(records)
+	return result
+
+
+
+def getFutureResult(fileType, future):
+	"""
+	[String] fileType, [Future] future
+		=> ([String] fileType, [Int] status code, [String] message)
+
+	A failure in one handler does not affect the others, it becomes
+	an error result of that file type.
+	"""
+	try:
+		return getTimedResult(future)
+	except:
+		logger.exception('getFutureResult(): {0}'.format(fileType))
+		return (fileType, -1, 'unexpected error processing {0} file'.format(fileType))
+
+
+
+def processFilesConcurrently(jobs, inputDir, outputDir, workers):
+	"""
+	[List] ([String] fileType, [List] inputFiles),
+	[String] input directory,
+	[String] output directory,
+	[Int] workers
+		=> [List] ([String] fileType, [List] inputFiles)
+
+	Run the handlers of all file types in parallel on a pool of workers.
+	When all are done, send notifications and move input files in the 
+	order of jobs, so the result is the same as running them one by one.
+	"""
+	logger.debug('processFilesConcurrently(): {0} workers'.format(workers))
+
+	with getExecutor(workers) as executor:
+		futures = list(map(
+			lambda t: executor.submit( withTimingRecords, getProcessResult
+									 , getHandler(t[0]), t[0], t[1], inputDir, outputDir)
+		  , jobs))
+
+	for (fileType, inputFiles), future in zip(jobs, futures):
+		notifyFiles(inputDir, inputFiles, *getFutureResult(fileType, future))
+		moveFiles(inputDir, inputFiles)
+
+	return jobs
+
+
+
+"""
+	[String] fileType => [List] csv headers
+"""
+getCsvHeaders = lambda fileType: \
+	{ 'trade': getTradeCsvHeaders
+	, 'fx'   : getFXCsvHeaders
+	, 'repo' : getRepoCsvHeaders
+	}[fileType]()
+
+
+
+"""
+	[String] fileType => [String] the csv header of ticket number
+"""
+getTicketNumberHeader = lambda fileType: \
+	{ 'trade': 'TradeReferenceNumber'
+	, 'fx'   : 'FXS Contract No.'
+	, 'repo' : 'Cust_ref'
+	}[fileType]
+
+
+
+def collectTickets(fileType, tickets, items):
+	"""
+	[String] fileType, [Set] tickets or None, [Iterable] items
+		=> [Iterable] the same items
+
+	Add the ticket number of each item to tickets as the item is written.
+	A list of items stays a list.
+	"""
+	if tickets is None:
+		return items
+
+	header = getTicketNumberHeader(fileType)
+	if isinstance(items, list):
+		tickets.update(map(lambda item: str(item[header]), items))
+		return items
+
+	def collect(item):
+		tickets.add(str(item[header]))
+		return item
+
+	return map(collect, items)
+
+
+
+def processBatchFile(fileType, inputFile, inputDir, outputDir):
+	"""
+	[String] fileType,
+	[String] inputFile,
+	[String] input directory,
+	[String] output directory
+		=> ( [String] inputFile, [Int] status code, [String] message
+		   , [Set] ticket numbers)
+	"""
+	tickets = set()
+	status, message = runHandler( getHandler(fileType), fileType, inputFile
+								, inputDir, outputDir, tickets)
+	return (inputFile, status, message, set() if status == -1 else tickets)
+
+
+
+def getBatchFileResult(inputFile, future):
+	"""
+	[String] inputFile, [Future] future
+		=> ( [String] inputFile, [Int] status code, [String] message
+		   , [Set] ticket numbers)
+	"""
+	try:
+		return getTimedResult(future)
+	except:
+		logger.exception('getBatchFileResult(): {0}'.format(inputFile))
+		return (inputFile, -1, 'unexpected error', set())
+
+
+
+def aggregateResults(fileType, results):
+	"""
+	[String] fileType,
+	[List] ([String] inputFile, [Int] status code, [String] message, [Set] tickets)
+		=> ([String] fileType, [Int] status code, [String] message)
+
+	Combine the results of all files of a type into one. Ticket numbers
+	that appear in more than one file make the result a warning.
+	"""
+	duplicates = sorted(duplidateItems(chain.from_iterable(map(lambda r: r[3], results))))
+	statusCodes = list(map(lambda r: r[1], results))
+	status = -1 if -1 in statusCodes else \
+			 1 if 1 in statusCodes or len(duplicates) > 0 else \
+			 0
+
+	return \
+	( fileType
+	, status
+	, '\n\n'.join(map(lambda r: '{0}: {1}'.format(r[0], r[2]), results)) + \
+		('' if duplicates == [] else \
+		'\n\nticket numbers in more than one file: ' + ' '.join(duplicates))
+	)
+
+
+
+def processFilesInBatch(jobs, inputDir, outputDir, workers):
+	"""
+	[List] ([String] fileType, [List] inputFiles),
+	[String] input directory,
+	[String] output directory,
+	[Int] workers
+		=> [List] ([String] fileType, [List] inputFiles)
+
+	Process every input file of every type on a pool of workers, then 
+	send one notification per file type and move the input files, in the 
+	order of jobs.
+	"""
+	logger.debug('processFilesInBatch(): {0} workers'.format(workers))
+
+	with getExecutor(workers) as executor:
+		futures = list(map(
+			lambda t: list(map(
+				lambda f: executor.submit( withTimingRecords, processBatchFile
+										 , t[0], f, inputDir, outputDir)
+			  , t[1]))
+		  , jobs))
+
+	for (fileType, inputFiles), fileFutures in zip(jobs, futures):
+		notifyFiles( inputDir, inputFiles
+				   , *aggregateResults( fileType
+									  , list(map( getBatchFileResult
+												, inputFiles, fileFutures))))
+		moveFiles(inputDir, inputFiles)
+
+	return jobs
 
 
 
@@ -200,10 +616,17 @@ def moveFiles(inputDir, inputFiles):
 	[String] inputDir,
 	[List] inputFiles
 		=> 0 if successful
+
+	Side effect: record the files as archived in the ledger.
 	"""
+	ledger = getProcessingLedger()
 	for file in inputFiles:
 		logger.debug('moveFiles: {0}'.format(file))
-		shutil.move(join(inputDir, file), join(inputDir, 'processed', file))
+		with timeStage(file, 'archive'):
+			hash = None if ledger is None else getContentHash(join(inputDir, file))
+			shutil.move(join(inputDir, file), join(inputDir, 'processed', file))
+			if ledger is not None:
+				recordStage(ledger, hash, 'archived')
 
 	return 0
 
@@ -260,17 +683,26 @@ if __name__ == '__main__':
 	# 			   , join(getInputDirectory(), 'processed', files[0]))
 
 
-	handlers = { 'trade': processTrade
-			   , 'fx'   : processFX
-			   , 'repo' : processRepo
-			   }
-
-
-	compose(
-		list
-	  , partial(map, partial(moveFiles, getInputDirectory()))
-	  , partial(map, lambda t: processFile(*t))
-	  , partial(map, lambda t: (handlers[t[0]], t[0], t[1], getInputDirectory(), getOutputDirectory()))
-	  , partial(filter, lambda t: len(t[1]) > 0)
-	  , partial(map, lambda fileType: (fileType, getInputFiles(getInputDirectory(), fileType)))
-	)(('trade', 'fx', 'repo'))
\ No newline at end of file
+	with snapshotRun():
+		jobs = compose(
+			list
+		  , partial(filter, lambda t: len(t[1]) > 0)
+		  , partial(map, lambda fileType: (fileType, getInputFiles(getInputDirectory(), fileType)))
+		)(('trade', 'fx', 'repo'))
+
+
+	if getBatchMode():
+		processFilesInBatch( jobs, getInputDirectory(), getOutputDirectory()
+						   , getWorkers())
+	elif getWorkers() > 1:
+		processFilesConcurrently( jobs, getInputDirectory(), getOutputDirectory()
+								, getWorkers())
+	else:
+		compose(
+			list
+		  , partial(map, partial(moveFiles, getInputDirectory()))
+		  , partial(map, lambda t: processFile(*t))
+		  , partial(map, lambda t: (getHandler(t[0]), t[0], t[1], getInputDirectory(), getOutputDirectory()))
+		)(jobs)
+
+	saveRunSummary(getTimingFile())
\ No newline at end of file
@@ -0,0 +1,376 @@
+# coding=utf-8
+#
+# Declarative field mappings, compiled into row mappers.
+#
+# An output format is described by a mapping: a sequence of fields, each
+# naming its source columns, converters, a condition and a default, plus
+# derived values computed once per row and shared by several fields. The
+# mapping is compiled once into a single Python function that builds the
+# output record in one expression, so a row goes through one function frame
+# plus its converters, however many fields there are. The same mapping also
+# gives the csv headers and the record type of the format.
+#
+# A field or derived value with few distinct sources in a file (dates, a
+# currency pair) can be marked as a table. A mapper compiled with tables
+# converts each distinct source once and looks it up afterwards, such a
+# mapper is meant to be compiled for one file, as its tables grow with the
+# file.
+#
+# A mapping can also be run column at a time over a whole file, see
+# mapColumns(). Each converter then goes over a whole column in one map(),
+# and a table is filled from the distinct values of its source columns, so
+# a lookup on a few distinct values costs one dictionary read per row.
+#
+# For example,
+#
+# getMapping = lambda: \
+# 	( derived('subType', getSubType, ('Repo Sta', 'Trd Dt', 'Stl Date'))
+# 	, field('Txn_sub_type', 'subType')
+# 	, field('Trade_date', 'Trd Dt', toDateTimeString, when=('subType', ('Open', )))
+# 	, field('Int_mode', value='ACT/360')
+# 	)
+#
+from boci_trustee.record import makeRecordType
+from itertools import chain, compress, repeat
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+def field( name, source=None, convert=None, value='', default='', when=None, output=True
+		 , table=False):
+	"""
+	[String] name of the output field,
+	[String] or [Tuple] source column(s) or derived value(s), None for a
+		constant field,
+	[Function] or [Tuple] converters, applied in order to the source (the
+		first converter takes all the sources as arguments), None to take
+		the source as it is,
+	[Object] value of a constant field,
+	[Object] default, the value when the condition is not met,
+	[Tuple] condition ([String] source, [Tuple] values), the field is
+		converted only if the source is one of the values,
+	[Bool] whether the field goes to the csv file,
+	[Bool] whether the converted value is kept in a table, by its sources
+		=> [Dictionary] field spec
+	"""
+	return { 'kind': 'field', 'name': name
+		   , 'sources': () if source is None else \
+		   				(source, ) if isinstance(source, str) else tuple(source)
+		   , 'converters': () if convert is None else \
+		   					tuple(convert) if isinstance(convert, (tuple, list)) else \
+		   					(convert, )
+		   , 'value': value, 'default': default, 'when': when, 'output': output
+		   , 'table': table
+		   }
+
+
+
+def derived(names, func, sources, table=False):
+	"""
+	[String] or [Tuple] names of the derived value(s),
+	[Function] func, takes the sources as arguments, returns one value, or
+		a tuple of values if there is more than one name,
+	[Tuple] source columns or earlier derived values,
+	[Bool] whether the result is kept in a table, by its sources
+		=> [Dictionary] derived value spec
+
+	Computed once per row, before the fields.
+	"""
+	return { 'kind': 'derived'
+		   , 'names': (names, ) if isinstance(names, str) else tuple(names)
+		   , 'func': func
+		   , 'sources': (sources, ) if isinstance(sources, str) else tuple(sources)
+		   , 'table': table
+		   }
+
+
+
+"""
+	[Iterable] mapping => [List] field specs
+"""
+getFields = lambda mapping: \
+	list(filter(lambda spec: spec['kind'] == 'field', mapping))
+
+
+
+"""
+	[Iterable] mapping => [List] csv headers
+"""
+getHeaders = lambda mapping: \
+	list(map( lambda spec: spec['name']
+			, filter(lambda spec: spec['output'], getFields(mapping))))
+
+
+
+def getSources(mapping):
+	"""
+	[Iterable] mapping => [Tuple] source columns, in order of first use
+
+	Derived values are not source columns.
+	"""
+	derivedNames = set(chain.from_iterable(map(
+		lambda spec: spec['names']
+	  , filter(lambda spec: spec['kind'] == 'derived', mapping))))
+
+	sources = []
+	for spec in mapping:
+		for source in chain(spec['sources'], [] if spec.get('when') is None else [spec['when'][0]]):
+			if not source in derivedNames and not source in sources:
+				sources.append(source)
+
+	return tuple(sources)
+
+
+
+def makeMappingRecordType(name, mapping, module=None):
+	"""
+	[String] type name, [Iterable] mapping, [String] module
+		=> [Type] record type with all the fields of the mapping
+
+	Fields not for output must come after the output fields, so that the
+	csv writer can write a record by position.
+	"""
+	fields = getFields(mapping)
+	outputs = list(map(lambda spec: spec['output'], fields))
+	if outputs != sorted(outputs, reverse=True):
+		logger.error('makeMappingRecordType(): {0} has output fields after others'.format(name))
+		raise ValueError
+
+	return makeRecordType(name, map(lambda spec: spec['name'], fields), module)
+
+
+
+def readSource(row, source):
+	"""
+	[Dictionary] row, [String] source ('a.b' reads row['a']['b'])
+		=> [Object] value
+	"""
+	value = row
+	for key in source.split('.'):
+		value = value[key]
+
+	return value
+
+
+
+def raiseMissingSource(name, sources, row):
+	"""
+	[String] mapper name, [Iterable] sources, [Dictionary] row
+
+	Raise KeyError for the first source that cannot be read from the row,
+	like a close without its repo data under 'Open'.
+	"""
+	for source in sources:
+		try:
+			readSource(row, source)
+		except (KeyError, TypeError, IndexError):
+			logger.error('{0}(): missing {1}'.format(name, source))
+			raise KeyError(source)
+
+
+
+def compileMapper( name, inputs, mapping, recordType, byKey=False, module=None
+				 , tables=False):
+	"""
+	[String] function name,
+	[Tuple] inputs,
+	[Iterable] mapping,
+	[Type] record type, whose fields are those of the mapping,
+	[Bool] byKey,
+	[String] module where the function is assigned to a variable of the
+		same name,
+	[Bool] whether fields and derived values marked as table are kept in
+		tables of the mapper
+		=> [Function] mapper
+
+	The mapper takes the inputs as positional arguments, or if byKey is
+	True, one dictionary to read the inputs from by key ('a.b' reads
+	row['a']['b']), an input missing from it raises KeyError with the name
+	of the input. It returns a record.
+
+	With tables, a field or derived value marked as table is worked out
+	once per distinct value of its sources, and looked up in a table of
+	the mapper afterwards.
+	"""
+	namespace = {'Record': recordType}
+	names = dict(map(lambda t: (t[1], 'i{0}'.format(t[0])), enumerate(inputs)))
+	lines = []
+
+	def constant(x):
+		key = 'k{0}'.format(len(namespace))
+		namespace[key] = x
+		return key
+
+
+	def variable(source):
+		if not source in names:
+			logger.error('compileMapper(): {0}: unknown source {1}'.format(name, source))
+			raise KeyError(source)
+
+		return names[source]
+
+
+	def tabled(spec, expression):
+		if not (tables and spec['table']):
+			return expression
+
+		key = ', '.join(map(variable, spec['sources']))
+		key = key if len(spec['sources']) == 1 else '({0}, )'.format(key)
+		table = constant({})
+		return '({0}[{1}] if {1} in {0} else {0}.setdefault({1}, {2}))'.format(
+					table, key, expression)
+
+
+	if byKey and len(names) > 0:
+		lines.append('try:')
+		for source, var in names.items():
+			lines.append('\t{0} = row{1}'.format(
+				var, ''.join(map(lambda key: '[{0}]'.format(repr(key)), source.split('.')))))
+		lines.append('except (KeyError, TypeError, IndexError):')
+		lines.append('\t{0}({1}, {2}, row)'.format(
+			constant(raiseMissingSource), repr(name), constant(tuple(inputs))))
+
+	for spec in filter(lambda spec: spec['kind'] == 'derived', mapping):
+		args = ', '.join(map(variable, spec['sources']))
+		targets = list(map(lambda n: 'd{0}'.format(len(names) + n), range(len(spec['names']))))
+		lines.append('{0} = {1}'.format(
+			', '.join(targets), tabled(spec, '{0}({1})'.format(constant(spec['func']), args))))
+		names.update(zip(spec['names'], targets))
+
+	def fieldExpression(spec):
+		if len(spec['sources']) == 0:
+			expression = constant(spec['value'])
+		elif len(spec['converters']) == 0:
+			if len(spec['sources']) > 1:
+				logger.error('compileMapper(): {0}: field {1} has more than one source and no converter'.format(
+								name, spec['name']))
+				raise ValueError
+			expression = variable(spec['sources'][0])
+		else:
+			expression = ', '.join(map(variable, spec['sources']))
+			for converter in spec['converters']:
+				expression = '{0}({1})'.format(constant(converter), expression)
+			expression = tabled(spec, expression)
+
+		return expression if spec['when'] is None else \
+				'({0} if {1} in {2} else {3})'.format(
+					expression, variable(spec['when'][0])
+				  , constant(frozenset(spec['when'][1])), constant(spec['default']))
+
+
+	fields = getFields(mapping)
+	if list(map(lambda spec: spec['name'], fields)) != list(recordType._fields):
+		logger.error('compileMapper(): {0}: fields do not match the record type'.format(name))
+		raise ValueError
+
+	lines.append('return Record(({0}, ))'.format(', '.join(map(fieldExpression, fields))))
+	source = 'def {0}({1}):\n{2}\n'.format(
+				name, 'row' if byKey else ', '.join(map(lambda source: names[source], inputs))
+			  , '\n'.join(map(lambda line: '\t' + line, lines)))
+	logger.debug('compileMapper(): {0}\n{1}'.format(name, source))
+
+	exec(compile(source, '<mapping {0}>'.format(name), 'exec'), namespace)
+	mapper = namespace[name]
+	if module is not None:
+		mapper.__module__ = module
+
+	return mapper
+
+
+
+def composeConverters(converters):
+	"""
+	[Tuple] converters => [Function] the converters applied in order, the
+		first one takes all the arguments
+	"""
+	def converter(*args):
+		value = converters[0](*args)
+		for convert in converters[1:]:
+			value = convert(value)
+
+		return value
+
+
+	return converters[0] if len(converters) == 1 else converter
+
+
+
+def applyColumns(func, columns, table=False):
+	"""
+	[Function] func, [List] ([Sequence] column), one for each argument of func,
+	[Bool] whether to call func once per distinct row of the columns
+		=> [List] func applied to each row of the columns
+	"""
+	if not table:
+		return list(map(func, *columns))
+
+	keys = columns[0] if len(columns) == 1 else list(zip(*columns))
+	values = dict(map( lambda key: (key, func(key) if len(columns) == 1 else func(*key))
+					 , set(keys)))
+	return list(map(values.__getitem__, keys))
+
+
+
+def mapColumns(name, mapping, recordType, columns):
+	"""
+	[String] name,
+	[Iterable] mapping,
+	[Type] record type, whose fields are those of the mapping,
+	[Dictionary] source -> [Sequence] column, all of the same length
+		=> [List] records
+
+	Column at a time version of a mapper from compileMapper() with tables,
+	gives the same records. Each derived value and field is worked out for
+	the whole column before the next one, a field with a condition is
+	converted only on the rows that meet it.
+	"""
+	fields = getFields(mapping)
+	if list(map(lambda spec: spec['name'], fields)) != list(recordType._fields):
+		logger.error('mapColumns(): {0}: fields do not match the record type'.format(name))
+		raise ValueError
+
+	values = dict(columns)
+	count = len(next(iter(values.values()))) if len(values) > 0 else 0
+
+	def column(source):
+		if not source in values:
+			logger.error('mapColumns(): {0}: unknown source {1}'.format(name, source))
+			raise KeyError(source)
+
+		return values[source]
+
+
+	for spec in filter(lambda spec: spec['kind'] == 'derived', mapping):
+		result = applyColumns( spec['func'], list(map(column, spec['sources']))
+							 , spec['table'])
+		if len(spec['names']) == 1:
+			values[spec['names'][0]] = result
+		else:
+			values.update(zip( spec['names']
+							 , list(zip(*result)) if count > 0 else [()] * len(spec['names'])))
+
+	def fieldColumn(spec):
+		if len(spec['sources']) == 0:
+			return repeat(spec['value'], count)
+
+		if len(spec['converters']) == 0 and len(spec['sources']) > 1:
+			logger.error('mapColumns(): {0}: field {1} has more than one source and no converter'.format(
+							name, spec['name']))
+			raise ValueError
+
+		convert = lambda sources: \
+			sources[0] if len(spec['converters']) == 0 else \
+			applyColumns(composeConverters(spec['converters']), sources, spec['table'])
+
+		sources = list(map(column, spec['sources']))
+		if spec['when'] is None:
+			return convert(sources)
+
+		selected = list(map( frozenset(spec['when'][1]).__contains__
+						   , column(spec['when'][0])))
+		converted = iter(convert(list(map(lambda c: list(compress(c, selected)), sources))))
+		return list(map(lambda s: next(converted) if s else spec['default'], selected))
+
+
+	return list(map(recordType, zip(*map(fieldColumn, fields))))
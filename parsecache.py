@@ -0,0 +1,294 @@
+# coding=utf-8
+#
+# A cache of parsed input workbooks, so that a file seen before (a re-run,
+# a backfill or a recon replay) is not parsed from Excel again.
+#
+# An entry is keyed by the sha256 of the file content, the parser name, the
+# parser version and the kind of entry (lines or value), so a changed file
+# or parser never hits an old entry. A lines entry is a gzip file of pickled
+# chunks of lines, so it can be written while the lines are read for the
+# first time and read back lazily, one chunk at a time. It ends with an end
+# of data marker if all the lines are in it, otherwise it has only the lines
+# read before the reader stopped, and a reader that goes beyond them reads
+# the rest from the file. A value entry is one pickled value. Entries are
+# written to a temporary file and renamed into place when complete. When
+# the cache grows beyond its size limit, the least recently used entries
+# are removed.
+#
+from boci_trustee.utility import getParseCacheDirectory, getParseCacheSize
+from boci_trustee.ledger import getContentHash
+from collections.abc import Iterator
+from itertools import islice
+from tempfile import mkstemp
+from os.path import join, exists, basename, dirname
+from os import makedirs
+import os, gzip, pickle
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+"""
+	Lines per pickled chunk.
+"""
+CHUNK_SIZE = 1000
+
+
+
+"""
+	The last object of a lines entry that has all the lines.
+"""
+END_OF_DATA = None
+
+
+
+"""
+	=> [Dictionary] parser name -> [Int] parser version
+
+	Bump the version of a parser when the form of its output changes, so
+	that entries written by the old version are no longer used.
+"""
+getParserVersions = lambda: \
+	{ 'fileToLines': 1
+	, 'fileToLinesStreaming': 1
+	, 'getValuationDataFromFile': 1
+	}
+
+
+
+def getCacheFile(directory, parser, file, kind):
+	"""
+	[String] cache directory, [String] parser name, [String] input file,
+	[String] kind of entry ('lines' or 'value')
+		=> [String] cache file of the input file
+	"""
+	return join( directory, '{0}-{1}-{2}-{3}.cache'.format(
+					getContentHash(file), parser, getParserVersions()[parser], kind))
+
+
+
+def openEntry(cacheFile):
+	"""
+	[String] cache file => [File] the entry opened for reading, None if
+		there is no entry
+
+	Mark the entry as recently used. Once opened, the entry can be read
+	even if it is evicted meanwhile.
+	"""
+	try:
+		os.utime(cacheFile)
+		return gzip.open(cacheFile, 'rb')
+	except FileNotFoundError:
+		return None
+
+
+
+def readEntry(f):
+	"""
+	[File] entry opened for reading => [Iterator] pickled objects in it
+
+	The file is closed when all objects are read.
+	"""
+	with f:
+		while True:
+			try:
+				yield pickle.load(f)
+			except EOFError:
+				return
+
+
+
+def openCacheFile(cacheFile):
+	"""
+	[String] cache file => ([String] temporary file, [File] gzip file)
+
+	Entries are written to the temporary file, then renamed into place
+	by closeCacheFile().
+	"""
+	fd, tempFile = mkstemp( dir=dirname(cacheFile)
+						  , prefix='.' + basename(cacheFile) + '.', suffix='.tmp')
+	os.close(fd)
+	return tempFile, gzip.open(tempFile, 'wb', compresslevel=1)
+
+
+
+def closeCacheFile(tempFile, f, cacheFile, maxBytes):
+	"""
+	[String] temporary file, [File] gzip file, [String] cache file,
+	[Int] max size of the cache directory in bytes
+	"""
+	f.close()
+	os.replace(tempFile, cacheFile)
+	logger.debug('closeCacheFile(): {0}'.format(cacheFile))
+	evictCache(dirname(cacheFile), maxBytes)
+
+
+
+def discardCacheFile(tempFile, f):
+	"""
+	[String] temporary file, [File] gzip file
+	"""
+	try:
+		f.close()
+	finally:
+		if exists(tempFile):
+			os.remove(tempFile)
+
+
+
+def evictCache(directory, maxBytes):
+	"""
+	[String] cache directory, [Int] max size in bytes, 0 for no limit
+
+	Remove the least recently used entries until the total size of the
+	entries is within maxBytes. An entry is used when it is written or read.
+	"""
+	if maxBytes <= 0:
+		return
+
+	entries = []
+	for name in filter(lambda name: name.endswith('.cache'), os.listdir(directory)):
+		try:
+			s = os.stat(join(directory, name))
+			entries.append((s.st_mtime_ns, s.st_size, name))
+		except FileNotFoundError:
+			pass	# removed by another process
+
+	total = sum(map(lambda t: t[1], entries))
+	for _, size, name in sorted(entries):
+		if total <= maxBytes:
+			break
+
+		try:
+			os.remove(join(directory, name))
+			logger.debug('evictCache(): {0}'.format(name))
+		except OSError:
+			pass	# removed by another process, or open on Windows
+
+		total = total - size
+
+
+
+def cachedLines(parser, read, file, directory, maxBytes=0):
+	"""
+	[String] parser name,
+	[Function] read ([String] file => [Iterable] lines),
+	[String] input file,
+	[String] cache directory, empty for no cache,
+	[Int] max size of the cache directory in bytes, 0 for no limit
+		=> [Iterator] lines
+
+	Lines come from the cache entry of the file if there is one. Otherwise
+	they come from read(file), and are written to a new entry as they are
+	consumed. If the lines are not all consumed (a reader stops at the
+	first empty line), the entry keeps only the chunks read so far, without
+	the end of data marker. On error no entry is kept.
+	"""
+	if directory == '':
+		yield from read(file)
+		return
+
+	makedirs(directory, exist_ok=True)
+	cacheFile = getCacheFile(directory, parser, file, 'lines')
+	entry = openEntry(cacheFile)
+	if entry is not None:
+		logger.debug('cachedLines(): hit {0}'.format(file))
+		count = 0
+		for chunk in readEntry(entry):
+			if chunk is END_OF_DATA:
+				return
+
+			yield from chunk
+			count = count + len(chunk)
+
+		logger.debug('cachedLines(): read {0} beyond line {1}'.format(file, count))
+		yield from islice(read(file), count, None)
+		return
+
+	logger.debug('cachedLines(): miss {0}'.format(file))
+	tempFile, f = openCacheFile(cacheFile)
+	lines = iter(read(file))
+	try:
+		for chunk in iter(lambda: list(islice(lines, CHUNK_SIZE)), []):
+			pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+			yield from chunk
+
+		pickle.dump(END_OF_DATA, f, pickle.HIGHEST_PROTOCOL)
+		closeCacheFile(tempFile, f, cacheFile, maxBytes)
+
+	except GeneratorExit:
+		try:
+			closeCacheFile(tempFile, f, cacheFile, maxBytes)
+		except Exception:
+			logger.exception('cachedLines(): failed to cache {0}'.format(file))
+			discardCacheFile(tempFile, f)
+		raise
+
+	except:
+		discardCacheFile(tempFile, f)
+		raise
+
+
+
+def cachedValue(parser, parse, file, directory, maxBytes=0):
+	"""
+	[String] parser name,
+	[Function] parse ([String] file => [Object] value),
+	[String] input file,
+	[String] cache directory, empty for no cache,
+	[Int] max size of the cache directory in bytes, 0 for no limit
+		=> [Object] value
+
+	Same as cachedLines(), for a parser that gives one value. A value that
+	is an iterator, or iterators in a value (a tuple), are turned into lists
+	so that they can be cached. A value that cannot be pickled is returned
+	without an entry.
+	"""
+	if directory == '':
+		return parse(file)
+
+	makedirs(directory, exist_ok=True)
+	cacheFile = getCacheFile(directory, parser, file, 'value')
+	entry = openEntry(cacheFile)
+	if entry is not None:
+		logger.debug('cachedValue(): hit {0}'.format(file))
+		with entry:
+			return pickle.load(entry)
+
+	logger.debug('cachedValue(): miss {0}'.format(file))
+	value = parse(file)
+	if isinstance(value, Iterator):
+		value = list(value)
+	elif isinstance(value, tuple):
+		value = tuple(map(lambda x: list(x) if isinstance(x, Iterator) else x, value))
+
+	tempFile, f = openCacheFile(cacheFile)
+	try:
+		pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+		closeCacheFile(tempFile, f, cacheFile, maxBytes)
+	except (pickle.PicklingError, TypeError, AttributeError):
+		logger.warning('cachedValue(): {0} of {1} cannot be cached'.format(parser, file))
+		discardCacheFile(tempFile, f)
+	except:
+		discardCacheFile(tempFile, f)
+		raise
+
+	return value
+
+
+
+"""
+	[String] parser name, [Function] read, [String] input file
+		=> [Iterator] lines, through the configured cache
+"""
+readLines = lambda parser, read, file: \
+	cachedLines(parser, read, file, getParseCacheDirectory(), getParseCacheSize())
+
+
+
+"""
+	[String] parser name, [Function] parse, [String] input file
+		=> [Object] value, through the configured cache
+"""
+readValue = lambda parser, parse, file: \
+	cachedValue(parser, parse, file, getParseCacheDirectory(), getParseCacheSize())
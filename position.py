@@ -3,34 +3,184 @@
 # Extract cash and holding positions from BOCI Trustee valuation 
 # report to Geneva reconciliation files.
 # 
+# To convert all valuation reports under a directory tree, for all funds
+# and dates, do:
+# 
+# $python position.py <input directory> <output directory>
+# 
 
 from toolz.functoolz import compose
+from toolz.itertoolz import groupby
 from steven_utils.utility import writeCsv
 from stbf.valuation_report import getValuationDataFromFile
+from boci_trustee.utility import getFundPortfolios, getReconStoreFile
+from boci_trustee.snapshot import isValuationFile
+from boci_trustee.recondelta import getReconStore, writeReconDelta, getDeltaFile
+from boci_trustee.record import makeRecordType
+from boci_trustee.columnar import getColumnarSink
+from boci_trustee.parsecache import readValue
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 from itertools import chain
 from os.path import join
+import os, json
 import logging
 logger = logging.getLogger(__name__)
 
 
 
-def processValuationFile(outputDir, file):
+def processValuationFile(outputDir, file, portfolio=None):
 	"""
 	[String] output directory,
-	[String] file 
+	[String] file,
+	[String] portfolio name, default is getPortfolioName()
 		=> [Tuple] ( [String] cash recon file
 				   , [String] position recon file
 				   )
+
+	In incremental mode (a recon store file in config), the delta files
+	against the previous date are also written, see recondelta.py. A report
+	parsed before comes from the parse cache, if configured.
 	"""
 	logger.debug('processValuationFile(): {0}'.format(file))
 
 	date, _, _, bondPositions, cashPositions = \
-		getValuationDataFromFile(file)
+		readValue('getValuationDataFromFile', getValuationDataFromFile, file)
 
-	return \
-	( createCashReconFile(outputDir, getParentFolder(file), date, cashPositions)
-	, createPositionReconFile(outputDir, getParentFolder(file), date, bondPositions))
+	portfolio = getPortfolioName() if portfolio is None else portfolio
+	bondPositions, cashPositions = list(bondPositions), list(cashPositions)
+	cashFile = createCashReconFile( outputDir, getParentFolder(file), date
+								  , cashPositions, portfolio)
+	positionFile = createPositionReconFile( outputDir, getParentFolder(file), date
+										  , bondPositions, portfolio)
+
+	if isIncremental():
+		conn = getReconStore(getReconStoreFile())
+		writeReconDelta( conn, cashFile, getCashReconFields(), 'cash', portfolio, date
+					   , map(lambda p: cashReconPosition(date, p, portfolio), cashPositions))
+		writeReconDelta( conn, positionFile, getPositionReconFields(), 'position'
+					   , portfolio, date
+					   , map(lambda p: bondReconPosition(date, p, portfolio), bondPositions))
+
+	return (cashFile, positionFile)
+
+
+
+"""
+	=> [Bool] whether to write day over day delta files
+"""
+isIncremental = lambda: getReconStoreFile() != ''
+
+
+
+def getValuationFiles(directory):
+	"""
+	[String] directory => [List] ([String] valuation file)
+
+	All valuation files in the directory and its sub directories, sorted.
+	"""
+	return sorted(chain.from_iterable(map(
+		lambda t: map( lambda name: join(t[0], name)
+					 , filter(isValuationFile, t[2]))
+	  , os.walk(directory))))
+
+
+
+"""
+	[String] file => [String] name of the folder the file is in, i.e., the fund
+"""
+getFundFolder = lambda file: \
+	os.path.basename(os.path.dirname(os.path.abspath(file)))
+
+
+
+def processValuationJob(outputDir, file, portfolio):
+	"""
+	[String] output directory,
+	[String] file,
+	[String] portfolio name, None if the fund is not mapped
+		=> [Dictionary] manifest entry
+
+	status: -1: error, 0: successful
+	"""
+	entry = { 'file': file, 'fund': getFundFolder(file), 'portfolio': portfolio
+			, 'cashFile': '', 'positionFile': '', 'cashDeltaFile': ''
+			, 'positionDeltaFile': '', 'status': -1, 'message': ''
+			}
+	if portfolio is None:
+		logger.error('processValuationJob(): fund not mapped: {0}'.format(file))
+		return dict(entry, message='fund not mapped: {0}'.format(entry['fund']))
+
+	try:
+		cashFile, positionFile = processValuationFile(outputDir, file, portfolio)
+		return dict( entry, cashFile=cashFile, positionFile=positionFile, status=0
+				   , cashDeltaFile=getDeltaFile(cashFile) if isIncremental() else ''
+				   , positionDeltaFile=getDeltaFile(positionFile) if isIncremental() else '')
+	except Exception as e:
+		logger.exception('processValuationJob(): {0}'.format(file))
+		return dict(entry, message=str(e))
+
+
+
+def processValuationJobs(jobs):
+	"""
+	[List] ([String] output directory, [String] file, [String] portfolio)
+		=> [List] ([Dictionary] manifest entry)
+
+	Process the jobs one after another.
+	"""
+	return list(map(lambda t: processValuationJob(*t), jobs))
+
+
+
+def processValuationFiles(inputDir, outputDir, workers=1, portfolios=None):
+	"""
+	[String] input directory,
+	[String] output directory,
+	[Int] workers,
+	[Dictionary] fund folder name (lower case) -> portfolio name, default
+		is the [fund] section of the config file
+		=> [List] ([Dictionary] manifest entry)
+
+	Convert every valuation report under the input directory to cash and
+	position recon files, on a pool of worker processes. The fund of a
+	report is the name of the folder it is in. If no fund is mapped, every
+	report is of getPortfolioName(). The manifest is in the order of files,
+	one entry for each.
+
+	In incremental mode, reports of the same fund folder are processed in
+	order by one worker, so each one is compared with the date before it.
+	"""
+	portfolios = getFundPortfolios() if portfolios is None else portfolios
+	getPortfolio = lambda file: \
+		portfolios.get(getFundFolder(file).lower()) if len(portfolios) > 0 else \
+		getPortfolioName()
+
+	jobs = list(map( lambda file: (outputDir, file, getPortfolio(file))
+				   , getValuationFiles(inputDir)))
+	logger.debug('processValuationFiles(): {0} files, {1} workers'.format(
+					len(jobs), workers))
+
+	if workers <= 1:
+		return processValuationJobs(jobs)
+
+	groups = list(groupby(lambda t: os.path.dirname(t[1]), jobs).values()) \
+				if isIncremental() else list(map(lambda t: [t], jobs))
+
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		return sorted( chain.from_iterable(executor.map(processValuationJobs, groups))
+					 , key=lambda entry: entry['file'])
+
+
+
+def writeManifest(file, manifest):
+	"""
+	[String] json file, [List] manifest entries => [String] json file
+	"""
+	with open(file, 'w') as f:
+		json.dump(manifest, f, indent=2)
+
+	return file
 
 
 
@@ -47,23 +197,28 @@ getPositionReconFields = lambda : \
 	)
 
 
-dictToValues = lambda keys, d: \
-	map(lambda key: d[key], keys)
+CashReconRecord = makeRecordType('CashReconRecord', getCashReconFields(), __name__)
+
+
+PositionReconRecord = makeRecordType( 'PositionReconRecord', getPositionReconFields()
+									, __name__)
 
 
 
 """
 	[String] date,
-	[Dictionary] cash position
-		=> [Dictionary] cash reconciliation position
+	[Dictionary] cash position,
+	[String] portfolio name
+		=> [CashReconRecord] cash reconciliation position
 """
-cashReconPosition = lambda date, position: \
-	{ 'portfolio': getPortfolioName()
-	, 'custodian': ''
-	, 'date': date
-	, 'currency': position['DEAL CCY']
-	, 'balance': position['ORIG CURR BOOK COST']
-	}
+cashReconPosition = lambda date, position, portfolio=getPortfolioName(): \
+	CashReconRecord(
+	( portfolio								# portfolio
+	, ''									# custodian
+	, date									# date
+	, position['DEAL CCY']					# currency
+	, position['ORIG CURR BOOK COST']		# balance
+	))
 
 
 
@@ -88,71 +243,100 @@ cashReconPosition = lambda date, position: \
 
 """
 	[String] date,
-	[Dictionary] bond position
-		=> [Dictionary] holding reconciliation position
+	[Dictionary] bond position,
+	[String] portfolio name
+		=> [PositionReconRecord] holding reconciliation position
 """
-bondReconPosition = lambda date, bond: \
-	{ 'portfolio': getPortfolioName()
-	, 'custodian': ''
-	, 'date': date
-	, 'geneva_investment_id': ''
-	, 'ISIN': bond['ISIN CODE']
-	, 'bloomberg_figi': ''
-	, 'name': bond['INVESTMENT']
-	, 'currency': bond['DEAL CCY']
-	, 'quantity': bond['NOMINAL QUANTITY']
-	}
+bondReconPosition = lambda date, bond, portfolio=getPortfolioName(): \
+	PositionReconRecord(
+	( portfolio								# portfolio
+	, ''									# custodian
+	, date									# date
+	, ''									# geneva_investment_id
+	, bond['ISIN CODE']						# ISIN
+	, ''									# bloomberg_figi
+	, bond['INVESTMENT']					# name
+	, bond['DEAL CCY']						# currency
+	, bond['NOMINAL QUANTITY']				# quantity
+	))
 
 
 # [String] file name => [String] suffix 
 getParentFolder = compose(
 	lambda L: '_'.join(L)
   , lambda s: s.split()
-  , lambda file: file.split('\\')[-2]
+  , lambda file: file.replace('\\', '/').split('/')[-2]
 )
 	
 
 
-def createCashReconFile(outputDir, prefix, date, cashPositions):
+def writeReconFile(file, fields, records):
+	"""
+	[String] file, [Tuple] fields, [Iterable] recon records => [String] file
+
+	Side effect: write a csv file, and a columnar file in the same pass if
+	a columnar format is configured.
+	"""
+	with getColumnarSink(file, fields) as sink:
+		return writeCsv(file, chain([fields], map(sink, records)), delimiter='|')
+
+
+
+def createCashReconFile(outputDir, prefix, date, cashPositions, portfolio=None):
 	"""
 	[String] output directory,
 	[String] prefix,
 	[String] date, 
-	[Iterable] cash positions
+	[Iterable] cash positions,
+	[String] portfolio name, default is getPortfolioName()
 		=> [String] cash reconciliation file name
 
 	Side effect: write a csv file
 	"""
 	return \
 	compose(
-		lambda values: \
-			writeCsv( join(outputDir, prefix + '_' + date + '_cash.csv')
-					, chain([getCashReconFields()], values)
-					, delimiter='|'
-					)
-	  , partial(map, partial(dictToValues, getCashReconFields()))
-	  , partial(map, partial(cashReconPosition, date))
+		partial( writeReconFile, join(outputDir, prefix + '_' + date + '_cash.csv')
+			   , getCashReconFields())
+	  , partial(map, lambda p: cashReconPosition(date, p, portfolio or getPortfolioName()))
 	)(cashPositions)
 
 
 
-def createPositionReconFile(outputDir, prefix, date, bondPositions):
+def createPositionReconFile(outputDir, prefix, date, bondPositions, portfolio=None):
 	"""
 	[String] output directory,
 	[String] prefix, 
 	[String] date, 
-	[Iterable] bond positions
+	[Iterable] bond positions,
+	[String] portfolio name, default is getPortfolioName()
 		=> [String] holding reconciliation file name
 
 	Side effect: write a csv file
 	"""
 	return \
 	compose(
-		lambda values: \
-			writeCsv( join(outputDir, prefix + '_' + date + '_position.csv')
-					, chain([getPositionReconFields()], values)
-					, delimiter='|'
-					)
-	  , partial(map, partial(dictToValues, getPositionReconFields()))
-	  , partial(map, partial(bondReconPosition, date))
-	)(bondPositions)
\ No newline at end of file
+		partial( writeReconFile, join(outputDir, prefix + '_' + date + '_position.csv')
+			   , getPositionReconFields())
+	  , partial(map, lambda p: bondReconPosition(date, p, portfolio or getPortfolioName()))
+	)(bondPositions)
+
+
+
+
+if __name__ == '__main__':
+	import logging.config
+	logging.config.fileConfig('logging.config', disable_existing_loggers=False)
+
+	import argparse
+	from boci_trustee.utility import getWorkers
+	parser = argparse.ArgumentParser(description='Convert BOCI valuation reports to Geneva recon files')
+	parser.add_argument('inputDir', help='directory tree of valuation reports, one folder per fund')
+	parser.add_argument('outputDir', help='where to write the recon files')
+	parser.add_argument('--workers', type=int, default=getWorkers())
+	args = parser.parse_args()
+
+	manifest = processValuationFiles(args.inputDir, args.outputDir, args.workers)
+	print('{0} files converted, {1} failed, manifest: {2}'.format(
+		len(list(filter(lambda e: e['status'] == 0, manifest)))
+	  , len(list(filter(lambda e: e['status'] != 0, manifest)))
+	  , writeManifest(join(args.outputDir, 'manifest.json'), manifest)))
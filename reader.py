@@ -0,0 +1,155 @@
+# coding=utf-8
+#
+# Read Bloomberg THRP xlsx files row by row, in read only mode, so that
+# memory usage stays flat no matter how large the input file is.
+#
+# Rows are read by position: the header line is resolved to column
+# positions once, then only the fields wanted are picked out of each row,
+# without building a dictionary. A whole sheet can also be read into
+# columns, for converters that work column at a time.
+#
+from openpyxl import load_workbook
+from operator import itemgetter
+from datetime import datetime
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+_excelEpoch = datetime(1899, 12, 30)
+
+
+
+def toCellValue(x):
+	"""
+	[Object] cell value from openpyxl => [Object] cell value
+
+	Convert cell values to the same form as steven_utils.excel.fileToLines()
+	gives, i.e., empty cell to '', numbers to float and date to Excel
+	ordinal, so that the converters work the same on both readers.
+	"""
+	return \
+	'' if x is None else \
+	x if isinstance(x, bool) else \
+	float(x) if isinstance(x, (int, float)) else \
+	(x - _excelEpoch).total_seconds() / 86400 if isinstance(x, datetime) else \
+	x
+
+
+
+def toLine(row):
+	"""
+	[Tuple] row => [List] line, with trailing empty cells removed
+	"""
+	line = list(map(toCellValue, row))
+	while len(line) > 0 and line[-1] == '':
+		line.pop()
+
+	return line
+
+
+
+def fileToLinesStreaming(file):
+	"""
+	[String] xlsx file => [Iterator] ([List] line)
+
+	Yield lines of the first worksheet one at a time. The workbook is opened
+	in read only mode, so only the current row is held in memory.
+	"""
+	logger.debug('fileToLinesStreaming(): {0}'.format(file))
+
+	wb = load_workbook(file, read_only=True, data_only=True)
+	try:
+		for row in wb.worksheets[0].iter_rows(values_only=True):
+			yield toLine(row)
+	finally:
+		wb.close()
+
+
+
+def getRowsFromLines(lines):
+	"""
+	[Iterator] lines => ([Tuple] headers, [Iterator] ([Sequence] row))
+
+	The first line is the headers, each line after it is a row, up to the
+	first empty line. A row shorter than the headers is padded with ''.
+	Lines are consumed lazily, one at a time.
+	"""
+	lines = iter(lines)
+	headers = tuple(next(lines, []))
+
+	def rows(n):
+		for line in lines:
+			if len(line) == 0 or line[0] == '':
+				return
+
+			yield line if len(line) >= n else tuple(line) + ('', ) * (n - len(line))
+
+
+	return headers, rows(len(headers))
+
+
+
+def getFieldGetter(headers, fields):
+	"""
+	[Sequence] headers, [Sequence] fields
+		=> [Function] ([Sequence] row => [Tuple] values of the fields)
+
+	Positions of the fields are resolved once. If a header appears more than
+	once, the last one is used, as a dictionary of the row would. A field
+	not in the headers raises KeyError.
+	"""
+	index = dict(map(reversed, enumerate(headers)))
+	positions = list(map(lambda field: index[field], fields))
+	return itemgetter(*positions) if len(positions) > 1 else \
+			(lambda row: (row[positions[0]], )) if len(positions) == 1 else \
+			(lambda row: ())
+
+
+
+def rowsToValues(fields, lines):
+	"""
+	[Sequence] fields, [Iterator] lines
+		=> [Iterator] ([Tuple] values of the fields, one for each row)
+
+	Rows of the sheet (see getRowsFromLines()), with only the fields picked
+	from each row, by position. The positions are resolved at the first row, so a
+	sheet without rows gives nothing, whatever its headers.
+	"""
+	headers, rows = getRowsFromLines(lines)
+	first = next(rows, None)
+	if first is None:
+		return
+
+	getter = getFieldGetter(headers, fields)
+	yield getter(first)
+	yield from map(getter, rows)
+
+
+
+def linesToColumns(fields, lines):
+	"""
+	[Sequence] fields, [Iterator] lines
+		=> [Dictionary] field -> [Tuple] values of the field, one for each row
+
+	Like rowsToValues(), but the whole sheet is read into columns, each
+	column is picked from all the rows in one pass. The lines after the
+	first empty line are read too, but left out.
+	"""
+	lines = iter(lines)
+	headers = tuple(next(lines, []))
+	rows = list(lines)
+	lengths = list(map(len, rows))
+	rows = rows[:lengths.index(0)] if 0 in lengths else rows
+	firsts = list(map(itemgetter(0), rows))
+	rows = rows[:firsts.index('')] if '' in firsts else rows
+	if len(rows) == 0:
+		return dict(map(lambda field: (field, ()), fields))
+
+	index = dict(map(reversed, enumerate(headers)))
+	positions = list(map(lambda field: index[field], fields))
+	n = len(headers)
+	if min(map(len, rows)) < n:
+		rows = list(map(lambda L: L if len(L) >= n else tuple(L) + ('', ) * (n - len(L)), rows))
+
+	return dict(map(lambda t: (t[0], tuple(map(itemgetter(t[1]), rows))), zip(fields, positions)))
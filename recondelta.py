@@ -0,0 +1,235 @@
+# coding=utf-8
+#
+# Day over day deltas of Geneva reconciliation positions.
+#
+# The recon positions of each portfolio and date are kept in a local SQLite
+# file, keyed by ISIN and currency for holdings, by currency for cash. The
+# positions of a date are compared with those of the latest earlier date in
+# the store, and only the positions added, removed or with a changed
+# quantity (balance for cash) are written to the delta file. Once a delta
+# is written, the store keeps only the positions of that date and the one it
+# was compared with, so that the same date can be run again.
+#
+from steven_utils.utility import writeCsv
+from itertools import chain
+from threading import Lock
+from os import makedirs
+from os.path import dirname
+import sqlite3, json
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+_connections = {}
+_connectionsLock = Lock()
+
+
+
+"""
+	[String] kind ('cash' or 'position') => [Tuple] fields of the key
+"""
+getKeyFields = lambda kind: \
+	('currency', ) if kind == 'cash' else ('ISIN', 'currency')
+
+
+
+"""
+	[String] kind ('cash' or 'position') => [String] the field compared
+"""
+getValueField = lambda kind: \
+	'balance' if kind == 'cash' else 'quantity'
+
+
+
+"""
+	[String] kind, [Dictionary] recon position => [String] key
+"""
+getPositionKey = lambda kind, position: \
+	'|'.join(map(lambda field: str(position[field]), getKeyFields(kind)))
+
+
+
+def openReconStore(file):
+	"""
+	[String] database file => [Connection] sqlite connection
+	"""
+	logger.debug('openReconStore(): {0}'.format(file))
+
+	if dirname(file) != '':
+		makedirs(dirname(file), exist_ok=True)
+
+	conn = sqlite3.connect(file, timeout=30, check_same_thread=False)
+	conn.execute(
+		'CREATE TABLE IF NOT EXISTS recon ( '
+		'portfolio TEXT NOT NULL, '
+		'kind TEXT NOT NULL, '
+		'date TEXT NOT NULL, '
+		'key TEXT NOT NULL, '
+		'position TEXT NOT NULL, '
+		'PRIMARY KEY (portfolio, kind, date, key))')
+	conn.commit()
+	return conn
+
+
+
+def getReconStore(file):
+	"""
+	[String] database file => [Connection] sqlite connection
+
+	One connection per database file per process.
+	"""
+	with _connectionsLock:
+		if not file in _connections:
+			_connections[file] = openReconStore(file)
+
+		return _connections[file]
+
+
+
+def getPreviousPositions(conn, portfolio, kind, date):
+	"""
+	[Connection] sqlite connection,
+	[String] portfolio,
+	[String] kind ('cash' or 'position'),
+	[String] date (yyyy-mm-dd)
+		=> ( [String] previous date, None if there is none
+		   , [Dictionary] key -> [Dictionary] recon position
+		   )
+
+	The positions of the latest date before the given date.
+	"""
+	previous = conn.execute(
+		'SELECT MAX(date) FROM recon WHERE portfolio = ? AND kind = ? AND date < ?'
+	  , (portfolio, kind, date)).fetchone()[0]
+
+	return \
+	(None, {}) if previous is None else \
+	( previous
+	, dict(map( lambda row: (row[0], json.loads(row[1]))
+			  , conn.execute(
+			  		'SELECT key, position FROM recon '
+			  		'WHERE portfolio = ? AND kind = ? AND date = ?'
+			  	  , (portfolio, kind, previous))))
+	)
+
+
+
+def savePositions(conn, portfolio, kind, date, positions):
+	"""
+	[Connection] sqlite connection,
+	[String] portfolio,
+	[String] kind ('cash' or 'position'),
+	[String] date (yyyy-mm-dd),
+	[Dictionary] key -> [Dictionary] recon position
+
+	Replace the positions of the portfolio on the date.
+	"""
+	with conn:
+		conn.execute(
+			'DELETE FROM recon WHERE portfolio = ? AND kind = ? AND date = ?'
+		  , (portfolio, kind, date))
+		conn.executemany(
+			'INSERT INTO recon (portfolio, kind, date, key, position) VALUES (?, ?, ?, ?, ?)'
+		  , map( lambda t: (portfolio, kind, date, t[0], json.dumps(dict(t[1]), default=str))
+		  	   , positions.items()))
+
+
+
+def prunePositions(conn, portfolio, kind, date):
+	"""
+	[Connection] sqlite connection,
+	[String] portfolio,
+	[String] kind ('cash' or 'position'),
+	[String] date (yyyy-mm-dd)
+		=> [Int] number of positions removed
+
+	Remove the positions of the portfolio before the date.
+	"""
+	with conn:
+		return conn.execute(
+			'DELETE FROM recon WHERE portfolio = ? AND kind = ? AND date < ?'
+		  , (portfolio, kind, date)).rowcount
+
+
+
+def getDeltas(kind, previous, current):
+	"""
+	[String] kind ('cash' or 'position'),
+	[Dictionary] key -> previous recon position,
+	[Dictionary] key -> current recon position
+		=> [List] ([String] action, [Dictionary] recon position)
+
+	action is 'add', 'remove' or 'change', sorted by key. A removed position
+	is the previous one, the others are the current one.
+	"""
+	field = getValueField(kind)
+	return list(map(
+		lambda key: \
+			('add', current[key]) if not key in previous else \
+			('remove', previous[key]) if not key in current else \
+			('change', current[key])
+	  , sorted(filter(
+	  		lambda key: not key in previous or not key in current \
+	  					or previous[key][field] != current[key][field]
+	  	  , set(previous) | set(current)))))
+
+
+
+def toPositionMap(kind, positions):
+	"""
+	[String] kind, [Iterable] ([Dictionary] recon position)
+		=> [Dictionary] key -> [Dictionary] recon position
+	"""
+	result = {}
+	for position in positions:
+		key = getPositionKey(kind, position)
+		if key in result:
+			logger.warning('toPositionMap(): duplicate {0} key {1}, the last one is kept'.format(
+							kind, key))
+		result[key] = position
+
+	return result
+
+
+
+"""
+	[String] recon file => [String] delta file
+"""
+getDeltaFile = lambda file: \
+	file[:-4] + '_delta.csv' if file.endswith('.csv') else file + '_delta'
+
+
+
+def writeReconDelta(conn, file, fields, kind, portfolio, date, positions):
+	"""
+	[Connection] sqlite connection,
+	[String] recon file,
+	[Tuple] recon fields,
+	[String] kind ('cash' or 'position'),
+	[String] portfolio,
+	[String] date (yyyy-mm-dd),
+	[Iterable] ([Dictionary] recon position)
+		=> [String] delta file
+
+	Side effect: write the delta file next to the recon file, with an extra
+	'action' column, save the positions as of the date in the store and
+	remove those before the previous date.
+	"""
+	current = toPositionMap(kind, positions)
+	previousDate, previous = getPreviousPositions(conn, portfolio, kind, date)
+	deltas = getDeltas(kind, previous, current)
+	logger.info('writeReconDelta(): {0} {1} {2} against {3}: {4} of {5} rows'.format(
+					portfolio, kind, date, previousDate, len(deltas), len(current)))
+
+	deltaFile = writeCsv( getDeltaFile(file)
+						, chain( [tuple(fields) + ('action', )]
+							   , map( lambda t: tuple(map(lambda f: t[1][f], fields)) + (t[0], )
+							   		, deltas))
+						, delimiter='|'
+						)
+	savePositions(conn, portfolio, kind, date, current)
+	if previousDate is not None:
+		prunePositions(conn, portfolio, kind, previousDate)
+
+	return deltaFile
@@ -0,0 +1,128 @@
+# coding=utf-8
+#
+# Compact record types for converter output.
+#
+# A record is a tuple of values in the order of its fields (the csv headers
+# of the output file), so a row costs one tuple instead of a dictionary
+# holding all the header strings. Values can still be read by field name,
+# like record['ISIN'], so code written for dictionaries keeps working, and
+# the csv writer takes the values by position without any lookup.
+#
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+class Record(tuple):
+	"""
+	Base class of record types, use makeRecordType() to create one.
+
+	Iterating a record gives its values (like a tuple), keys(), values(),
+	items() and get() work like those of a dictionary.
+	"""
+	__slots__ = ()
+	_fields = ()
+	_index = {}
+
+
+	def __getitem__(self, key):
+		return tuple.__getitem__(self, key) if isinstance(key, (int, slice)) else \
+				tuple.__getitem__(self, self._index[key])
+
+
+	def __contains__(self, key):
+		return key in self._index
+
+
+	def __eq__(self, other):
+		return dict(self.items()) == other if isinstance(other, dict) else \
+				tuple.__eq__(self, other)
+
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+
+	__hash__ = tuple.__hash__
+
+
+	def __repr__(self):
+		return '{0}({1})'.format( type(self).__name__
+								, ', '.join(map( lambda t: '{0!r}: {1!r}'.format(*t)
+											   , self.items())))
+
+
+	def __reduce__(self):
+		return (type(self), (tuple(self), ))
+
+
+	def get(self, key, default=None):
+		return self[key] if key in self._index else default
+
+
+	def keys(self):
+		return self._fields
+
+
+	def values(self):
+		return tuple(self)
+
+
+	def items(self):
+		return zip(self._fields, self)
+
+
+	def replace(self, d):
+		"""
+		[Dictionary] field -> value => [Record] a new record with the
+			values of those fields replaced
+		"""
+		unknown = list(filter(lambda field: not field in self._index, d))
+		if len(unknown) > 0:
+			raise KeyError(unknown[0])
+
+		return type(self)(map(lambda t: d.get(t[0], t[1]), self.items()))
+
+
+	@classmethod
+	def fromDict(cls, d):
+		"""
+		[Dictionary] d => [Record] record, fields not in d are ''
+		"""
+		return cls(map(lambda field: d.get(field, ''), cls._fields))
+
+
+
+def makeRecordType(name, fields, module=None):
+	"""
+	[String] type name,
+	[Iterable] ([String] field name),
+	[String] module where the type is assigned to a variable of the same
+		name, so that records can be pickled to worker processes
+		=> [Type] record type
+
+	Create a record by passing its values in the order of fields, like
+	BociTrade(values).
+	"""
+	fields = tuple(fields)
+	if len(set(fields)) < len(fields):
+		logger.error('makeRecordType(): duplicate fields in {0}'.format(name))
+		raise ValueError
+
+	recordType = type(name, (Record, ), { '__slots__': ()
+									   , '_fields': fields
+									   , '_index': dict(map(reversed, enumerate(fields)))
+									   })
+	if module is not None:
+		recordType.__module__ = module
+
+	return recordType
+
+
+
+"""
+	[Object] item, [Tuple] headers => [Bool] the item is a record whose
+		fields start with the headers, so its values can be written by position
+"""
+isPositional = lambda item, headers: \
+	isinstance(item, Record) and item._fields[:len(headers)] == headers
@@ -5,15 +5,13 @@
 # 
 # It assumes repo master information is already in the repo database.
 # 
-from aim_xml.add_header import isRepoTrade, isRepoRerate
 from aim_xml.repo_xml import getRepoTradeFromFile, getRepoRerateFromFile
 from repo_data.data import initializeDatastore, getRepo
 from repo_data.repo_datastore import isRepoOpenTrade, isRepoCloseTrade, isRepoCancelTrade
-from steven_utils.file import getFiles
+from boci_trustee.snapshot import getSnapshotPaths
 from boci_trustee.utility import getCurrentDir
+from boci_trustee.datecodec import isoToDateString
 from toolz.functoolz import compose
-from itertools import chain
-from functools import partial, reduce
 import logging
 logger = logging.getLogger(__name__)
 
@@ -58,13 +56,7 @@ def getRepoTradeFiles(directory):
 	"""
 	logger.debug('getRepoTradeFiles(): {0}'.format(directory))
 
-	return \
-	compose(
-		checkAtMostOne
-	  , list
-	  , partial(filter, isRepoTrade)
-	  , lambda directory: getFiles(directory, True)
-	)(directory)
+	return checkAtMostOne(getSnapshotPaths(directory, 'repoXml'))
 
 
 
@@ -78,40 +70,61 @@ def getRepoRerateFiles(directory):
 	"""
 	logger.debug('getRepoRerateFiles(): {0}'.format(directory))
 	
+	return checkAtMostOne(getSnapshotPaths(directory, 'rerate'))
+
+
+
+def getRepoTradeBucket(trade):
+	"""
+	[Dictionary] repo trade data => [Int] 0: open, 1: close, 2: cancel
+	"""
 	return \
-	compose(
-		checkAtMostOne
-	  , list
-	  , partial(filter, isRepoRerate)
-	  , lambda directory: getFiles(directory, True)
-	)(directory)
+	0 if isRepoOpenTrade(trade) else \
+	1 if isRepoCloseTrade(trade) else \
+	2 if isRepoCancelTrade(trade) else \
+	lognRaise('invalid trade type: {0}'.format(trade))
+
+
+
+def partitionRepoTrades(trades):
+	"""
+	[Iterable] ([Dictionary] repo trade data) => 
+		( [List] ([Dictionary] repo trade data)
+		, [List] ([Dictionary] repo close trade data)
+		, [List] ([Dictionary] repo cancel trade data)
+		)
+
+	Split the trades into open, close and cancel trades in one pass.
+	"""
+	buckets = ([], [], [])
+	for trade in trades:
+		buckets[getRepoTradeBucket(trade)].append(trade)
+
+	return buckets
 
 
 
-def readRepoTradeFile(file):
+def readRepoTradeFile(file, lazy=False):
 	"""
-	[String] file => 
+	[String] file,
+	[Bool] lazy
+		=> 
 		( [Iterable] ([Dictionary] repo trade data)
 		, [Iterable] ([Dictionary] repo close trade data)
 		, [Iterable] ([Dictionary] repo cancel trade data)
 		)
+
+	When lazy, nothing is held in memory, each of the three iterables reads
+	the file on its own when iterated and picks out its own trades.
 	"""
 	logger.debug('readRepoTradeFile(): {0}'.format(file))
 
-	def lognRaise(msg):
-		logger.error(msg)
-		raise ValueError
-
+	getBucket = lambda i: \
+		filter( lambda trade: getRepoTradeBucket(trade) == i
+			  , getRepoTradeFromFile(file))
 
-	def addTrade(acc, el):
-		return \
-		(chain(acc[0], [el]), acc[1], acc[2]) if isRepoOpenTrade(el) else \
-		(acc[0], chain(acc[1], [el]), acc[2]) if isRepoCloseTrade(el) else \
-		(acc[0], acc[1], chain(acc[2], [el])) if isRepoCancelTrade(el) else \
-		lognRaise('invalid trade type: {0}'.format(el))
-
-
-	return reduce(addTrade, getRepoTradeFromFile, ([], [], []))
+	return tuple(map(getBucket, range(3))) if lazy else \
+			partitionRepoTrades(getRepoTradeFromFile(file))
 
 
 
@@ -153,11 +166,7 @@ def lognRaise(msg):
 
 
 # [String] dt (yyyy-mm-ddTHH:MM:SS) => [String] dd/mm/yyyy
-changeDateFormat = compose(
-	lambda L: L[2] + '/' + L[1] + '/' + L[0]
-  , lambda s: s.split('-')
-  , lambda s: s.split('T')[0]
-)
+changeDateFormat = isoToDateString
 
 
 
@@ -237,69 +246,113 @@ def bociTrade(repoMaster, tradeInfo):
 
 
 
-def bociClose(oldRepoTrade, currentRepoTrade, closeInfo):
+"""
+	[Iterable] ([Dictionary] repo trade, close or rerate data) => [Set] UserTranId1
+"""
+getUserTranIds = lambda items: \
+	set(map(lambda el: el['UserTranId1'], items))
+
+
+
+def getOpenPosition(oldRepoTrade, currentRepoTrade, userTranId1):
 	"""
 	[Dictionary] old repo trade info (from data base)
 	[Dictionary] current repo trade (from trade file)
-	[Dictionary] repo close trade data 
-		=> [Dictionary] boci repo close data
+	[String] userTranId1
+		=> [Dictionary] open position, or None if not found
+
+	The position fields come from the old repo trade if it is there, except
+	ISIN, which comes from the current repo trade first.
 	"""
-	logger.debug('bociClose(): {0}'.format(tradeInfo['UserTranId1']))
+	old = oldRepoTrade.get(userTranId1)
+	current = currentRepoTrade.get(userTranId1)
+	if old is None and current is None:
+		return None
 
-	getCurrency = lambda oldRepoTrade, currentRepoTrade, userTranId1: \
-		oldRepoTrade[userTranId1]['Currency'] if userTranId1 in oldRepoTrade else \
-		currentRepoTrade[userTranId1]['CounterInvestment'] if userTranId1 in currentRepoTrade \
-		else lognRaise('failed to get currency')
+	isin = getCollateralISIN(current['Investment']) if current is not None else \
+			old['CollateralID'] if old['CollateralIDType'] == 'ISIN' else \
+			None
+	if isin is None:
+		return None
 
+	return \
+	{ 'Currency': old['Currency'] if old is not None else current['CounterInvestment']
+	, 'Amount': old['LoanAmount'] if old is not None else current['NetCounterAmount']
+	, 'ISIN': isin
+	, 'Quantity': (old or current)['Quantity']
+	, 'Broker': (old or current)['Broker']
+	}
+
+
+
+def joinOpenPositions(getPosition, events):
+	"""
+	[Function] ([String] UserTranId1 => [Dictionary] open position or None),
+	[Iterable] ([Dictionary] close or rerate data)
+		=> [List] ([Dictionary] close or rerate data, with its open position
+					under the key 'Open')
+
+	A hash join of the events against their open positions: each distinct
+	UserTranId1 of the batch is resolved once. If any of them has no open
+	position, all of them are reported and ValueError is raised.
+	"""
+	events = list(events)
+	positions = dict(map( lambda id: (id, getPosition(id))
+						, getUserTranIds(events)))
 
-	getAmount = lambda oldRepoTrade, currentRepoTrade, userTranId1: \
-		oldRepoTrade[userTranId1]['LoanAmount'] if userTranId1 in oldRepoTrade else \
-		currentRepoTrade[userTranId1]['NetCounterAmount'] if userTranId1 in currentRepoTrade \
-		else lognRaise('failed to get amount')
+	unmatched = sorted(filter(lambda id: positions[id] is None, positions))
+	if len(unmatched) > 0:
+		lognRaise('joinOpenPositions(): no open position for {0}'.format(unmatched))
 
+	return list(map( lambda el: dict(el, Open=positions[el['UserTranId1']])
+				   , events))
 
-	getISIN = lambda oldRepoTrade, currentRepoTrade, userTranId1: \
-		getCollateralISIN(currentRepoTrade[userTranId1]['Investment']) \
-		if userTranId1 in currentRepoTrade else \
-		oldRepoTrade[userTranId1]['CollateralID'] if userTranId1 in oldRepoTrade \
-		and oldRepoTrade[userTranId1]['CollateralIDType'] == 'ISIN' else \
-		lognRaise('failed to get ISIN')
 
 
-	getQuantity = lambda oldRepoTrade, currentRepoTrade, userTranId1: \
-		oldRepoTrade[userTranId1]['Quantity'] if userTranId1 in oldRepoTrade else \
-		currentRepoTrade[userTranId1]['Quantity'] if userTranId1 in currentRepoTrade \
-		else lognRaise('failed to get quantity')
+"""
+	[Dictionary] old repo trade info (from data base)
+	[Dictionary] current repo trade (from trade file)
+	[Iterable] ([Dictionary] repo close trade data)
+		=> [List] ([Dictionary] repo close trade data with open position)
+"""
+joinClosePositions = lambda oldRepoTrade, currentRepoTrade, closeInfos: \
+	joinOpenPositions(
+		lambda id: getOpenPosition(oldRepoTrade, currentRepoTrade, id)
+	  , closeInfos)
 
 
-	getBroker = lambda oldRepoTrade, currentRepoTrade, userTranId1: \
-		oldRepoTrade[userTranId1]['Broker'] if userTranId1 in oldRepoTrade else \
-		currentRepoTrade[userTranId1]['Broker'] if userTranId1 in currentRepoTrade \
-		else lognRaise('failed to get broker')
 
+def bociClose(closeInfo):
+	"""
+	[Dictionary] repo close trade data with open position (from 
+		joinClosePositions())
+		=> [Dictionary] boci repo close data
+	"""
+	logger.debug('bociClose(): {0}'.format(closeInfo['UserTranId1']))
 
+	position = closeInfo['Open']
 	return \
-	{ 'Portfolio_code': getAccountNumber(tradeInfo['Portfolio'])
-	, 'Txn_type': getRepoType(tradeInfo['TransactionType'])
+	{ 'Portfolio_code': getAccountNumber(closeInfo['Portfolio'])
+	, 'Txn_type': getRepoType(closeInfo['TransactionType'])
 	, 'Txn_sub_type': 'Close'
 	, 'Trade_date': ''
 	, 'Settle_date': ''
-	, 'Mature_date': changeDateFormat(tradeInfo['ActualSettleDate'])
-	, 'Loan_ccy': getCurrency(oldRepoTrade, currentRepoTrade, tradeInfo['userTranId1'])
-	, 'Amount': getAmount(oldRepoTrade, currentRepoTrade, tradeInfo['userTranId1'])
+	, 'Mature_date': changeDateFormat(closeInfo['ActualSettleDate'])
+	, 'Loan_ccy': position['Currency']
+	, 'Amount': position['Amount']
 	, 'Eff_date': ''
 	, 'Int_rate': ''
 	, 'Int_mode': ''
-	, 'Col_ISIN': getISIN(oldRepoTrade, currentRepoTrade, tradeInfo['userTranId1'])
+	, 'Col_ISIN': position['ISIN']
 	, 'Col_SEDOL': ''
 	, 'Col_Bloomberg': ''
 	, 'Col_LocalCode': ''
 	, 'Col_CMUCode': ''
 	, 'Col_desc': ''
-	, 'Col_Qty': getQuantity(oldRepoTrade, currentRepoTrade, tradeInfo['userTranId1'])
-	, 'Broker': getQuantity(oldRepoTrade, currentRepoTrade, tradeInfo['userTranId1'])
+	, 'Col_Qty': position['Quantity']
+	, 'Broker': position['Broker']
 	, 'Exchange': ''
-	, 'Cust_ref': tradeInfo['UserTranId1']
+	, 'Cust_ref': closeInfo['UserTranId1']
 	}
 
 
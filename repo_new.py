@@ -4,16 +4,23 @@
 # to BOCI-Prudential repo trade file format.
 # 
 # It assumes repo master information is already in the repo database.
+#
+# getBociRepoRecords() is the entry point of this XML flow, it has no caller
+# yet: main.py converts the Bloomberg xlsx repo file through OLD_repo.py.
+# It is also the only user of the local repo cache (see loadRepoData()).
 # 
-from aim_xml.add_header import isRepoTrade, isRepoRerate
-from aim_xml.repo_xml import getRepoTradeFromFile, getRepoRerateFromFile
+from aim_xml.repo_xml import getRepoRerateFromFile
 from repo_data.data import initializeDatastore, getRepo
-from repo_data.repo_datastore import isRepoOpenTrade, isRepoCloseTrade, isRepoCancelTrade
-from steven_utils.file import getFiles
-from boci_trustee.utility import getCurrentDir
+from boci_trustee.snapshot import getSnapshotPaths
+from boci_trustee.utility import getCurrentDir, getRepoCacheFile, getRepoCacheMaxAge
+from boci_trustee.datecodec import isoToDateString
+from boci_trustee.repo import readRepoTradeFile, getUserTranIds, joinOpenPositions
+from boci_trustee.repocache import getRepoCache, syncRepoCache
+from boci_trustee.mapping import field, getSources, getHeaders, makeMappingRecordType \
+								, compileMapper
 from toolz.functoolz import compose
 from itertools import chain
-from functools import partial, reduce
+from os.path import join
 import logging
 logger = logging.getLogger(__name__)
 
@@ -62,13 +69,7 @@ def getRepoTradeFiles(directory):
 	"""
 	logger.debug('getRepoTradeFiles(): {0}'.format(directory))
 
-	return \
-	compose(
-		checkAtMostOne
-	  , list
-	  , partial(filter, isRepoTrade)
-	  , lambda directory: getFiles(directory, True)
-	)(directory)
+	return checkAtMostOne(getSnapshotPaths(directory, 'repoXml'))
 
 
 
@@ -82,40 +83,7 @@ def getRepoRerateFiles(directory):
 	"""
 	logger.debug('getRepoRerateFiles(): {0}'.format(directory))
 	
-	return \
-	compose(
-		checkAtMostOne
-	  , list
-	  , partial(filter, isRepoRerate)
-	  , lambda directory: getFiles(directory, True)
-	)(directory)
-
-
-
-def readRepoTradeFile(file):
-	"""
-	[String] file => 
-		( [Iterable] ([Dictionary] repo trade data)
-		, [Iterable] ([Dictionary] repo close trade data)
-		, [Iterable] ([Dictionary] repo cancel trade data)
-		)
-	"""
-	logger.debug('readRepoTradeFile(): {0}'.format(file))
-
-	def lognRaise(msg):
-		logger.error(msg)
-		raise ValueError
-
-
-	def addTrade(acc, el):
-		return \
-		(chain(acc[0], [el]), acc[1], acc[2]) if isRepoOpenTrade(el) else \
-		(acc[0], chain(acc[1], [el]), acc[2]) if isRepoCloseTrade(el) else \
-		(acc[0], acc[1], chain(acc[2], [el])) if isRepoCancelTrade(el) else \
-		lognRaise('invalid trade type: {0}'.format(el))
-
-
-	return reduce(addTrade, getRepoTradeFromFile, ([], [], []))
+	return checkAtMostOne(getSnapshotPaths(directory, 'rerate'))
 
 
 
@@ -141,12 +109,35 @@ def readRepoRerateFile(file):
 
 
 
-getBociRepoHeaders = lambda: \
-	[ 'Portfolio_code',	'Txn_type',	'Txn_sub_type',	'Trade_date', 'Settle_date'
-	, 'Mature_date', 'Loan_ccy', 'Amount', 'Eff_date', 'Int_rate', 'Int_mode'
-	, 'Col_ISIN', 'Col_SEDOL', 'Col_Bloomberg',	'Col_LocalCode', 'Col_CMUCode'
-	, 'Col_desc', 'Col_Qty', 'Broker', 'Exchange', 'Cust_ref'
-	]
+def fetchRepoData(ids):
+	"""
+	[List] ([String] UserTranId1)
+		=> [Dictionary] UserTranId1 -> [Dictionary] repo data
+
+	Load repo master data of the ids from the repo datastore, ids not in
+	the datastore are left out.
+	"""
+	logger.debug('fetchRepoData(): {0} ids'.format(len(ids)))
+
+	repoData = getRepo()
+	return dict(map( lambda id: (id, repoData[id])
+				   , filter(lambda id: id in repoData, ids)))
+
+
+
+def loadRepoData(ids):
+	"""
+	[Iterable] ([String] UserTranId1)
+		=> [Dictionary] UserTranId1 -> [Dictionary] repo data
+
+	Look up the ids in the local repo cache if there is one, only the ids
+	not cached yet, or cached longer ago than the max age in the config, are
+	loaded from the datastore.
+	"""
+	file = getRepoCacheFile()
+	return fetchRepoData(list(ids)) if file == '' else \
+			syncRepoCache( getRepoCache(join(getCurrentDir(), file)), fetchRepoData, ids
+						 , maxAge=getRepoCacheMaxAge())
 
 
 
@@ -157,11 +148,7 @@ def lognRaise(msg):
 
 
 # [String] dt (yyyy-mm-ddTHH:MM:SS) => [String] dd/mm/yyyy
-changeDateFormat = compose(
-	lambda L: L[2] + '/' + L[1] + '/' + L[0]
-  , lambda s: s.split('-')
-  , lambda s: s.split('T')[0]
-)
+changeDateFormat = isoToDateString
 
 
 
@@ -177,7 +164,14 @@ getAccountNumber = lambda accountCode: \
 
 
 
+"""
+	[String] transaction type => [String] BOCI repo type
+
+	A missing transaction type is an error.
+"""
 getRepoType = lambda transactionType: \
+	lognRaise('getRepoType(): missing transaction type') \
+	if transactionType in ('', None) else \
 	'REPO' if transactionType == 'ReverseRepo_InsertUpdate' else 'REPO'
 
 
@@ -204,74 +198,132 @@ getISIN = lambda sidType, sid: \
 
 
 
-def bociTrade(repoData, tradeInfo):
-	"""
-	[Dictionary] repo data from datastore ([String] user tran id -> [Dictionary])
-	[Dictionary] repo trade data from xml
-		=> [Dictionary] boci repo trade
-	"""
-	logger.debug('bociTrade(): {0}'.format(tradeInfo['UserTranId1']))
-
-	return \
-	{ 'Portfolio_code': getAccountNumber(tradeInfo['Portfolio'])
-	, 'Txn_type': getRepoType(tradeInfo['TransactionType'])
-	, 'Txn_sub_type': 'Open'
-	, 'Trade_date': changeDateFormat(tradeInfo['EventDate'])
-	, 'Settle_date': changeDateFormat(tradeInfo['SettleDate'])
-	, 'Mature_date': '31/12/2049' if tradeInfo['ActualSettleDate'] == 'CALC' else \
-					changeDateFormat(tradeInfo['ActualSettleDate'])
-	, 'Loan_ccy': tradeInfo['CounterInvestment']
-	, 'Amount': tradeInfo['NetCounterAmount']
-	, 'Eff_date': changeDateFormat(tradeInfo['SettleDate'])
-	, 'Int_rate': tradeInfo['Coupon']
-	, 'Int_mode': repoData[tradeInfo['UserTranId1']]['DayCount']
-	, 'Col_ISIN': getCollateralISIN(tradeInfo['Investment'])
-	, 'Col_SEDOL': ''
-	, 'Col_Bloomberg': ''
-	, 'Col_LocalCode': ''
-	, 'Col_CMUCode': ''
-	, 'Col_desc': ''
-	, 'Col_Qty': tradeInfo['Quantity']
-	, 'Broker': tradeInfo['Broker']
-	, 'Exchange': ''
-	, 'Cust_ref': tradeInfo['UserTranId1']
-	}
-
-
-
-def bociClose(repoData, closeInfo):
-	"""
+"""
+	[String] dt (yyyy-mm-ddTHH:MM:SS or 'CALC') => [String] dd/mm/yyyy
+"""
+toMatureDate = lambda dt: \
+	'31/12/2049' if dt == 'CALC' else changeDateFormat(dt)
+
+
+
+"""
+	=> [Tuple] mappings from repo trade, close and rerate data to boci repo
+		trades, see mapping.py. The repo data of a trade, close or rerate is
+		read from its key 'Open', like 'Open.DayCount'.
+"""
+getBociTradeMapping = lambda: \
+	( field('Portfolio_code', 'Portfolio', getAccountNumber)
+	, field('Txn_type', 'TransactionType', getRepoType)
+	, field('Txn_sub_type', value='Open')
+	, field('Trade_date', 'EventDate', changeDateFormat)
+	, field('Settle_date', 'SettleDate', changeDateFormat)
+	, field('Mature_date', 'ActualSettleDate', toMatureDate)
+	, field('Loan_ccy', 'CounterInvestment')
+	, field('Amount', 'NetCounterAmount')
+	, field('Eff_date', 'SettleDate', changeDateFormat)
+	, field('Int_rate', 'Coupon')
+	, field('Int_mode', 'Open.DayCount')
+	, field('Col_ISIN', 'Investment', getCollateralISIN)
+	, field('Col_SEDOL')
+	, field('Col_Bloomberg')
+	, field('Col_LocalCode')
+	, field('Col_CMUCode')
+	, field('Col_desc')
+	, field('Col_Qty', 'Quantity')
+	, field('Broker', 'Broker')
+	, field('Exchange')
+	, field('Cust_ref', 'UserTranId1')
+	)
+
+
+
+getBociCloseMapping = lambda: \
+	( field('Portfolio_code', 'Open.Portfolio', getAccountNumber)
+	, field('Txn_type', 'TransactionType', getRepoType)
+	, field('Txn_sub_type', value='Close')
+	, field('Trade_date')
+	, field('Settle_date')
+	, field('Mature_date', 'ActualSettleDate', changeDateFormat)
+	, field('Loan_ccy', 'Open.Currency')
+	, field('Amount', 'Open.CollateralValue')
+	, field('Eff_date')
+	, field('Int_rate')
+	, field('Int_mode')
+	, field('Col_ISIN', ('Open.CollateralIDType', 'Open.CollateralID'), getISIN)
+	, field('Col_SEDOL')
+	, field('Col_Bloomberg')
+	, field('Col_LocalCode')
+	, field('Col_CMUCode')
+	, field('Col_desc')
+	, field('Col_Qty', 'Open.Quantity')
+	, field('Broker', 'Open.Broker')
+	, field('Exchange')
+	, field('Cust_ref', 'UserTranId1')
+	)
+
+
+
+getBociRerateMapping = lambda: \
+	( field('Portfolio_code', 'Open.Portfolio', getAccountNumber)
+	, field('Txn_type', 'Open.TransactionType', getRepoType)
+	, field('Txn_sub_type', value='Change Rate')
+	, field('Trade_date')
+	, field('Settle_date')
+	, field('Mature_date')
+	, field('Loan_ccy')
+	, field('Amount')
+	, field('Eff_date', 'RateDate', changeDateFormat)
+	, field('Int_rate', 'Rate')
+	, field('Int_mode', 'Open.DayCount')
+	, field('Col_ISIN')
+	, field('Col_SEDOL')
+	, field('Col_Bloomberg')
+	, field('Col_LocalCode')
+	, field('Col_CMUCode')
+	, field('Col_desc')
+	, field('Col_Qty')
+	, field('Broker')
+	, field('Exchange')
+	, field('Cust_ref', 'UserTranId1')
+	)
+
+
+
+getBociRepoHeaders = lambda: getHeaders(getBociTradeMapping())
+
+
+
+BociRepoRecord = makeMappingRecordType('BociRepoRecord', getBociTradeMapping(), __name__)
+
+
+
+"""
+	[Dictionary] repo trade data from xml, with its repo data under the key
+		'Open' (from joinRepoData())
+		=> [BociRepoRecord] boci repo trade
+"""
+bociTrade = compileMapper( 'bociTrade', getSources(getBociTradeMapping())
+						 , getBociTradeMapping(), BociRepoRecord, True, __name__)
+
+
+
+"""
 	[Dictionary] repo data from datastore ([String] user tran id -> [Dictionary])
-	[Dictionary] repo close trade data from xml
-		=> [Dictionary] boci repo close data
-	"""
-	logger.debug('bociClose(): {0}'.format(tradeInfo['UserTranId1']))
-
-	return \
-	{ 'Portfolio_code': getAccountNumber(repoData[tradeInfo['userTranId1']]['Portfolio'])
-	, 'Txn_type': getRepoType(tradeInfo['TransactionType'])
-	, 'Txn_sub_type': 'Close'
-	, 'Trade_date': ''
-	, 'Settle_date': ''
-	, 'Mature_date': changeDateFormat(tradeInfo['ActualSettleDate'])
-	, 'Loan_ccy': repoData[tradeInfo['userTranId1']]['Currency']
-	, 'Amount': repoData[tradeInfo['userTranId1']]['CollateralValue']
-	, 'Eff_date': ''
-	, 'Int_rate': ''
-	, 'Int_mode': ''
-	, 'Col_ISIN': getISIN( repoData[tradeInfo['userTranId1']]['CollateralIDType']
-						 , repoData[tradeInfo['userTranId1']]['CollateralID']
-						 )
-	, 'Col_SEDOL': ''
-	, 'Col_Bloomberg': ''
-	, 'Col_LocalCode': ''
-	, 'Col_CMUCode': ''
-	, 'Col_desc': ''
-	, 'Col_Qty': repoData[tradeInfo['userTranId1']]['Quantity']
-	, 'Broker': repoData[tradeInfo['userTranId1']]['Broker']
-	, 'Exchange': ''
-	, 'Cust_ref': tradeInfo['UserTranId1']
-	}
+	[Iterable] ([Dictionary] repo trade, close or rerate data)
+		=> [List] ([Dictionary] trade, close or rerate data, with its repo data
+					under the key 'Open')
+"""
+joinRepoData = lambda repoData, events: \
+	joinOpenPositions(repoData.get, events)
+
+
+
+"""
+	[Dictionary] repo close trade data with repo data (from joinRepoData())
+		=> [BociRepoRecord] boci repo close data
+"""
+bociClose = compileMapper( 'bociClose', getSources(getBociCloseMapping())
+						 , getBociCloseMapping(), BociRepoRecord, True, __name__)
 
 
 
@@ -285,37 +337,37 @@ def bociCancel(repoData, cancelInfo):
 
 
 
-def bociRerate(repoData, rerateInfo):
-	"""
-	[Dictionary] repo data from datastore ([String] user tran id -> [Dictionary])
-	[Dictionary] repo rerate data => [Dictionary] boci repo rerate data
-	"""
-	logger.debug('bociRerate(): {0}'.format(tradeInfo['UserTranId1']))
-
-	return \
-	{ 'Portfolio_code': getAccountNumber(repoData[tradeInfo['userTranId1']]['Portfolio'])
-	, 'Txn_type': getRepoType(tradeInfo['TransactionType'])
-	, 'Txn_sub_type': 'Change Rate'
-	, 'Trade_date': ''
-	, 'Settle_date': ''
-	, 'Mature_date': ''
-	, 'Loan_ccy': ''
-	, 'Amount': ''
-	, 'Eff_date': changeDateFormat(rerateInfo['RateDate'])
-	, 'Int_rate': rerateInfo['Rate']
-	, 'Int_mode': repoData[tradeInfo['UserTranId1']]['DayCount']
-	, 'Col_ISIN': ''
-	, 'Col_SEDOL': ''
-	, 'Col_Bloomberg': ''
-	, 'Col_LocalCode': ''
-	, 'Col_CMUCode': ''
-	, 'Col_desc': ''
-	, 'Col_Qty': ''
-	, 'Broker': ''
-	, 'Exchange': ''
-	, 'Cust_ref': tradeInfo['UserTranId1']
-	}
-
+"""
+	[Dictionary] repo rerate data with repo data (from joinRepoData())
+		=> [BociRepoRecord] boci repo rerate data
+"""
+bociRerate = compileMapper( 'bociRerate', getSources(getBociRerateMapping())
+						  , getBociRerateMapping(), BociRepoRecord, True, __name__)
 
 
 
+def getBociRepoRecords(directory):
+	"""
+	[String] directory
+		=> [List] ([BociRepoRecord] boci repo trades, closes and rerates)
+
+	Steps 1 to 3 above: read the repo xml trade file and rerate file in the
+	directory (either may be absent), load the repo data of all their
+	UserTranId1 in one go through loadRepoData(), then convert the trades,
+	closes and rerates. Cancel trades need manual processing, if there are
+	any, ValueError is raised.
+	"""
+	logger.debug('getBociRepoRecords(): {0}'.format(directory))
+
+	tradeFiles, rerateFiles = getRepoTradeFiles(directory), getRepoRerateFiles(directory)
+	trades, closes, cancels = \
+		readRepoTradeFile(tradeFiles[0]) if len(tradeFiles) > 0 else ([], [], [])
+	rerates = list(readRepoRerateFile(rerateFiles[0])) if len(rerateFiles) > 0 else []
+	if len(cancels) > 0:
+		lognRaise('getBociRepoRecords(): cancel trades {0}'.format(
+					sorted(getUserTranIds(cancels))))
+
+	repoData = loadRepoData(getUserTranIds(chain(trades, closes, rerates)))
+	return list(chain( map(bociTrade, joinRepoData(repoData, trades))
+					 , map(bociClose, joinRepoData(repoData, closes))
+					 , map(bociRerate, joinRepoData(repoData, rerates))))
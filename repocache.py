@@ -0,0 +1,173 @@
+# coding=utf-8
+#
+# A local SQLite cache of repo master data, keyed by UserTranId1.
+#
+# The repo conversion needs the master data of every UserTranId1 in the
+# input file. Instead of loading it from the repo datastore on each run,
+# the data is kept in a local database file: ids of a file are looked up in
+# one query, only the ids not in the cache yet, or synced longer ago than
+# the max age, are fetched from the datastore, and they are saved for the
+# next run.
+#
+# The datastore is passed in as a function ([List] ids => [Dictionary]
+# id -> repo data), so the cache can be tested with a stand-in datastore.
+#
+from datetime import datetime, timedelta
+from threading import Lock
+import sqlite3, json
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+# sqlite allows 999 host parameters per statement in older versions
+QUERY_BATCH_SIZE = 500
+
+_connections = {}
+_connectionsLock = Lock()
+
+
+
+def openRepoCache(file):
+	"""
+	[String] database file => [Connection] sqlite connection
+
+	Create the repo table if it does not exist.
+	"""
+	logger.debug('openRepoCache(): {0}'.format(file))
+
+	conn = sqlite3.connect(file, check_same_thread=False)
+	conn.execute(
+		'CREATE TABLE IF NOT EXISTS repo ( '
+		'UserTranId1 TEXT PRIMARY KEY, '
+		'data TEXT NOT NULL, '
+		'synced TEXT NOT NULL)')
+	conn.commit()
+	return conn
+
+
+
+def getRepoCache(file):
+	"""
+	[String] database file => [Connection] sqlite connection
+
+	One connection per database file per process.
+	"""
+	with _connectionsLock:
+		if not file in _connections:
+			_connections[file] = openRepoCache(file)
+
+		return _connections[file]
+
+
+
+def closeRepoCaches():
+	with _connectionsLock:
+		for conn in _connections.values():
+			conn.close()
+
+		_connections.clear()
+
+
+
+def batches(items, n):
+	"""
+	[Iterable] items, [Int] n => [Iterator] ([List] items), at most n each
+	"""
+	items = list(items)
+	return map(lambda i: items[i:i+n], range(0, len(items), n))
+
+
+
+def queryRepoCache(conn, ids, since=''):
+	"""
+	[Connection] sqlite connection,
+	[Iterable] ([String] UserTranId1),
+	[String] since (yyyy-mm-ddTHH:MM:SS), only entries synced since then
+		=> [Dictionary] UserTranId1 -> [Dictionary] repo data
+
+	Ids not in the cache, or synced before since, are left out of the result.
+	"""
+	result = {}
+	for batch in batches(set(ids), QUERY_BATCH_SIZE):
+		result.update(map(
+			lambda row: (row[0], json.loads(row[1]))
+		  , conn.execute(
+		  		'SELECT UserTranId1, data FROM repo WHERE UserTranId1 IN ({0}) '
+		  		'AND synced >= ?'.format(','.join('?' * len(batch)))
+		  	  , batch + [since])))
+
+	return result
+
+
+
+def saveRepoCache(conn, repoData):
+	"""
+	[Connection] sqlite connection,
+	[Dictionary] UserTranId1 -> [Dictionary] repo data
+		=> [Int] number of entries saved
+
+	Insert the entries, or replace them if they are in the cache already.
+	"""
+	synced = datetime.now().isoformat(timespec='seconds')
+	with conn:
+		conn.executemany(
+			'INSERT OR REPLACE INTO repo (UserTranId1, data, synced) VALUES (?, ?, ?)'
+		  , map( lambda t: (t[0], json.dumps(t[1], default=str), synced)
+		  	   , repoData.items()))
+
+	return len(repoData)
+
+
+
+def syncRepoCache(conn, fetch, ids, refresh=False, maxAge=None):
+	"""
+	[Connection] sqlite connection,
+	[Function] ([List] ids => [Dictionary] id -> repo data) datastore,
+	[Iterable] ([String] UserTranId1),
+	[Bool] refresh,
+	[Int] max age in seconds of a cached entry, None for no limit
+		=> [Dictionary] UserTranId1 -> [Dictionary] repo data
+
+	Return the repo data of all the ids. Ids missing from the cache or
+	synced more than max age ago (all the ids if refresh is True) are fetched
+	from the datastore in one call and saved to the cache. An id not found
+	in the datastore either raises KeyError.
+	"""
+	ids = set(ids)
+	since = '' if maxAge is None else \
+			(datetime.now() - timedelta(seconds=maxAge)).isoformat(timespec='seconds')
+	cached = {} if refresh else queryRepoCache(conn, ids, since)
+	missing = sorted(ids - set(cached))
+	logger.debug('syncRepoCache(): {0} cached, {1} to fetch'.format(
+					len(cached), len(missing)))
+
+	if len(missing) > 0:
+		fetched = fetch(missing)
+		notFound = list(filter(lambda id: not id in fetched, missing))
+		if len(notFound) > 0:
+			logger.error('syncRepoCache(): not in datastore: {0}'.format(notFound))
+			raise KeyError(notFound[0])
+
+		saveRepoCache(conn, dict(map(lambda id: (id, fetched[id]), missing)))
+		cached.update(map(lambda id: (id, fetched[id]), missing))
+
+	return cached
+
+
+
+def evictRepoCache(conn, ids):
+	"""
+	[Connection] sqlite connection, [Iterable] ([String] UserTranId1)
+		=> [Int] number of entries removed
+
+	For repo data changed in the datastore, so that it is fetched again on
+	the next sync.
+	"""
+	with conn:
+		return sum(map(
+			lambda batch: conn.execute(
+				'DELETE FROM repo WHERE UserTranId1 IN ({0})'.format(
+					','.join('?' * len(batch)))
+			  , batch).rowcount
+		  , batches(set(ids), QUERY_BATCH_SIZE)))
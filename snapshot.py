@@ -0,0 +1,158 @@
+# coding=utf-8
+#
+# Take one snapshot of an input directory per run, and classify every file
+# in it into buckets (trade, fx, repo, repo xml, rerate, valuation) in a
+# single pass, so that the directory is scanned only once.
+#
+# A run is the block of a snapshotRun() context, outside of it every lookup
+# scans the directory again, so a long running process (like watch.py)
+# never sees stale contents.
+#
+from contextlib import contextmanager
+from os import scandir
+from os.path import join
+from threading import Lock
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+"""
+	[String] directory => [Dictionary] bucket -> [List] file names, of the
+		current run, None when there is no run
+"""
+_snapshots = None
+_snapshotsLock = Lock()
+
+
+
+isTradeFile = lambda name: \
+	name.startswith('TD') and name.endswith('.xlsx')
+
+isFXFile = lambda name: \
+	name.startswith('FX') and name.endswith('.xlsx')
+
+isRepoFile = lambda name: \
+	name.startswith('REPO') and name.endswith('.xlsx')
+
+isValuationFile = lambda name: \
+	name.endswith('.xls')
+
+
+
+def getClassifiers():
+	"""
+	=> [List] ([String] bucket, [Function] ([String] file name, [String] path)
+				=> [Bool])
+
+	A file goes into the first bucket whose classifier accepts it. The repo
+	xml and rerate classifiers come from aim_xml, if it is not installed,
+	those two buckets are left out of the snapshot, and looking them up
+	is an error.
+	"""
+	try:
+		from aim_xml.add_header import isRepoTrade, isRepoRerate
+		xmlClassifiers = \
+			[ ('repoXml', lambda name, path: isRepoTrade(path))
+			, ('rerate', lambda name, path: isRepoRerate(path))
+			]
+	except ImportError:
+		logger.error('getClassifiers(): aim_xml not installed, repo xml and '
+					 'rerate files are not classified')
+		xmlClassifiers = []
+
+	return \
+	[ ('trade', lambda name, path: isTradeFile(name))
+	, ('fx', lambda name, path: isFXFile(name))
+	, ('repo', lambda name, path: isRepoFile(name))
+	] + xmlClassifiers + \
+	[ ('valuation', lambda name, path: isValuationFile(name))
+	]
+
+
+
+def takeSnapshot(directory):
+	"""
+	[String] directory => [Dictionary] bucket -> [List] file names
+
+	Scan the directory once, put each file into its bucket. Files that
+	do not belong to any bucket are left out.
+	"""
+	logger.debug('takeSnapshot(): {0}'.format(directory))
+
+	classifiers = getClassifiers()
+	snapshot = dict(map(lambda t: (t[0], []), classifiers))
+	with scandir(directory) as entries:
+		for entry in sorted(filter(lambda e: e.is_file(), entries), key=lambda e: e.name):
+			for bucket, classify in classifiers:
+				if classify(entry.name, entry.path):
+					snapshot[bucket].append(entry.name)
+					break
+
+	return snapshot
+
+
+
+def getSnapshot(directory):
+	"""
+	[String] directory => [Dictionary] bucket -> [List] file names
+
+	Within a run, return the snapshot of the directory, take it if not taken
+	yet. Outside a run, take a new snapshot every time.
+	"""
+	with _snapshotsLock:
+		if _snapshots is None:
+			return takeSnapshot(directory)
+
+		if not directory in _snapshots:
+			_snapshots[directory] = takeSnapshot(directory)
+
+		return _snapshots[directory]
+
+
+
+@contextmanager
+def snapshotRun():
+	"""
+	Within the block, each directory is scanned once and later lookups get
+	the same snapshot. The snapshots are dropped when the block exits.
+	"""
+	global _snapshots
+	with _snapshotsLock:
+		_snapshots = {}
+
+	try:
+		yield
+	finally:
+		with _snapshotsLock:
+			_snapshots = None
+
+
+
+def getBucket(snapshot, bucket):
+	"""
+	[Dictionary] snapshot, [String] bucket => [List] file names
+	"""
+	if not bucket in snapshot:
+		logger.error('getBucket(): {0} files cannot be classified, is aim_xml '
+					 'installed?'.format(bucket))
+		raise ValueError
+
+	return snapshot[bucket]
+
+
+
+"""
+	[String] directory, [String] bucket => [List] file names
+"""
+getSnapshotFiles = lambda directory, bucket: \
+	list(getBucket(getSnapshot(directory), bucket))
+
+
+
+"""
+	[String] directory, [String] bucket => [List] full path of files
+"""
+getSnapshotPaths = lambda directory, bucket: \
+	list(map( lambda name: join(directory, name)
+			, getBucket(getSnapshot(directory), bucket)))
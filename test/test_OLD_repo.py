@@ -3,7 +3,8 @@
 
 import unittest2
 from boci_trustee.utility import getCurrentDir
-from boci_trustee.OLD_repo import getRepoTrades
+from boci_trustee.OLD_repo import getRepoTrades, getRepoTickets \
+								, groupTicketsExternal, groupTickets
 from steven_utils.excel import fileToLines
 from steven_utils.iter import firstOf
 from os.path import join
@@ -34,6 +35,20 @@ class TestRepo(unittest2.TestCase):
 
 
 
+	def testGroupTicketsExternal(self):
+		inputFile = join(getCurrentDir(), 'samples', 'sample_repo_trade1.xlsx')
+		lines = list(fileToLines(inputFile))
+		trades = list(getRepoTrades(lines, maxGroups=7))
+		self.assertEqual(60, len(trades))
+		self.assertEqual( sorted(map(lambda t: str(sorted(t.items())), getRepoTrades(lines)))
+						, sorted(map(lambda t: str(sorted(t.items())), trades)))
+
+		tickets = list(getRepoTickets(lines))
+		self.assertEqual( list(groupTickets(tickets))
+						, list(groupTicketsExternal(tickets, 1000)))
+
+
+
 	def verifyTrade1(self, trade):
 		self.assertEqual('666666', trade['Portfolio_code'])
 		self.assertEqual('REPO', trade['Txn_type'])
@@ -0,0 +1,47 @@
+# coding=utf-8
+# 
+
+import unittest2
+from boci_trustee.benchmark import generateFXFile, generateRepoFile, runCase \
+								, getValuationRows
+from boci_trustee.fx import getFXTrades
+from boci_trustee.OLD_repo import getRepoTrades
+from steven_utils.excel import fileToLines
+from tempfile import TemporaryDirectory
+from os.path import join
+
+
+
+class TestBenchmark(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestBenchmark, self).__init__(*args, **kwargs)
+
+
+
+	def testGenerators(self):
+		with TemporaryDirectory() as tempDir:
+			fxFile, rows = generateFXFile(join(tempDir, 'FX.xlsx'), 20)
+			self.assertEqual(20, rows)
+			self.assertEqual(20, len(list(getFXTrades(fileToLines(fxFile)))))
+
+			repoFile, rows = generateRepoFile(join(tempDir, 'REPO.xlsx'), 21)
+			self.assertEqual(20, rows)
+			trades = list(getRepoTrades(fileToLines(repoFile)))
+			self.assertEqual(10, len(trades))
+			self.assertEqual(5, len(list(filter(lambda t: t['Txn_sub_type'] == 'Close', trades))))
+
+
+
+	def testRunCase(self):
+		with TemporaryDirectory() as tempDir:
+			fxFile, _ = generateFXFile(join(tempDir, 'FX.xlsx'), 20)
+			result = runCase('fx', fxFile, 20, tempDir)
+			self.assertEqual(['read', 'convert', 'write'], list(result['stages']))
+			self.assertEqual(20, result['rows'])
+
+
+
+	def testValuationRows(self):
+		self.assertEqual(1000, getValuationRows(1000))
+		self.assertEqual(32668, getValuationRows(1000000))
@@ -0,0 +1,89 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.columnar import columnarSink, getColumnarFile, toDate, toFloat \
+								, isArrowAvailable
+from boci_trustee.writer import writeCsvAtomic
+from boci_trustee.fx import getFXCsvHeaders, FXRecord
+from tempfile import TemporaryDirectory
+from datetime import date
+from os.path import join, exists
+import os
+
+
+
+class TestColumnar(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestColumnar, self).__init__(*args, **kwargs)
+
+
+
+	def testConverters(self):
+		self.assertEqual(date(2021, 1, 13), toDate('13/01/2021'))
+		self.assertEqual(date(2021, 1, 13), toDate('2021-01-13'))
+		self.assertEqual(None, toDate(''))
+		self.assertEqual(1.5, toFloat('1.5'))
+		self.assertEqual(None, toFloat(''))
+		self.assertEqual( join('out', 'FX1.parquet')
+						, getColumnarFile(join('out', 'FX1.csv'), 'parquet'))
+		self.assertEqual( join('cols', 'FX1.arrow')
+						, getColumnarFile(join('out', 'FX1.csv'), 'arrow', 'cols'))
+
+
+
+	def testNoFormat(self):
+		with columnarSink('', ['a'], '') as sink:
+			record = {'a': 1}
+			self.assertTrue(sink(record) is record)
+
+
+
+	@unittest2.skipIf(not isArrowAvailable(), 'pyarrow not installed')
+	def testColumnarFile(self):
+		import pyarrow.parquet as pq
+		import pyarrow as pa
+		records = list(map(lambda i: FXRecord(
+					( '40006', '', str(i), '', '13/01/2021', '15/01/2021', 'Spot', ''
+					, 'USD', 100.0 + i, 'HKD', 775.0, '', '', '', '')), range(5)))
+
+		with TemporaryDirectory() as tempDir:
+			for fmt in ('parquet', 'arrow'):
+				csvFile = join(tempDir, 'FX1.csv')
+				file = getColumnarFile(csvFile, fmt)
+				with columnarSink(file, getFXCsvHeaders(), fmt, batchSize=2) as sink:
+					writeCsvAtomic(csvFile, getFXCsvHeaders(), map(sink, records))
+
+				table = pq.read_table(file) if fmt == 'parquet' else \
+						pa.ipc.open_file(file).read_all()
+				self.assertEqual(5, table.num_rows)
+				self.assertEqual(pa.date32(), table.schema.field('Trade Date').type)
+				self.assertEqual(pa.float64(), table.schema.field('Client Buy Amount').type)
+				self.assertEqual( [100.0, 101.0, 102.0, 103.0, 104.0]
+								, table.column('Client Buy Amount').to_pylist())
+				self.assertEqual(date(2021, 1, 15), table.column('Settlement Date')[0].as_py())
+				self.assertEqual(None, table.column('Exchange Rate')[0].as_py())
+
+			# a failed write leaves no columnar file behind
+			file = join(tempDir, 'FX2.parquet')
+			with self.assertRaises(ValueError):
+				with columnarSink(file, getFXCsvHeaders(), 'parquet') as sink:
+					sink(records[0])
+					raise ValueError
+
+			self.assertFalse(exists(file))
+			self.assertEqual(['FX1.arrow', 'FX1.csv', 'FX1.parquet'], sorted(os.listdir(tempDir)))
+
+			# a value that cannot be converted is written as null, the csv
+			# file is written all the same
+			bad = FXRecord(( '40006', '', '9', '', '31/02/2021', '15/01/2021', 'Spot', ''
+						   , 'USD', 'n/a', 'HKD', 775.0, '', '', '', ''))
+			csvFile, file = join(tempDir, 'FX3.csv'), join(tempDir, 'FX3.parquet')
+			with columnarSink(file, getFXCsvHeaders(), 'parquet') as sink:
+				writeCsvAtomic(csvFile, getFXCsvHeaders(), map(sink, records[:1] + [bad]))
+
+			self.assertTrue(exists(csvFile))
+			table = pq.read_table(file)
+			self.assertEqual([100.0, None], table.column('Client Buy Amount').to_pylist())
+			self.assertEqual([date(2021, 1, 13), None], table.column('Trade Date').to_pylist())
@@ -0,0 +1,30 @@
+# coding=utf-8
+# 
+
+import unittest2
+from boci_trustee.datecodec import excelOrdinalToDateString, shortDateToDateString \
+								, isoToDateString, bloombergToDateString, toDateStrings
+
+
+
+class TestDateCodec(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestDateCodec, self).__init__(*args, **kwargs)
+
+
+
+	def testDateCodec(self):
+		self.assertEqual('07/10/2020', excelOrdinalToDateString(44111.0))
+		self.assertEqual('28/12/2020', shortDateToDateString('28/12/20'))
+		self.assertEqual('05/01/2021', isoToDateString('2021-01-05T00:00:00'))
+		self.assertEqual('01/02/2021', bloombergToDateString(44228.0))
+		self.assertEqual('30/12/2020', bloombergToDateString('30/12/20'))
+
+
+
+	def testToDateStrings(self):
+		self.assertEqual( ['07/10/2020', '09/10/2020', '07/10/2020']
+						, toDateStrings([44111.0, 44113.0, 44111.0]))
+		self.assertEqual( ['28/12/2020', '01/02/2021']
+						, toDateStrings(['28/12/20', 44228.0], bloombergToDateString))
@@ -3,7 +3,7 @@
 
 import unittest2
 from boci_trustee.utility import getCurrentDir
-from boci_trustee.fx import getFXTrades
+from boci_trustee.fx import getFXTrades, getFXTradesBatch
 from steven_utils.excel import fileToLines
 from os.path import join
 
@@ -25,6 +25,30 @@ class TestFX(unittest2.TestCase):
 
 
 
+	def testFxBatch(self):
+		inputFile = join(getCurrentDir(), 'samples', 'sample_fx.xlsx')
+		lines = list(fileToLines(inputFile))
+		self.assertEqual(list(getFXTrades(lines)), getFXTradesBatch(lines))
+
+		lines = [ ['FX TRADES'], []
+				, [ 'Fund', 'Tkt #', 'As of Dt', 'Stl Date', 'FX Trade Deal Type'
+				  , 'Shrt Name', 'B/S', 'Amount Pennies', 'Price', 'Crcy']
+				, ['TEST', 296310.0, 44193.0, 44195.0, 'SPOT', 'USD/HKD 12/30/20', 'S', 10000.0, 7.7522, 'HKD']
+				, ['TEST', 296311.0, '28/12/20', '30/12/20', 'SPOT', 'USD/HKD 12/30/20', 'B', 1000.0, 7.7522, 'USD']
+				, ['TEST', 296312.0, 44193.0, 44224.0, 'FORWARD', 'EUR/USD 01/29/21', 'B', 500.0, 1.2, 'USD']
+				, []
+				, ['ignored after the first empty line']
+				]
+		trades = getFXTradesBatch(lines)
+		self.assertEqual(list(getFXTrades(lines)), trades)
+		self.assertEqual( [('HKD', 'USD'), ('USD', 'HKD'), ('EUR', 'USD')]
+						, list(map( lambda t: (t['Client Buy Currency'], t['Client Sell Currency'])
+								  , trades)))
+		self.assertEqual('28/12/2020', trades[1]['Trade Date'])
+		self.assertEqual([], getFXTradesBatch(lines[0:3]))
+
+
+
 	def verifyFX1(self, position):
 		self.assertEqual(position['Portfolio Code'], 'TEST')
 		self.assertEqual(position['Settlement Account'], '')
@@ -0,0 +1,93 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.ledger import openLedger, getContentHash, getEntry, isStageDone \
+							, isNotified, recordConversion, recordStage
+from tempfile import TemporaryDirectory
+from os.path import join
+import sqlite3
+
+
+
+class TestLedger(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestLedger, self).__init__(*args, **kwargs)
+
+
+
+	def testContentHash(self):
+		with TemporaryDirectory() as tempDir:
+			file1, file2 = join(tempDir, 'TD1.xlsx'), join(tempDir, 'TD2.xlsx')
+			for file in (file1, file2):
+				with open(file, 'wb') as f:
+					f.write(b'same content')
+
+			self.assertEqual(getContentHash(file1), getContentHash(file2))
+			with open(file2, 'ab') as f:
+				f.write(b', changed')
+
+			self.assertNotEqual(getContentHash(file1), getContentHash(file2))
+
+
+
+	def testStages(self):
+		with TemporaryDirectory() as tempDir:
+			conn = openLedger(join(tempDir, 'logs', 'ledger.db'))
+			self.assertEqual(None, getEntry(conn, 'abc'))
+			self.assertFalse(recordStage(conn, 'abc', 'notified'))
+
+			recordConversion( conn, 'abc', 'TD1.xlsx', 'trade', -1, '', 'TD1.csv', 0.5)
+			self.assertEqual('failed', getEntry(conn, 'abc')['stage'])
+			self.assertFalse(isNotified(getEntry(conn, 'abc')))
+			self.assertTrue(recordStage(conn, 'abc', 'notified'))
+			self.assertFalse(recordStage(conn, 'abc', 'notified'))
+			self.assertFalse(recordStage(conn, 'abc', 'archived'))
+			self.assertEqual('failed', getEntry(conn, 'abc')['stage'])
+			self.assertTrue(isNotified(getEntry(conn, 'abc')))
+			self.assertFalse(isStageDone(getEntry(conn, 'abc'), 'converted'))
+
+			# the same failure again stays notified
+			recordConversion( conn, 'abc', 'TD1.xlsx', 'trade', -1, '', 'TD1.csv', 0.5)
+			self.assertTrue(isNotified(getEntry(conn, 'abc')))
+
+			recordConversion( conn, 'abc', 'TD1.xlsx', 'trade', 1, 'warning', 'TD1.csv', 0.5)
+			entry = getEntry(conn, 'abc')
+			self.assertEqual('converted', entry['stage'])
+			self.assertEqual((1, 'warning', 'TD1.csv'), (entry['status'], entry['message'], entry['outputFile']))
+			self.assertEqual((None, None), (entry['tickets'], entry['outputHash']))
+			self.assertFalse(isNotified(entry))
+
+			recordConversion( conn, 'abc', 'TD1.xlsx', 'trade', 1, 'warning', 'TD1.csv', 0.5
+							, {'T2', 'T1'}, 'def')
+			entry = getEntry(conn, 'abc')
+			self.assertEqual((['T1', 'T2'], 'def'), (entry['tickets'], entry['outputHash']))
+
+			self.assertTrue(recordStage(conn, 'abc', 'archived'))
+			self.assertFalse(recordStage(conn, 'abc', 'notified'))
+			self.assertEqual('archived', getEntry(conn, 'abc')['stage'])
+			self.assertTrue(isStageDone(getEntry(conn, 'abc'), 'notified'))
+			conn.close()
+
+
+
+	def testOldLedger(self):
+		with TemporaryDirectory() as tempDir:
+			file = join(tempDir, 'ledger.db')
+			conn = sqlite3.connect(file)
+			conn.execute(
+				'CREATE TABLE ledger (hash TEXT PRIMARY KEY, file TEXT NOT NULL, '
+				'fileType TEXT NOT NULL, stage TEXT NOT NULL, status INTEGER, '
+				'message TEXT, outputFile TEXT, seconds REAL, updated TEXT NOT NULL)')
+			conn.execute(
+				"INSERT INTO ledger VALUES ('abc', 'TD1.xlsx', 'trade', 'archived', "
+				"0, '', 'TD1.csv', 0.5, '2021-01-12T10:00:00')")
+			conn.commit()
+			conn.close()
+
+			conn = openLedger(file)
+			entry = getEntry(conn, 'abc')
+			self.assertEqual(('archived', None), (entry['stage'], entry['tickets']))
+			self.assertTrue(isNotified(entry))
+			conn.close()
@@ -0,0 +1,141 @@
+# coding=utf-8
+#
+# Test the field mapping compiler, the mappings of each output format are
+# tested through their converters in the other tests.
+#
+
+import unittest2
+from boci_trustee.mapping import field, derived, getSources, getHeaders \
+								, makeMappingRecordType, compileMapper, mapColumns
+import pickle
+
+
+
+getSides = lambda side, amount: \
+	(amount, 0) if side == 'B' else (0, amount)
+
+
+
+getMapping = lambda: \
+	( derived(('buy', 'sell'), getSides, ('Side', 'Amount'))
+	, field('Code', 'Fund', str.upper)
+	, field('Type', value='FX')
+	, field('Buy', 'buy')
+	, field('Sell', 'sell')
+	, field('Rate', 'Rate', (float, lambda x: x * 100), when=('Side', ('B', )), default='n/a')
+	, field('Ref', ('Fund', 'Ticket'), lambda fund, ticket: fund + ticket)
+	, field('Hidden', 'Ticket', output=False)
+	)
+
+
+
+Sample = makeMappingRecordType('Sample', getMapping(), __name__)
+
+
+
+toSample = compileMapper('toSample', getSources(getMapping()), getMapping(), Sample, module=__name__)
+
+
+
+class TestMapping(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestMapping, self).__init__(*args, **kwargs)
+
+
+
+	def testHeaders(self):
+		self.assertEqual( ('Side', 'Amount', 'Fund', 'Rate', 'Ticket')
+						, getSources(getMapping()))
+		self.assertEqual( ['Code', 'Type', 'Buy', 'Sell', 'Rate', 'Ref']
+						, getHeaders(getMapping()))
+
+
+
+	def testPositional(self):
+		r = toSample('B', 100, 'abc', '0.5', '77')
+		self.assertEqual(('ABC', 'FX', 100, 0, 50.0, 'abc77', '77'), tuple(r))
+		self.assertEqual('77', r['Hidden'])
+
+		r = toSample('S', 100, 'abc', '0.5', '77')
+		self.assertEqual((0, 100, 'n/a'), (r['Buy'], r['Sell'], r['Rate']))
+		self.assertEqual(r, pickle.loads(pickle.dumps(r)))
+		self.assertTrue(pickle.loads(pickle.dumps(toSample)) is toSample)
+
+
+
+	def testByKey(self):
+		mapping = ( field('Code', 'Fund')
+				  , field('Type', value='FX')
+				  , field('Buy', 'Open.Amount')
+				  , field('Sell', 'Open.Amount', lambda x: -x)
+				  , field('Rate', 'Rate')
+				  , field('Ref', 'Ticket')
+				  , field('Hidden')
+				  )
+		mapper = compileMapper('mapper', getSources(mapping), mapping, Sample, True)
+		self.assertEqual( ('A', 'FX', 5, -5, 1.5, 'T1', '')
+						, tuple(mapper({'Fund': 'A', 'Rate': 1.5, 'Ticket': 'T1', 'Open': {'Amount': 5}})))
+		with self.assertRaises(KeyError) as context:
+			mapper({'Fund': 'A', 'Rate': 1.5, 'Ticket': 'T1', 'Open': {}})
+		self.assertEqual(('Open.Amount', ), context.exception.args)
+
+		with self.assertRaises(KeyError) as context:
+			mapper({'Fund': 'A', 'Rate': 1.5, 'Ticket': 'T1', 'Open': None})
+		self.assertEqual(('Open.Amount', ), context.exception.args)
+
+
+
+	def testTables(self):
+		calls = []
+		def getSidesOnce(side, amount):
+			calls.append('sides')
+			return getSides(side, amount)
+
+		def upper(fund):
+			calls.append('upper')
+			return fund.upper()
+
+		mapping = (derived(('buy', 'sell'), getSidesOnce, ('Side', 'Amount'), table=True), ) \
+				+ (field('Code', 'Fund', upper, table=True), ) + getMapping()[2:]
+		mapper = compileMapper('mapper', getSources(mapping), mapping, Sample, tables=True)
+		rows = [('B', 100, 'abc', '0.5', '77'), ('B', 100, 'abc', '0.5', '78'), ('S', 100, 'abc', '0.5', '79')]
+		self.assertEqual(list(map(lambda r: toSample(*r), rows)), list(map(lambda r: mapper(*r), rows)))
+		self.assertEqual(['sides', 'upper', 'sides'], calls)
+
+		# without tables, the table marks are ignored
+		mapper = compileMapper('mapper', getSources(mapping), mapping, Sample)
+		mapper(*rows[0])
+		mapper(*rows[0])
+		self.assertEqual(7, len(calls))
+
+
+
+	def testMapColumns(self):
+		rows = [('B', 100, 'abc', '0.5', '77'), ('S', 100, 'abc', '0.5', '78'), ('B', 50, 'xyz', '2', '79')]
+		columns = dict(zip(getSources(getMapping()), zip(*rows)))
+		self.assertEqual( list(map(lambda r: toSample(*r), rows))
+						, mapColumns('mapColumns', getMapping(), Sample, columns))
+
+		mapping = (derived(('buy', 'sell'), getSides, ('Side', 'Amount'), table=True), ) \
+				+ (field('Code', 'Fund', str.upper, table=True), ) + getMapping()[2:]
+		self.assertEqual( list(map(lambda r: toSample(*r), rows))
+						, mapColumns('mapColumns', mapping, Sample, columns))
+		self.assertEqual( []
+						, mapColumns( 'mapColumns', getMapping(), Sample
+									, dict(map(lambda s: (s, ()), getSources(getMapping())))))
+		with self.assertRaises(KeyError):
+			mapColumns('mapColumns', getMapping(), Sample, {'Fund': ()})
+
+
+
+	def testInvalidMapping(self):
+		with self.assertRaises(ValueError):
+			makeMappingRecordType('Bad', (field('a', output=False), field('b')))
+
+		with self.assertRaises(KeyError):
+			compileMapper('bad', ('Fund', ), getMapping(), Sample)
+
+		with self.assertRaises(ValueError):
+			compileMapper( 'bad', getSources(getMapping()), getMapping()[:-1]
+						 , Sample)
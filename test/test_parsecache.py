@@ -0,0 +1,133 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.parsecache import cachedLines, cachedValue, evictCache
+from tempfile import TemporaryDirectory
+from itertools import takewhile
+from os.path import join
+import os
+
+
+
+class TestParseCache(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestParseCache, self).__init__(*args, **kwargs)
+
+
+
+	def testCachedLines(self):
+		calls = []
+		def read(file):
+			calls.append(file)
+			return map(lambda i: [] if i == 1500 else ['row', float(i)], range(2500))
+
+
+		with TemporaryDirectory() as tempDir:
+			inputFile = join(tempDir, 'TD1.xlsx')
+			with open(inputFile, 'wb') as f:
+				f.write(b'workbook 1')
+
+			partialFile = join(tempDir, 'TD2.xlsx')
+			with open(partialFile, 'wb') as f:
+				f.write(b'workbook 2')
+
+			cacheDir = join(tempDir, 'cache')
+			expected = list(read(inputFile))
+			self.assertEqual( expected
+							, list(cachedLines('fileToLinesStreaming', read, inputFile, cacheDir)))
+			self.assertEqual( expected
+							, list(cachedLines('fileToLinesStreaming', read, inputFile, cacheDir)))
+			self.assertEqual(2, len(calls))		# one for expected, one for the miss
+
+			# stop at the first empty line, only the lines read go to the cache
+			lines = cachedLines('fileToLinesStreaming', read, partialFile, cacheDir)
+			self.assertEqual(1500, len(list(takewhile(lambda L: len(L) > 0, lines))))
+			lines.close()
+			self.assertEqual(3, len(calls))
+			lines = cachedLines('fileToLinesStreaming', read, partialFile, cacheDir)
+			self.assertEqual(1500, len(list(takewhile(lambda L: len(L) > 0, lines))))
+			self.assertEqual(3, len(calls))
+
+			# reading beyond the lines in the cache reads the rest from the file
+			self.assertEqual( expected
+							, list(cachedLines('fileToLinesStreaming', read, partialFile, cacheDir)))
+			self.assertEqual(4, len(calls))
+
+			# a changed file is parsed again
+			with open(inputFile, 'wb') as f:
+				f.write(b'workbook 3')
+			list(cachedLines('fileToLinesStreaming', read, inputFile, cacheDir))
+			self.assertEqual(5, len(calls))
+			self.assertEqual(3, len(os.listdir(cacheDir)))
+
+
+
+	def testFailedRead(self):
+		def read(file):
+			yield ['row', 1.0]
+			raise ValueError
+
+
+		with TemporaryDirectory() as tempDir:
+			inputFile = join(tempDir, 'TD1.xlsx')
+			with open(inputFile, 'wb') as f:
+				f.write(b'workbook 1')
+
+			with self.assertRaises(ValueError):
+				list(cachedLines('fileToLines', read, inputFile, tempDir))
+			self.assertEqual(['TD1.xlsx'], os.listdir(tempDir))
+
+
+
+	def testCachedValue(self):
+		calls = []
+		def parse(file):
+			calls.append(file)
+			return ('2021-01-12', None, None, iter([{'ISIN CODE': 'X1'}]), iter([]))
+
+		def parseLines(file):
+			calls.append(file)
+			return map(lambda i: ['row', float(i)], range(3))
+
+
+		with TemporaryDirectory() as tempDir:
+			inputFile = join(tempDir, 'report.xls')
+			with open(inputFile, 'wb') as f:
+				f.write(b'report')
+
+			cacheDir = join(tempDir, 'cache')
+			value = ('2021-01-12', None, None, [{'ISIN CODE': 'X1'}], [])
+			self.assertEqual(value, cachedValue('getValuationDataFromFile', parse, inputFile, cacheDir))
+			self.assertEqual(value, cachedValue('getValuationDataFromFile', parse, inputFile, cacheDir))
+			self.assertEqual(1, len(calls))
+			self.assertEqual('2021-01-12', cachedValue('getValuationDataFromFile', parse, inputFile, '')[0])
+			self.assertEqual(2, len(calls))
+
+			# a lazy value is cached as a list, apart from cached lines of
+			# the same parser
+			lines = [['row', 0.0], ['row', 1.0], ['row', 2.0]]
+			self.assertEqual(lines, cachedValue('fileToLines', parseLines, inputFile, cacheDir))
+			self.assertEqual(lines, cachedValue('fileToLines', parseLines, inputFile, cacheDir))
+			self.assertEqual(lines, list(cachedLines('fileToLines', parseLines, inputFile, cacheDir)))
+			self.assertEqual(lines, cachedValue('fileToLines', parseLines, inputFile, cacheDir))
+			self.assertEqual(4, len(calls))
+
+			# a value that cannot be pickled is not cached
+			self.assertEqual(2, cachedValue('fileToLinesStreaming', lambda f: (lambda: 2), inputFile, cacheDir)())
+			self.assertEqual(3, len(os.listdir(cacheDir)))
+
+
+
+	def testEvictCache(self):
+		with TemporaryDirectory() as tempDir:
+			for i, name in enumerate(['a.cache', 'b.cache', 'c.cache']):
+				with open(join(tempDir, name), 'wb') as f:
+					f.write(b'x' * 100)
+				os.utime(join(tempDir, name), ns=(i * 10**9, i * 10**9))
+
+			evictCache(tempDir, 250)
+			self.assertEqual(['b.cache', 'c.cache'], sorted(os.listdir(tempDir)))
+			evictCache(tempDir, 0)
+			self.assertEqual(2, len(os.listdir(tempDir)))
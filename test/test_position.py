@@ -4,9 +4,12 @@
 import unittest2
 from boci_trustee.utility import getCurrentDir
 from boci_trustee.position import getValuationDataFromFile \
-								, cashReconPosition, bondReconPosition
+								, cashReconPosition, bondReconPosition \
+								, processValuationFiles
 from functools import partial
-from os.path import join
+from tempfile import TemporaryDirectory
+from os.path import join, basename
+import shutil, os
 
 
 
@@ -54,4 +57,38 @@ class TestPosition(unittest2.TestCase):
 		self.assertEqual( 'THREE GORGES FINANCE I CAYMAN ISLANDS LTD 2.3% S/A 02JUN2021 REGS'
 						, position['name'])
 		self.assertEqual('USD', position['currency'])
-		self.assertEqual(6275000, position['quantity'])
\ No newline at end of file
+		self.assertEqual(6275000, position['quantity'])
+
+
+
+	def testProcessValuationFiles(self):
+		inputFile = join(getCurrentDir(), 'samples', 'sample 2021-01-12.xls')
+		with TemporaryDirectory() as inputDir, TemporaryDirectory() as outputDir:
+			for fund in ('Short Term Bond Fund', 'Unknown Fund'):
+				os.makedirs(join(inputDir, fund))
+				shutil.copy(inputFile, join(inputDir, fund))
+
+			manifest = processValuationFiles( inputDir, outputDir, 2
+											, {'short term bond fund': 'STBF'})
+			self.assertEqual(2, len(manifest))
+			self.assertEqual('STBF', manifest[0]['portfolio'])
+			self.assertEqual(0, manifest[0]['status'])
+			self.assertEqual( 'Short_Term_Bond_Fund_2021-01-12_cash.csv'
+							, basename(manifest[0]['cashFile']))
+			self.assertEqual( 'Short_Term_Bond_Fund_2021-01-12_position.csv'
+							, basename(manifest[0]['positionFile']))
+			self.assertEqual(-1, manifest[1]['status'])
+			self.assertEqual(2, len(os.listdir(outputDir)))
+
+
+
+	def testNoFundMapped(self):
+		inputFile = join(getCurrentDir(), 'samples', 'sample 2021-01-12.xls')
+		with TemporaryDirectory() as inputDir, TemporaryDirectory() as outputDir:
+			os.makedirs(join(inputDir, 'Any Fund'))
+			shutil.copy(inputFile, join(inputDir, 'Any Fund'))
+
+			manifest = processValuationFiles(inputDir, outputDir, 1, {})
+			self.assertEqual(1, len(manifest))
+			self.assertEqual(0, manifest[0]['status'])
+			self.assertEqual('Short Term Bond Fund', manifest[0]['portfolio'])
@@ -0,0 +1,62 @@
+# coding=utf-8
+# 
+
+import unittest2
+from boci_trustee.utility import getCurrentDir
+from boci_trustee.reader import fileToLinesStreaming, rowsToValues, linesToColumns
+from boci_trustee.fx import ticketToTrade
+from boci_trustee.trade import convert
+from boci_trustee.fx import getFXTrades
+from steven_utils.excel import fileToLines
+from os.path import join
+
+
+
+class TestReader(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestReader, self).__init__(*args, **kwargs)
+
+
+
+	def testFileToLinesStreaming(self):
+		inputFile = join(getCurrentDir(), 'samples', 'sample_repo_trade1.xlsx')
+		lines = list(fileToLinesStreaming(inputFile))
+		self.assertEqual(183, len(lines))
+		self.assertEqual(['China Life Franklin'], lines[0])
+		self.assertEqual( [218783.0, '40017-B', 44020.0, 43805.0, 'USD', 'B', '', 2442.0]
+						, lines[3][0:8])
+
+
+
+	def testRowsToValues(self):
+		lines = [['a', 'b', 'c', 'b'], [1, 2, 3, 8], [4], [], [5, 6, 7]]
+		self.assertEqual([(3, 8), ('', '')], list(rowsToValues(['c', 'b'], lines)))
+		self.assertEqual([(1, ), (4, )], list(rowsToValues(['a'], lines)))
+		with self.assertRaises(KeyError):
+			list(rowsToValues(['a', 'd'], lines))
+
+		# no rows, nothing to pick
+		self.assertEqual([], list(rowsToValues(['a', 'd'], [])))
+		self.assertEqual([], list(rowsToValues(['a', 'd'], lines[0:1])))
+		self.assertEqual([], list(rowsToValues(['a', 'd'], lines[0:1] + [[]] + lines[1:])))
+
+
+
+	def testLinesToColumns(self):
+		lines = [['a', 'b', 'c', 'b'], [1, 2, 3, 8], [4], ['', 9], [5, 6, 7]]
+		self.assertEqual({'c': (3, ''), 'b': (8, '')}, linesToColumns(['c', 'b'], lines))
+		self.assertEqual({'a': ()}, linesToColumns(['a'], lines[0:1]))
+		with self.assertRaises(KeyError):
+			linesToColumns(['a', 'd'], lines)
+
+
+
+	def testFXStreaming(self):
+		inputFile = join(getCurrentDir(), 'samples', 'sample_fx.xlsx')
+		self.assertEqual( list(getFXTrades(fileToLines(inputFile)))
+						, list(getFXTrades(fileToLinesStreaming(inputFile))))
+
+		# positional and dictionary rows give the same records
+		self.assertEqual( list(convert(ticketToTrade, fileToLines(inputFile)))
+						, list(getFXTrades(fileToLines(inputFile))))
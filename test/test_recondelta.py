@@ -0,0 +1,78 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.recondelta import openReconStore, getDeltas, writeReconDelta \
+									, getPreviousPositions
+from tempfile import TemporaryDirectory
+from os.path import join
+import csv
+
+
+
+class TestReconDelta(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestReconDelta, self).__init__(*args, **kwargs)
+
+
+
+	def testGetDeltas(self):
+		previous = { 'USD': {'currency': 'USD', 'balance': 100}
+				   , 'HKD': {'currency': 'HKD', 'balance': 50}
+				   , 'CNY': {'currency': 'CNY', 'balance': 10}
+				   }
+		current = { 'USD': {'currency': 'USD', 'balance': 100}
+				  , 'HKD': {'currency': 'HKD', 'balance': 60}
+				  , 'EUR': {'currency': 'EUR', 'balance': 5}
+				  }
+		self.assertEqual( [ ('remove', previous['CNY'])
+						  , ('add', current['EUR'])
+						  , ('change', current['HKD'])
+						  ]
+						, getDeltas('cash', previous, current))
+
+
+
+	def testWriteReconDelta(self):
+		fields = ('portfolio', 'date', 'ISIN', 'currency', 'quantity')
+		position = lambda date, isin, quantity: \
+			{'portfolio': 'STBF', 'date': date, 'ISIN': isin, 'currency': 'USD', 'quantity': quantity}
+
+		with TemporaryDirectory() as tempDir:
+			conn = openReconStore(join(tempDir, 'recon.db'))
+			day1 = [position('2021-01-12', 'X1', 100), position('2021-01-12', 'X2', 200)]
+			day2 = [position('2021-01-13', 'X1', 100), position('2021-01-13', 'X3', 300)]
+
+			file1 = join(tempDir, 'STBF_2021-01-12_position.csv')
+			deltaFile = writeReconDelta(conn, file1, fields, 'position', 'STBF', '2021-01-12', day1)
+			self.assertEqual(join(tempDir, 'STBF_2021-01-12_position_delta.csv'), deltaFile)
+			with open(deltaFile, newline='') as f:
+				self.assertEqual(3, len(list(csv.reader(f, delimiter='|'))))
+
+			file2 = join(tempDir, 'STBF_2021-01-13_position.csv')
+			with open(writeReconDelta(conn, file2, fields, 'position', 'STBF', '2021-01-13', day2), newline='') as f:
+				rows = list(csv.reader(f, delimiter='|'))
+
+			self.assertEqual(list(fields) + ['action'], rows[0])
+			self.assertEqual( [ ['STBF', '2021-01-12', 'X2', 'USD', '200', 'remove']
+							  , ['STBF', '2021-01-13', 'X3', 'USD', '300', 'add']
+							  ]
+							, rows[1:])
+
+			previousDate, previous = getPreviousPositions(conn, 'STBF', 'position', '2021-01-14')
+			self.assertEqual('2021-01-13', previousDate)
+			self.assertEqual(['X1|USD', 'X3|USD'], sorted(previous))
+
+			# only the latest date and the one before it are kept
+			day3 = [position('2021-01-14', 'X1', 150)]
+			file3 = join(tempDir, 'STBF_2021-01-14_position.csv')
+			writeReconDelta(conn, file3, fields, 'position', 'STBF', '2021-01-14', day3)
+			self.assertEqual( [('2021-01-13', ), ('2021-01-14', )]
+							, conn.execute('SELECT DISTINCT date FROM recon ORDER BY date').fetchall())
+
+			# running the same date again compares with the same previous date
+			with open(writeReconDelta(conn, file3, fields, 'position', 'STBF', '2021-01-14', day3), newline='') as f:
+				self.assertEqual( ['change', 'remove']
+								, sorted(map(lambda row: row[-1], list(csv.reader(f, delimiter='|'))[1:])))
+			conn.close()
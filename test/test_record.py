@@ -0,0 +1,57 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.record import makeRecordType
+from boci_trustee.writer import writeCsvAtomic
+from tempfile import TemporaryDirectory
+from os.path import join
+import pickle
+
+
+
+"""
+	Record types must be module level variables to be pickled.
+"""
+Sample = makeRecordType('Sample', ['a', 'b', 'c', 'extra'], __name__)
+
+
+
+class TestRecord(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestRecord, self).__init__(*args, **kwargs)
+
+
+
+	def testRecord(self):
+		r = Sample((1, 'x', 2.5, 'not output'))
+		self.assertEqual(4, len(r))
+		self.assertEqual('x', r['b'])
+		self.assertEqual('x', r[1])
+		self.assertEqual('', r.get('d', ''))
+		self.assertTrue('a' in r)
+		self.assertFalse('d' in r)
+		self.assertEqual({'a': 1, 'b': 'x', 'c': 2.5, 'extra': 'not output'}, r)
+		self.assertEqual(r, Sample.fromDict(dict(r)))
+		self.assertEqual(r, pickle.loads(pickle.dumps(r)))
+		with self.assertRaises(KeyError):
+			r['d']
+
+		with self.assertRaises(ValueError):
+			makeRecordType('Bad', ['a', 'a'])
+
+
+
+	def testWriteRecords(self):
+		with TemporaryDirectory() as tempDir:
+			outputFile = join(tempDir, 'TD1.csv')
+			records = [ Sample((1, 'x', 2.5, 'not output'))
+					  , {'a': 2, 'c': ''}
+					  ]
+			writeCsvAtomic(outputFile, ['a', 'b', 'c'], records)
+			writeCsvAtomic(join(tempDir, 'TD2.csv'), ['a', 'c'], records[0:1])
+			with open(outputFile, newline='') as f:
+				self.assertEqual('1,x,2.5\r\n2,,\r\n', f.read())
+			with open(join(tempDir, 'TD2.csv'), newline='') as f:
+				self.assertEqual('1,2.5\r\n', f.read())
@@ -0,0 +1,63 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.repo import joinClosePositions, joinOpenPositions, bociClose
+
+
+
+class TestRepo(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestRepo, self).__init__(*args, **kwargs)
+
+
+
+	def testJoinClosePositions(self):
+		oldRepoTrade = \
+		{ '1': { 'Currency': 'USD', 'LoanAmount': 1000000, 'Quantity': 1200000
+			   , 'Broker': 'BNP-REPO', 'CollateralIDType': 'ISIN'
+			   , 'CollateralID': 'XS1234567890'
+			   }
+		}
+		currentRepoTrade = \
+		{ '2': { 'CounterInvestment': 'HKD', 'NetCounterAmount': 500000
+			   , 'Quantity': 600000, 'Broker': 'HSBC'
+			   , 'Investment': 'Isin=XS0987654321'
+			   }
+		}
+		closeInfos = [ {'UserTranId1': '1', 'Portfolio': '60001'}
+					 , {'UserTranId1': '2', 'Portfolio': '60001'}
+					 , {'UserTranId1': '1', 'Portfolio': '60001'}
+					 ]
+		records = joinClosePositions(oldRepoTrade, currentRepoTrade, closeInfos)
+		self.assertEqual(3, len(records))
+		self.assertEqual( { 'Currency': 'USD', 'Amount': 1000000, 'ISIN': 'XS1234567890'
+						  , 'Quantity': 1200000, 'Broker': 'BNP-REPO'
+						  }
+						, records[0]['Open'])
+		self.assertEqual('XS0987654321', records[1]['Open']['ISIN'])
+		self.assertEqual('HKD', records[1]['Open']['Currency'])
+		self.assertEqual('60001', records[2]['Portfolio'])
+
+		record = bociClose(dict( records[1], TransactionType='ReverseRepo_InsertUpdate'
+							   , ActualSettleDate='2020-10-15T00:00:00'))
+		self.assertEqual('CLAMC STBD', record['Portfolio_code'])
+		self.assertEqual('15/10/2020', record['Mature_date'])
+		self.assertEqual(500000, record['Amount'])
+		self.assertEqual('HSBC', record['Broker'])
+
+
+
+	def testJoinOpenPositionsUnmatched(self):
+		calls = []
+		def getPosition(id):
+			calls.append(id)
+			return {'DayCount': 'Act/360'} if id == '1' else None
+
+		events = [{'UserTranId1': '1'}, {'UserTranId1': '1'}, {'UserTranId1': '3'}]
+		with self.assertRaises(ValueError):
+			joinOpenPositions(getPosition, events)
+
+		# each id is resolved once
+		self.assertEqual(['1', '3'], sorted(calls))
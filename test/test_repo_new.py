@@ -0,0 +1,89 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.repo_new import bociTrade, bociClose, bociRerate, joinRepoData \
+								, getBociRepoHeaders
+
+
+
+"""
+	Repo data of the datastore, and repo trade, close and rerate data as read
+	from the xml files.
+"""
+getRepoData = lambda: \
+	{ '1': { 'Portfolio': '60001', 'TransactionType': 'ReverseRepo_InsertUpdate'
+		   , 'DayCount': 'Act/360', 'Currency': 'USD', 'CollateralValue': 1000000
+		   , 'CollateralIDType': 'ISIN', 'CollateralID': 'XS1234567890'
+		   , 'Quantity': 1200000, 'Broker': 'BNP-REPO'
+		   }
+	}
+
+getTradeInfo = lambda: \
+	{ 'UserTranId1': '1', 'Portfolio': '60001'
+	, 'TransactionType': 'ReverseRepo_InsertUpdate'
+	, 'EventDate': '2020-10-12T00:00:00', 'SettleDate': '2020-10-13T00:00:00'
+	, 'ActualSettleDate': 'CALC', 'CounterInvestment': 'USD'
+	, 'NetCounterAmount': 1000000, 'Coupon': 1.25
+	, 'Investment': 'Isin=XS1234567890', 'Quantity': 1200000, 'Broker': 'BNP-REPO'
+	}
+
+getCloseInfo = lambda: \
+	{ 'UserTranId1': '1', 'TransactionType': 'ReverseRepo_InsertUpdate'
+	, 'ActualSettleDate': '2020-11-12T00:00:00'
+	}
+
+getRerateInfo = lambda: \
+	{'UserTranId1': '1', 'RateDate': '2020-10-20T00:00:00', 'Rate': 1.1}
+
+
+
+class TestRepoNew(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestRepoNew, self).__init__(*args, **kwargs)
+
+
+
+	def testBociTrade(self):
+		record = bociTrade(joinRepoData(getRepoData(), [getTradeInfo()])[0])
+		self.assertEqual(getBociRepoHeaders(), list(record.keys()))
+		self.assertEqual(
+			( 'CLAMC STBD', 'REPO', 'Open', '12/10/2020', '13/10/2020', '31/12/2049'
+			, 'USD', 1000000, '13/10/2020', 1.25, 'Act/360', 'XS1234567890'
+			, '', '', '', '', '', 1200000, 'BNP-REPO', '', '1')
+		  , tuple(record))
+
+
+
+	def testBociClose(self):
+		record = bociClose(joinRepoData(getRepoData(), [getCloseInfo()])[0])
+		self.assertEqual(
+			( 'CLAMC STBD', 'REPO', 'Close', '', '', '12/11/2020'
+			, 'USD', 1000000, '', '', '', 'XS1234567890'
+			, '', '', '', '', '', 1200000, 'BNP-REPO', '', '1')
+		  , tuple(record))
+
+
+
+	def testBociRerate(self):
+		record = bociRerate(joinRepoData(getRepoData(), [getRerateInfo()])[0])
+		self.assertEqual(
+			( 'CLAMC STBD', 'REPO', 'Change Rate', '', '', ''
+			, '', '', '20/10/2020', 1.1, 'Act/360', ''
+			, '', '', '', '', '', '', '', '', '1')
+		  , tuple(record))
+
+
+
+	def testMissingRepoData(self):
+		with self.assertRaises(ValueError):
+			joinRepoData({}, [getCloseInfo()])
+
+		with self.assertRaises(KeyError) as context:
+			bociClose(getCloseInfo())
+		self.assertEqual(('Open.Portfolio', ), context.exception.args)
+
+		with self.assertRaises(KeyError) as context:
+			bociRerate(getRerateInfo())
+		self.assertEqual(('Open.Portfolio', ), context.exception.args)
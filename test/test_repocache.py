@@ -0,0 +1,94 @@
+# coding=utf-8
+#
+
+import unittest2
+from boci_trustee.repocache import openRepoCache, queryRepoCache, syncRepoCache \
+								, evictRepoCache
+from tempfile import TemporaryDirectory
+from os.path import join
+
+
+
+class TestRepoCache(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestRepoCache, self).__init__(*args, **kwargs)
+
+
+
+	def setUp(self):
+		"""
+		A stand-in datastore, recording the ids fetched on each call.
+		"""
+		self.datastore = dict(map(
+			lambda i: ( str(i)
+					  , {'Portfolio': '60001', 'DayCount': 'Act/360', 'Quantity': i * 100}
+					  )
+		  , range(1, 1001)))
+		self.calls = []
+
+
+
+	def fetch(self, ids):
+		self.calls.append(list(ids))
+		return dict(map( lambda id: (id, self.datastore[id])
+					   , filter(lambda id: id in self.datastore, ids)))
+
+
+
+	def testSyncRepoCache(self):
+		with TemporaryDirectory() as tempDir:
+			conn = openRepoCache(join(tempDir, 'repo.db'))
+			ids = list(map(str, range(1, 701)))
+			repoData = syncRepoCache(conn, self.fetch, ids)
+			self.assertEqual(700, len(repoData))
+			self.assertEqual(3500, repoData['35']['Quantity'])
+			self.assertEqual(1, len(self.calls))
+
+			# only ids not cached are fetched
+			repoData = syncRepoCache(conn, self.fetch, map(str, range(601, 801)))
+			self.assertEqual(200, len(repoData))
+			self.assertEqual(list(map(str, range(701, 801))), sorted(self.calls[1], key=int))
+
+			# all cached, the datastore is not called
+			syncRepoCache(conn, self.fetch, ['1', '800'])
+			self.assertEqual(2, len(self.calls))
+			conn.close()
+
+			# the cache persists
+			conn = openRepoCache(join(tempDir, 'repo.db'))
+			self.assertEqual(800, len(queryRepoCache(conn, map(str, range(1, 1001)))))
+			conn.close()
+
+
+
+	def testSyncRepoCacheChanged(self):
+		with TemporaryDirectory() as tempDir:
+			conn = openRepoCache(join(tempDir, 'repo.db'))
+			syncRepoCache(conn, self.fetch, ['1', '2'])
+			self.datastore['1'] = {'Portfolio': 'TEST_R', 'DayCount': 'Act/365', 'Quantity': 5}
+			self.assertEqual('60001', syncRepoCache(conn, self.fetch, ['1'])['1']['Portfolio'])
+			self.assertEqual('TEST_R', syncRepoCache(conn, self.fetch, ['1'], True)['1']['Portfolio'])
+
+			# entries older than the max age are fetched again
+			self.datastore['1'] = {'Portfolio': '60001', 'DayCount': 'Act/365', 'Quantity': 6}
+			self.assertEqual(5, syncRepoCache(conn, self.fetch, ['1'], maxAge=3600)['1']['Quantity'])
+			with conn:
+				conn.execute("UPDATE repo SET synced = '2021-01-12T10:00:00'")
+			self.assertEqual(6, syncRepoCache(conn, self.fetch, ['1'], maxAge=3600)['1']['Quantity'])
+			self.assertEqual(['1'], self.calls[-1])
+
+			self.assertEqual(1, evictRepoCache(conn, ['2', '3']))
+			self.assertEqual(['1'], list(queryRepoCache(conn, ['1', '2'])))
+			conn.close()
+
+
+
+	def testSyncRepoCacheNotFound(self):
+		with TemporaryDirectory() as tempDir:
+			conn = openRepoCache(join(tempDir, 'repo.db'))
+			with self.assertRaises(KeyError):
+				syncRepoCache(conn, self.fetch, ['1', '9999'])
+
+			self.assertEqual({}, queryRepoCache(conn, ['1']))
+			conn.close()
@@ -0,0 +1,44 @@
+# coding=utf-8
+# 
+
+import unittest2
+from boci_trustee.snapshot import takeSnapshot, getSnapshotFiles, snapshotRun
+from tempfile import TemporaryDirectory
+from os.path import join
+import os
+
+
+
+class TestSnapshot(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestSnapshot, self).__init__(*args, **kwargs)
+
+
+
+	def testTakeSnapshot(self):
+		with TemporaryDirectory() as tempDir:
+			os.mkdir(join(tempDir, 'processed'))
+			for name in [ 'TD20201007.xlsx', 'FX20201228.xlsx', 'REPO20201111.xlsx'
+						, 'TD20201008.xlsx', 'sample 2021-01-12.xls', 'readme.txt']:
+				open(join(tempDir, name), 'w').close()
+
+			snapshot = takeSnapshot(tempDir)
+			self.assertEqual(['TD20201007.xlsx', 'TD20201008.xlsx'], snapshot['trade'])
+			self.assertEqual(['FX20201228.xlsx'], snapshot['fx'])
+			self.assertEqual(['REPO20201111.xlsx'], snapshot['repo'])
+			self.assertEqual(['sample 2021-01-12.xls'], snapshot['valuation'])
+
+
+
+	def testSnapshotRun(self):
+		with TemporaryDirectory() as tempDir:
+			open(join(tempDir, 'TD1.xlsx'), 'w').close()
+			with snapshotRun():
+				self.assertEqual(['TD1.xlsx'], getSnapshotFiles(tempDir, 'trade'))
+				open(join(tempDir, 'TD2.xlsx'), 'w').close()
+				self.assertEqual(['TD1.xlsx'], getSnapshotFiles(tempDir, 'trade'))
+
+			self.assertEqual(['TD1.xlsx', 'TD2.xlsx'], getSnapshotFiles(tempDir, 'trade'))
+			os.remove(join(tempDir, 'TD1.xlsx'))
+			self.assertEqual(['TD2.xlsx'], getSnapshotFiles(tempDir, 'trade'))
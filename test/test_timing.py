@@ -0,0 +1,47 @@
+# coding=utf-8
+# 
+
+import unittest2
+from boci_trustee.timing import timeStage, timeIterable, withTimingRecords \
+							, addRecords, getRunSummary, clearRecords
+from time import sleep
+
+
+
+class TestTiming(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestTiming, self).__init__(*args, **kwargs)
+
+
+
+	def testRunSummary(self):
+		clearRecords()
+		with timeStage('TD1.xlsx', 'write', 'convert'):
+			L = list(timeIterable('TD1.xlsx', 'convert', slowRange(5)))
+
+		stages = getRunSummary()['files']['TD1.xlsx']
+		self.assertEqual(5, stages['convert']['rows'])
+		self.assertEqual(5, stages['write']['rows'])
+		self.assertTrue(stages['convert']['seconds'] >= 0.05)
+		self.assertTrue(stages['write']['seconds'] < 0.05)
+		clearRecords()
+
+
+
+	def testWithTimingRecords(self):
+		clearRecords()
+		result, records = withTimingRecords(lambda n: list(timeIterable('FX1.xlsx', 'convert', range(n))), 3)
+		self.assertEqual([0, 1, 2], result)
+		self.assertEqual({}, getRunSummary()['files'])
+
+		addRecords(records)
+		self.assertEqual(3, getRunSummary()['files']['FX1.xlsx']['convert']['rows'])
+		clearRecords()
+
+
+
+def slowRange(n):
+	for i in range(n):
+		sleep(0.01)
+		yield i
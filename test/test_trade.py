@@ -3,9 +3,12 @@
 
 import unittest2
 from boci_trustee.utility import getCurrentDir
-from boci_trustee.main import getBociTrades
+from boci_trustee.trade import getBociTrades, getBrokerSSIIndex, getBrokerWithMultipleSSI \
+							, loadBrokerSSIMappingFromFile, getBociTradesBatch
 from steven_utils.excel import fileToLines
+from tempfile import TemporaryDirectory
 from os.path import join
+import shutil, os
 
 
 
@@ -47,4 +50,50 @@ class TestTrade(unittest2.TestCase):
 	def testTrade2(self):
 		inputFile = join(getCurrentDir(), 'samples', 'sample_trade2.xlsx')
 		_, tradesWithMultipleSSI = getBociTrades(fileToLines(inputFile))
-		self.assertEqual(['281305', '282617', '283003'], tradesWithMultipleSSI)
\ No newline at end of file
+		self.assertEqual(['281305', '282617', '283003'], tradesWithMultipleSSI)
+
+
+	def testBrokerSSIIndex(self):
+		index = getBrokerSSIIndex('SSI2019.xlsx')
+		self.assertTrue(index is getBrokerSSIIndex('SSI2019.xlsx'))
+		self.assertEqual('91578', index['mapping']['BOCHK-FI'])
+		self.assertEqual(index['lines'], loadBrokerSSIMappingFromFile('SSI2019.xlsx'))
+		self.assertTrue('JPM-FI' in getBrokerWithMultipleSSI('SSI2019.xlsx'))
+
+
+
+	def testBrokerSSIIndexReload(self):
+		with TemporaryDirectory() as tempDir:
+			ssiFile = join(tempDir, 'SSI.xlsx')
+			shutil.copy(join(getCurrentDir(), 'reference', 'SSI2019.xlsx'), ssiFile)
+			index = getBrokerSSIIndex(ssiFile)
+			self.assertTrue(index is getBrokerSSIIndex(ssiFile))
+
+			os.utime(ssiFile, ns=(0, 0))
+			self.assertFalse(index is getBrokerSSIIndex(ssiFile))
+			self.assertEqual(index['mapping'], getBrokerSSIIndex(ssiFile)['mapping'])
+
+
+
+
+	def testBociTradesBatch(self):
+		lines = [ ['China Life Franklin'], ['TRADES FOR 40019']
+				, [ 'Trader Name', 'Sedol1 Number', 'ISIN Number', 'Short Name'
+				  , 'Buy/Sell', 'Amount (Pennies)', 'As of Date', 'Settlement Date'
+				  , 'View in Currency', 'Trade price', 'Accrued Interest'
+				  , 'Settlement Total in Settlemen', 'Ticket Number'
+				  , 'Firm Account Short Name']
+				, [ 40019.0, 'BK5JS96', 'XS1813551584', 'HOPSON DEVELOP', 'S'
+				  , 1996000.0, 44111.0, 44113.0, 'USD', 100.58, 42415.0
+				  , 2049991.8, 281305.0, 'JPM-FI']
+				, [ '40019', '', 'XS2237806364', 'BLOSSOM JOY LTD', 'B'
+				  , 1379000.0, 44119.0, 44125.0, 'USD', 100.0, 0.0
+				  , 1379000.0, 282617.0, 'BOCHK-FI']
+				, []
+				]
+		trades, tradesWithMultipleSSI = getBociTradesBatch(lines)
+		self.assertEqual(getBociTrades(lines), (trades, tradesWithMultipleSSI))
+		self.assertEqual(['281305'], tradesWithMultipleSSI)
+		self.assertEqual('12345678', trades[1]['Account'])
+		self.assertEqual('15/10/2020', trades[1]['TradeDate'])
+		self.assertEqual('91578', trades[1]['BrokerCode'])
\ No newline at end of file
@@ -0,0 +1,74 @@
+# coding=utf-8
+# 
+
+import unittest2
+from boci_trustee.watch import pollEvents, inotifyEvents, getLibc, getFileType \
+							, getStableFiles
+from tempfile import TemporaryDirectory
+from threading import Timer
+from os.path import join
+
+
+
+class TestWatch(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestWatch, self).__init__(*args, **kwargs)
+
+
+
+	def testGetFileType(self):
+		self.assertEqual('trade', getFileType('TD20201007.xlsx'))
+		self.assertEqual('fx', getFileType('FX20201228.xlsx'))
+		self.assertEqual('repo', getFileType('REPO20201111.xlsx'))
+		self.assertEqual(None, getFileType('TD20201007.csv'))
+
+
+
+	def testPollEvents(self):
+		with TemporaryDirectory() as tempDir:
+			writeFile(join(tempDir, 'TD20201007.xlsx'))
+			events = pollEvents(tempDir, 0.01)
+			self.assertEqual('TD20201007.xlsx', next(events))
+
+			Timer(0.05, writeFile, [join(tempDir, 'FX20201228.xlsx')]).start()
+			self.assertEqual('FX20201228.xlsx', next(events))
+
+
+
+	def testInotifyEvents(self):
+		libc = getLibc()
+		if libc is None:
+			self.skipTest('inotify not available')
+
+		with TemporaryDirectory() as tempDir:
+			writeFile(join(tempDir, 'TD20201007.xlsx'))
+			events = inotifyEvents(libc, tempDir, 0.01)
+			self.assertEqual('TD20201007.xlsx', next(events))
+
+			Timer(0.05, writeFile, [join(tempDir, 'FX20201228.xlsx')]).start()
+			self.assertEqual('FX20201228.xlsx', next(events))
+			events.close()
+
+
+
+	def testStableFiles(self):
+		with TemporaryDirectory() as tempDir:
+			writeFile(join(tempDir, 'FX20201228.xlsx'))
+			writeFile(join(tempDir, 'TD20201007.xlsx'))
+			Timer(0.02, appendFile, [join(tempDir, 'TD20201007.xlsx')]).start()
+			self.assertEqual(['FX20201228.xlsx'], getStableFiles(tempDir, 0.2))
+			self.assertEqual( ['FX20201228.xlsx', 'TD20201007.xlsx']
+							, getStableFiles(tempDir, 0.01))
+
+
+
+def writeFile(file):
+	with open(file, 'w') as f:
+		f.write('test')
+
+
+
+def appendFile(file):
+	with open(file, 'a') as f:
+		f.write(', more')
@@ -0,0 +1,51 @@
+# coding=utf-8
+# 
+
+import unittest2
+from boci_trustee.writer import writeCsvAtomic
+from tempfile import TemporaryDirectory
+from os.path import join
+import os, stat
+
+
+
+class TestWriter(unittest2.TestCase):
+
+	def __init__(self, *args, **kwargs):
+		super(TestWriter, self).__init__(*args, **kwargs)
+
+
+
+	def testWriteCsvAtomic(self):
+		with TemporaryDirectory() as tempDir:
+			outputFile = join(tempDir, 'TD1.csv')
+			records = [ {'a': 1, 'b': 'x', 'c': 2.5, 'd': 'not output'}
+					  , {'a': 2, 'c': ''}
+					  ]
+			self.assertEqual(outputFile, writeCsvAtomic(outputFile, ['a', 'b', 'c'], records, 16))
+			with open(outputFile, newline='') as f:
+				self.assertEqual('1,x,2.5\r\n2,,\r\n', f.read())
+
+			self.assertEqual(['TD1.csv'], os.listdir(tempDir))
+
+			# a new file is created under the umask, a replaced one keeps its mode
+			umask = os.umask(0)
+			os.umask(umask)
+			self.assertEqual(0o666 & ~umask, stat.S_IMODE(os.stat(outputFile).st_mode))
+			os.chmod(outputFile, 0o640)
+			writeCsvAtomic(outputFile, ['a', 'b', 'c'], records)
+			self.assertEqual(0o640, stat.S_IMODE(os.stat(outputFile).st_mode))
+
+
+
+	def testWriteCsvAtomicFailure(self):
+		def records():
+			yield {'a': 1}
+			raise ValueError
+
+		with TemporaryDirectory() as tempDir:
+			outputFile = join(tempDir, 'TD1.csv')
+			with self.assertRaises(ValueError):
+				writeCsvAtomic(outputFile, ['a'], records())
+
+			self.assertEqual([], os.listdir(tempDir))
@@ -0,0 +1,205 @@
+# coding=utf-8
+#
+# Record wall time, row count and throughput of each stage (read, convert,
+# ssi check, write, notify, archive) of a file conversion.
+#
+# Each finished stage is logged as a structured record (the 'timing'
+# attribute of the log record), and kept until saveRunSummary() writes the
+# summary of the run to a json file. The cost is a couple of perf_counter()
+# calls per stage, plus two per row for stages timed with timeIterable().
+#
+from contextlib import contextmanager
+from time import perf_counter
+from datetime import datetime
+from threading import Lock, local
+import json, os
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+_records = []
+_recordsLock = Lock()
+_local = local()
+
+
+
+def newRecord(file, stage, inner):
+	"""
+	[String] file, [String] stage, [String] inner stage
+		=> [Dictionary] timing record
+
+	The inner stage is a stage that runs inside this one (e.g. a lazy read
+	inside convert), its time is excluded from this stage in the summary.
+	"""
+	return { 'file': file, 'stage': stage, 'inner': inner
+		   , 'rows': None, 'seconds': 0.0
+		   }
+
+
+
+def addRecord(record):
+	"""
+	[Dictionary] timing record => [Dictionary] timing record
+
+	Side effect: log the record, keep it for the run summary.
+	"""
+	logger.info( 'timing: {0} {1} {2:.3f}s {3} rows'.format(
+					record['file'], record['stage'], record['seconds'], record['rows'])
+			   , extra={'timing': record})
+
+	sink = getattr(_local, 'sink', None)
+	if sink is None:
+		addRecords([record])
+	else:
+		sink.append(record)
+
+	return record
+
+
+
+def addRecords(records):
+	"""
+	[Iterable] timing records
+
+	Keep the records for the run summary, without logging them again.
+	"""
+	with _recordsLock:
+		_records.extend(records)
+
+
+
+@contextmanager
+def timeStage(file, stage, inner=None):
+	"""
+	[String] file, [String] stage, [String] inner stage
+		=> [Dictionary] timing record
+
+	Time the block of code inside the with statement, the caller can set
+	the 'rows' of the record.
+	"""
+	record = newRecord(file, stage, inner)
+	start = perf_counter()
+	try:
+		yield record
+	finally:
+		record['seconds'] = perf_counter() - start
+		addRecord(record)
+
+
+
+def timeIterable(file, stage, iterable, inner=None):
+	"""
+	[String] file, [String] stage, [Iterable] iterable, [String] inner stage
+		=> [Iterator] the same items
+
+	For lazy stages, time spent producing the items is accumulated and the
+	items are counted. The record is added when the iterator is exhausted
+	or closed.
+	"""
+	record = newRecord(file, stage, inner)
+	it = iter(iterable)
+	try:
+		while True:
+			start = perf_counter()
+			try:
+				x = next(it)
+			except StopIteration:
+				record['seconds'] += perf_counter() - start
+				return
+
+			record['seconds'] += perf_counter() - start
+			record['rows'] = (record['rows'] or 0) + 1
+			yield x
+	finally:
+		addRecord(record)
+
+
+
+def withTimingRecords(func, *args):
+	"""
+	[Function] func, arguments => (result of func, [List] timing records)
+
+	Run func and collect the timing records it produces, instead of keeping
+	them in this process. For running func in a worker process, where the
+	caller passes the records to addRecords().
+	"""
+	_local.sink = []
+	try:
+		return func(*args), _local.sink
+	finally:
+		_local.sink = None
+
+
+
+def summarizeStage(records, record):
+	"""
+	[Dictionary] stage -> record of the same file, [Dictionary] record
+		=> [Dictionary] stage summary
+	"""
+	inner = records.get(record['inner'])
+	seconds = record['seconds'] - (0 if inner is None else inner['seconds'])
+	rows = record['rows'] if record['rows'] is not None or inner is None \
+			else inner['rows']
+
+	return { 'seconds': seconds
+		   , 'rows': rows
+		   , 'rowsPerSecond': rows / seconds if rows is not None and seconds > 0 \
+		   					else None
+		   }
+
+
+
+def getRunSummary():
+	"""
+	=> [Dictionary] run summary
+
+	Stage time, rows and rows per second of all files of the run, the time
+	of an inner stage is excluded from its outer stage.
+	"""
+	with _recordsLock:
+		records = list(_records)
+
+	byFile = {}
+	for record in records:
+		byFile.setdefault(record['file'], {})[record['stage']] = record
+
+	files = dict(map(
+		lambda t: ( t[0]
+				  , dict(map( lambda r: (r['stage'], summarizeStage(t[1], r))
+				  			, t[1].values())))
+	  , byFile.items()))
+
+	return \
+	{ 'time': datetime.now().isoformat(timespec='seconds')
+	, 'files': files
+	, 'seconds': sum(map( lambda stages: sum(map(lambda s: s['seconds'], stages.values()))
+						, files.values()))
+	}
+
+
+
+def clearRecords():
+	with _recordsLock:
+		_records.clear()
+
+
+
+def saveRunSummary(file):
+	"""
+	[String] json file => [Dictionary] run summary
+
+	Append the run summary as one json line to the file, then start a new
+	run. Nothing is written if the file is empty string.
+	"""
+	summary = getRunSummary()
+	if file != '':
+		directory = os.path.dirname(file)
+		if directory != '':
+			os.makedirs(directory, exist_ok=True)
+
+		with open(file, 'a') as f:
+			f.write(json.dumps(summary) + '\n')
+
+	clearRecords()
+	return summary
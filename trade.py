@@ -5,13 +5,19 @@
 # 
 from boci_trustee.utility import getBrokerSSIFile, getCurrentDir
 from toolz.functoolz import compose
-from functools import partial, lru_cache
-from itertools import dropwhile
-from steven_utils.excel import fromExcelOrdinal, fileToLines \
-							, getRawPositionsFromLines
+from functools import partial
+from itertools import dropwhile, starmap
+from steven_utils.excel import fileToLines, getRawPositionsFromLines
 from steven_utils.iter import skipN
+from boci_trustee.reader import rowsToValues, linesToColumns
+from boci_trustee.datecodec import excelOrdinalToDateString
+from boci_trustee.mapping import field, getSources, getHeaders \
+								, makeMappingRecordType, compileMapper, mapColumns
+from contextlib import contextmanager
 from os.path import join
-import shutil
+from os import stat
+from threading import Lock
+import shutil, gc
 import logging
 logger = logging.getLogger(__name__)
 
@@ -40,12 +46,72 @@ def getBrokerCode(brokerName):
 
 	Map the broker code to broker SSI code
 	"""
-	@lru_cache(maxsize=3)
-	def getBrokerSSIMapping(file):
-		return dict(loadBrokerSSIMappingFromFile(file))
+	return getBrokerSSIIndex(getBrokerSSIFile())['mapping'][brokerName]
 
 
-	return getBrokerSSIMapping(getBrokerSSIFile())[brokerName]
+
+"""
+	The broker SSI index, loaded once per process and shared by all lookups.
+
+	[String] SSI file => [Dictionary] index entry, where an index entry has
+
+	stamp: (modification time, size) of the SSI file when it was loaded;
+	lines: [List] (sub broker ID, broker SSI);
+	mapping: [Dictionary] sub broker ID -> broker SSI;
+	multipleSSI: [Set] sub broker IDs with more than one SSI.
+"""
+_brokerSSIIndex = {}
+_brokerSSIIndexLock = Lock()
+
+
+
+getBrokerSSIPath = lambda file: join(getCurrentDir(), 'reference', file)
+
+
+
+def getFileStamp(file):
+	"""
+	[String] file => [Tuple] (modification time in ns, file size)
+	"""
+	s = stat(file)
+	return (s.st_mtime_ns, s.st_size)
+
+
+
+def getBrokerSSIIndex(file):
+	"""
+	[String] broker SSI mapping file => [Dictionary] index entry
+
+	Return the index entry of the SSI file, (re)load it when the file is
+	not loaded yet or has changed on disk since it was loaded.
+	"""
+	stamp = getFileStamp(getBrokerSSIPath(file))
+	entry = _brokerSSIIndex.get(file)
+	if entry is not None and entry['stamp'] == stamp:
+		return entry
+
+	with _brokerSSIIndexLock:
+		entry = _brokerSSIIndex.get(file)
+		if entry is None or entry['stamp'] != stamp:
+			logger.debug('getBrokerSSIIndex(): load {0}'.format(file))
+			lines = readBrokerSSIMappingFromFile(file)
+			entry = { 'stamp': stamp
+					, 'lines': lines
+					, 'mapping': dict(lines)
+					, 'multipleSSI': duplidateItems(map(lambda el: el[0], lines))
+					}
+			_brokerSSIIndex[file] = entry
+
+	return entry
+
+
+
+def clearBrokerSSIIndex():
+	"""
+	Drop all loaded SSI files, they will be reloaded on next lookup.
+	"""
+	with _brokerSSIIndexLock:
+		_brokerSSIIndex.clear()
 
 
 
@@ -68,14 +134,11 @@ def duplidateItems(L):
 
 
 
-@lru_cache(maxsize=3)
 def getBrokerWithMultipleSSI(file):
-	return \
-	compose(
-		duplidateItems
-	  , partial(map, lambda el: el[0])
-	  , loadBrokerSSIMappingFromFile
-	)(file)
+	"""
+	[String] broker SSI mapping file => [Set] sub broker IDs with multiple SSI
+	"""
+	return getBrokerSSIIndex(file)['multipleSSI']
 
 
 
@@ -84,63 +147,89 @@ toStringIfFloat = lambda x: \
 
 
 
-toDateTimeString = lambda x: \
-	fromExcelOrdinal(x).strftime('%d/%m/%Y')
+# [Float] Excel ordinal => [String] dd/mm/yyyy
+toDateTimeString = excelOrdinalToDateString
+
+
+
+"""
+	=> [Tuple] mapping from a Bloomberg trade to a boci trade, see mapping.py
+
+	NOTE: the mapping only works for bond trade. Because for the moment the
+	short term bond fund only trades bond. If equity trade is added, then we
+	must change the logic here.
+"""
+getTradeMapping = lambda: \
+	( field('Account', 'Trader Name', (toStringIfFloat, getAccountNumber), table=True)
+	, field('SEDOL', 'Sedol1 Number')
+	, field('ISIN', 'ISIN Number')
+	, field('Name', 'Short Name')
+	, field('TranType', 'Buy/Sell')
+	, field('Quantity', 'Amount (Pennies)')
+	, field('TradeDate', 'As of Date', toDateTimeString, table=True)
+	, field('SettlementDate', 'Settlement Date', toDateTimeString, table=True)
+	, field('Currency', 'View in Currency')
+	, field('Price', 'Trade price')
+	, field('AccurredInterest', 'Accrued Interest')
+	, field('SettlementAmount', 'Settlement Total in Settlemen')
+	, field('Commission', value=0)
+	, field('StampDuty')
+	, field('TransactionLevy')
+	, field('ClearingFee')
+	, field('SalesTax')
+	, field('HongKongCCASSFee')
+	, field('TradeReferenceNumber', 'Ticket Number', toStringIfFloat)
+	, field('BrokerCode', 'Firm Account Short Name', getBrokerCode, table=True)
+	, field('BrokerName', 'Firm Account Short Name')
+
+	# to detect multiple SSI, not for output
+	, field('BrokerShortName', 'Firm Account Short Name', output=False)
+	)
+
+
+
+"""
+	=> [Tuple] fields of a Bloomberg trade used by bociTrade(), in the order
+		of arguments of toBociTrade()
+"""
+getBlpTradeFields = lambda: getSources(getTradeMapping())
 
 
 
 def bociTrade(blpTrade):
 	"""
-	[Dictionary] blpTrade => [Dictionary] bociTrade
+	[Dictionary] blpTrade => [BociTrade] bociTrade
 
 	Convert a Bloomberg trade to a different format.
-
-	NOTE: the following mapping only works for bond trade. Because for the moment
-	the short term bond fund only trades bond. If equity trade is added, then we
-	must change the logic here.
 	"""
-	return \
-	{ 'Account': getAccountNumber(toStringIfFloat(blpTrade['Trader Name']))
-	, 'SEDOL': blpTrade['Sedol1 Number']
-	, 'ISIN': blpTrade['ISIN Number']
-	, 'Name': blpTrade['Short Name']
-	, 'TranType': blpTrade['Buy/Sell']
-	, 'Quantity': blpTrade['Amount (Pennies)']
-	, 'TradeDate': toDateTimeString(blpTrade['As of Date'])
-	, 'SettlementDate': toDateTimeString(blpTrade['Settlement Date'])
-	, 'Currency': blpTrade['View in Currency']
-	, 'Price': blpTrade['Trade price']
-	, 'AccurredInterest': blpTrade['Accrued Interest']
-	, 'SettlementAmount': blpTrade['Settlement Total in Settlemen']
-	, 'Commission': 0
-	, 'StampDuty': ''
-	, 'TransactionLevy': ''
-	, 'ClearingFee': ''
-	, 'SalesTax': ''
-	, 'HongKongCCASSFee': ''
-	, 'TradeReferenceNumber': toStringIfFloat(blpTrade['Ticket Number'])
-	, 'BrokerCode': getBrokerCode(blpTrade['Firm Account Short Name'])
-	, 'BrokerName': blpTrade['Firm Account Short Name']
-
-	, 'BrokerShortName': blpTrade['Firm Account Short Name'] # to detect multiple SSI
-													 # not for output to BOCI
-	}
-
-
-
-@lru_cache(maxsize=3)
+	return toBociTrade(*map(blpTrade.__getitem__, getBlpTradeFields()))
+
+
+
 def loadBrokerSSIMappingFromFile(file):
 	"""
 	[String] broker SSI mapping file 
 		=> [List] (sub broker ID, broker SSI)
 	"""
+	return getBrokerSSIIndex(file)['lines']
+
+
+
+def readBrokerSSIMappingFromFile(file):
+	"""
+	[String] broker SSI mapping file 
+		=> [List] (sub broker ID, broker SSI)
+
+	Read the file from disk, use loadBrokerSSIMappingFromFile() instead
+	to go through the SSI index.
+	"""
 	return \
 	compose(
 		list
 	  , partial(map, lambda line: (line[0].strip(), toStringIfFloat(line[-1])))
 	  , partial(skipN, 1)
 	  , fileToLines
-  	  , partial(join, getCurrentDir(), 'reference')
+  	  , getBrokerSSIPath
 	)(file)
 
 
@@ -150,8 +239,10 @@ def getTradeWithMultipleSSI(trades):
 	[Iterator] trades (boci format) => [List] reference number of trades whose
 		broker has multiple SSI codes.
 	"""
+	brokerWithMultipleSSI = getBrokerWithMultipleSSI(getBrokerSSIFile())
+
 	withMultipleSSI = lambda t: \
-		t['BrokerShortName'] in getBrokerWithMultipleSSI(getBrokerSSIFile())
+		t['BrokerShortName'] in brokerWithMultipleSSI
 
 
 	return list(map( lambda t: t['TradeReferenceNumber']
@@ -172,20 +263,140 @@ compose(
 
 
 
+"""
+	[Function] toRecord,
+	[Tuple] fields,
+	[Iterator] lines
+		=> [Iterator] records
+
+	Same as convert(), but the header line is resolved to column positions
+	once, then the fields are picked from each row by position and passed
+	to toRecord as arguments. No dictionary is built per row. Lines are
+	read lazily, so it works with both readers.
+"""
+convertRows = lambda toRecord, fields, lines: \
+compose(
+	partial(starmap, toRecord)
+  , partial(rowsToValues, fields)
+  , partial(dropwhile, lambda L: len(L) == 0 or L[0] == '')
+  , partial(skipN, 2)
+)(lines)
+
+
+
+"""
+	[Iterator] lines => [Iterator] boci trades
+"""
+convertTrades = lambda lines: \
+	convertRows(toBociTrade, getBlpTradeFields(), lines)
+
+
+
+def checkMultipleSSI(trades):
+	"""
+	[Iterator] trades (boci format)
+		=> [Iterator] the same trades, [List] trades with multiple SSI
+
+	Lazy version of getTradeWithMultipleSSI(), the list is filled in as the
+	trades are consumed, so it is complete only after the iterator is
+	exhausted.
+	"""
+	tradesWithMultipleSSI = []
+	brokerWithMultipleSSI = getBrokerWithMultipleSSI(getBrokerSSIFile())
+
+	def checkSSI(t):
+		if t['BrokerShortName'] in brokerWithMultipleSSI:
+			tradesWithMultipleSSI.append(t['TradeReferenceNumber'])
+
+		return t
+
+
+	return map(checkSSI, trades), tradesWithMultipleSSI
+
+
+
+"""
+	[Iterator] lines => [Iterator] boci trades, [List] trades with multiple SSI
+
+	Streaming version of getBociTrades(), trades are not kept in memory,
+	see checkMultipleSSI().
+"""
+getBociTradesStreaming = compose(
+	checkMultipleSSI
+  , convertTrades
+)
+
+
+
 """
 	[Iterator] lines => [List] boci trades, [List] trades with multiple SSI
 """
 getBociTrades = compose(
 	lambda L: (L, getTradeWithMultipleSSI(L))
   , list
-  , partial(convert, bociTrade)
+  , convertTrades
 )
 
 
 
-getTradeCsvHeaders = lambda: \
-	[ 'Account', 'SEDOL', 'ISIN', 'Name', 'TranType', 'Quantity', 'TradeDate'
-	, 'SettlementDate', 'Currency', 'Price', 'AccurredInterest', 'SettlementAmount'
-	, 'Commission', 'StampDuty', 'TransactionLevy', 'ClearingFee', 'SalesTax'
-	, 'HongKongCCASSFee', 'TradeReferenceNumber', 'BrokerCode', 'BrokerName'
-	]
\ No newline at end of file
+@contextmanager
+def pausedGC():
+	"""
+	Pause the cyclic garbage collector in the block, if it is enabled.
+	"""
+	enabled = gc.isenabled()
+	gc.disable()
+	try:
+		yield
+	finally:
+		if enabled:
+			gc.enable()
+
+
+
+def convertTradesBatch(lines):
+	"""
+	[Iterator] lines => [List] boci trades
+
+	Same trades as convertTrades(), for large files. The sheet is read into
+	columns and the trade mapping is run column at a time (see mapColumns()),
+	so account, date and broker SSI lookups are done once per distinct
+	value.
+	"""
+	with pausedGC():
+		return mapColumns( 'convertTradesBatch', getTradeMapping(), BociTrade
+						 , linesToColumns( getBlpTradeFields()
+						 				 , dropwhile( lambda L: len(L) == 0 or L[0] == ''
+						 				 			, skipN(2, lines))))
+
+
+
+"""
+	[Iterator] lines => [List] boci trades, [List] trades with multiple SSI
+
+	Same result as getBociTrades(), for large files.
+"""
+getBociTradesBatch = compose(
+	lambda L: (L, getTradeWithMultipleSSI(L))
+  , convertTradesBatch
+)
+
+
+
+getTradeCsvHeaders = lambda: getHeaders(getTradeMapping())
+
+
+
+# boci trade record, the csv fields plus the broker short name
+BociTrade = makeMappingRecordType('BociTrade', getTradeMapping(), __name__)
+
+
+
+"""
+	Values of the Bloomberg trade fields in getBlpTradeFields()
+		=> [BociTrade] bociTrade
+
+	Same as bociTrade(), taking the fields by position.
+"""
+toBociTrade = compileMapper( 'toBociTrade', getBlpTradeFields(), getTradeMapping()
+						   , BociTrade, module=__name__)
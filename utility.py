@@ -85,4 +85,167 @@ def getMailTimeout():
 
 def getBrokerSSIFile():
 	global config
-	return config['other']['brokerSSIFile']
\ No newline at end of file
+	return config['other']['brokerSSIFile']
+
+
+
+def getStreamingInput():
+	"""
+	=> [Bool] whether to read input files row by row in read only mode
+	"""
+	global config
+	return config['other'].getboolean('streamingInput', fallback=False)
+
+
+
+def getWorkers():
+	"""
+	=> [Int] number of workers to process trade, fx and repo files in parallel
+	"""
+	global config
+	return config['other'].getint('workers', fallback=1)
+
+
+
+def getExecutorType():
+	"""
+	=> [String] type of worker pool, 'thread' or 'process'
+	"""
+	global config
+	return config['other'].get('executor', fallback='thread')
+
+
+
+def getBatchMode():
+	"""
+	=> [Bool] whether to process all input files of a type in one run
+	"""
+	global config
+	return config['other'].getboolean('batchMode', fallback=False)
+
+
+
+def getWatchInterval():
+	"""
+	=> [Float] seconds between two polls of the input directory in watch mode
+	"""
+	global config
+	return config['other'].getfloat('watchInterval', fallback=5)
+
+
+
+def getTimingFile():
+	"""
+	=> [String] json file to append the timing summary of each run to,
+		empty string for no summary
+	"""
+	global config
+	return config['other'].get('timingFile', fallback='')
+
+
+
+def getCsvBufferSize():
+	"""
+	=> [Int] buffer size in bytes for writing output csv files
+	"""
+	global config
+	return config['other'].getint('csvBufferSize', fallback=1024*1024)
+
+
+
+def getRepoMaxGroups():
+	"""
+	=> [Int] max number of repo ticket groups to hold in memory, 0 for no
+		limit, beyond it groups are spilled to disk
+	"""
+	global config
+	return config['other'].getint('repoMaxGroups', fallback=0)
+
+
+
+def getRepoCacheFile():
+	"""
+	=> [String] sqlite file to cache repo master data, empty string for no
+		cache
+	"""
+	global config
+	return config['other'].get('repoCacheFile', fallback='')
+
+
+
+def getRepoCacheMaxAge():
+	"""
+	=> [Int] seconds a cached repo master data entry stays valid, after that
+		it is fetched from the datastore again
+	"""
+	global config
+	return config['other'].getint('repoCacheMaxAge', fallback=86400)
+
+
+
+def getLedgerFile():
+	"""
+	=> [String] sqlite file of the processing ledger, empty string for no
+		ledger
+	"""
+	global config
+	return config['other'].get('ledgerFile', fallback='')
+
+
+
+def getReconStoreFile():
+	"""
+	=> [String] sqlite file to keep recon positions for day over day deltas,
+		empty string for no deltas
+	"""
+	global config
+	return config['other'].get('reconStoreFile', fallback='')
+
+
+
+def getColumnarFormat():
+	"""
+	=> [String] columnar format of output files (parquet or arrow), empty
+		string for csv files only
+	"""
+	global config
+	return config['other'].get('columnarFormat', fallback='').strip().lower()
+
+
+
+def getColumnarDirectory():
+	"""
+	=> [String] directory of columnar files, empty string for the directory
+		of the csv files
+	"""
+	global config
+	return config['other'].get('columnarDirectory', fallback='')
+
+
+
+def getParseCacheDirectory():
+	"""
+	=> [String] directory of the parsed workbook cache, empty string for no
+		cache
+	"""
+	global config
+	return config['other'].get('parseCacheDirectory', fallback='')
+
+
+
+def getParseCacheSize():
+	"""
+	=> [Int] max total size in bytes of the parsed workbook cache, 0 for no
+		limit
+	"""
+	global config
+	return config['other'].getint('parseCacheSize', fallback=1024*1024*1024)
+
+
+
+def getFundPortfolios():
+	"""
+	=> [Dictionary] fund folder name (lower case) -> portfolio name
+	"""
+	global config
+	return dict(config['fund']) if config.has_section('fund') else {}
@@ -0,0 +1,206 @@
+# coding=utf-8
+#
+# Watch the input directory and convert trade, fx and repo files as soon as
+# they are completely written, instead of polling from a scheduler.
+#
+# On Linux, inotify is used to get notified when a file is closed after
+# writing or moved into the directory. Elsewhere, the directory is polled
+# and a file is picked up when its size and modification time no longer
+# change between two polls.
+#
+# Run it as:
+#
+# $python watch.py
+#
+from boci_trustee.utility import getInputDirectory, getOutputDirectory \
+						, getWatchInterval, getTimingFile
+from boci_trustee.snapshot import isTradeFile, isFXFile, isRepoFile
+from boci_trustee.main import getHandler, processFile, moveFiles
+from boci_trustee.timing import saveRunSummary
+from os import scandir, read, close
+from os.path import exists, join
+from time import sleep
+import ctypes, ctypes.util, struct, sys
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+
+"""
+	[String] file name => [String] file type, or None if not an input file
+"""
+getFileType = lambda name: \
+	'trade' if isTradeFile(name) else \
+	'fx' if isFXFile(name) else \
+	'repo' if isRepoFile(name) else \
+	None
+
+
+
+def getLibc():
+	"""
+	=> [CDLL] libc if it supports inotify, otherwise None
+	"""
+	if not sys.platform.startswith('linux'):
+		return None
+
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+		return libc if hasattr(libc, 'inotify_init') else None
+	except OSError:
+		return None
+
+
+
+def getFileStamps(directory):
+	"""
+	[String] directory => [Dictionary] file name -> (size, modification time)
+	"""
+	with scandir(directory) as entries:
+		return dict(map( lambda e: (e.name, (e.stat().st_size, e.stat().st_mtime_ns))
+					   , filter(lambda e: e.is_file(), entries)))
+
+
+
+def getStableFiles(directory, interval):
+	"""
+	[String] directory, [Float] interval in seconds => [List] file names
+
+	Files whose size and modification time are the same before and after
+	the interval, i.e. not being written, the same check as pollEvents().
+	"""
+	previous = getFileStamps(directory)
+	sleep(interval)
+	current = getFileStamps(directory)
+	return sorted(filter(lambda name: previous.get(name) == current[name], current))
+
+
+
+def pollEvents(directory, interval):
+	"""
+	[String] directory, [Float] interval in seconds
+		=> [Iterator] ([String] file name)
+
+	Poll the directory, yield a file once its size and modification time
+	are the same in two consecutive polls. A file is yielded again only
+	after it has left the directory and come back.
+	"""
+	previous = {}
+	reported = set()
+	while True:
+		current = getFileStamps(directory)
+		for name in sorted(current):
+			if not name in reported and previous.get(name) == current[name]:
+				reported.add(name)
+				yield name
+
+		reported = reported & set(current)
+		previous = current
+		sleep(interval)
+
+
+
+def inotifyEvents(libc, directory, interval):
+	"""
+	[CDLL] libc, [String] directory, [Float] interval in seconds
+		=> [Iterator] ([String] file name)
+
+	Yield files already in the directory that are completely written (see
+	getStableFiles()), then every file that is closed after writing or moved
+	into the directory. A file still being written at startup is left to its
+	close event. An event of a file no longer in the directory, e.g. one
+	already handled from the startup listing, is skipped.
+	"""
+	fd = libc.inotify_init()
+	if fd < 0:
+		raise OSError(ctypes.get_errno(), 'inotify_init() failed')
+
+	try:
+		if libc.inotify_add_watch( fd, directory.encode()
+								 , IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+			raise OSError(ctypes.get_errno(), 'inotify_add_watch() failed')
+
+		yield from getStableFiles(directory, interval)
+
+		while True:
+			buf = read(fd, 64 * 1024)
+			i = 0
+			while i < len(buf):
+				_, _, _, length = struct.unpack_from('iIII', buf, i)
+				name = buf[i+16:i+16+length].rstrip(b'\0').decode()
+				i = i + 16 + length
+				if exists(join(directory, name)):
+					yield name
+				else:
+					logger.debug('inotifyEvents(): {0} is gone'.format(name))
+	finally:
+		close(fd)
+
+
+
+def getEvents(directory, interval):
+	"""
+	[String] directory, [Float] polling interval
+		=> [Iterator] ([String] file name)
+	"""
+	libc = getLibc()
+	if libc is None:
+		logger.info('getEvents(): polling {0}'.format(directory))
+		return pollEvents(directory, interval)
+	else:
+		logger.info('getEvents(): inotify on {0}'.format(directory))
+		return inotifyEvents(libc, directory, interval)
+
+
+
+def handleFile(inputDir, outputDir, name):
+	"""
+	[String] input directory,
+	[String] output directory,
+	[String] file name
+		=> [String] file type, or None if the file is not an input file
+
+	Side effect: convert the file, send notification and move it to the
+	processed folder.
+	"""
+	fileType = getFileType(name)
+	if fileType is None:
+		return None
+
+	logger.debug('handleFile(): {0}'.format(name))
+	try:
+		processFile(getHandler(fileType), fileType, [name], inputDir, outputDir)
+		moveFiles(inputDir, [name])
+	except:
+		logger.exception('handleFile(): {0}'.format(name))
+
+	saveRunSummary(getTimingFile())
+	return fileType
+
+
+
+def watch(inputDir, outputDir, interval):
+	"""
+	[String] input directory,
+	[String] output directory,
+	[Float] polling interval in seconds
+
+	Run forever, handle each input file as soon as it is written.
+	"""
+	for name in getEvents(inputDir, interval):
+		handleFile(inputDir, outputDir, name)
+
+
+
+
+if __name__ == '__main__':
+	import logging.config
+	logging.config.fileConfig('logging.config', disable_existing_loggers=False)
+
+	watch(getInputDirectory(), getOutputDirectory(), getWatchInterval())
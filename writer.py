@@ -0,0 +1,138 @@
+# coding=utf-8
+#
+# Write records to a csv file atomically: rows are streamed through a large
+# buffer into a temporary file in the same directory, which is synced once
+# and renamed to the output file only when all rows are written. So the
+# trustee pickup never sees a half written file. The output file gets the
+# permissions of the file it replaces, or of a newly created file, and the
+# rename is synced to the directory so it survives a crash.
+#
+from boci_trustee.record import isPositional
+from operator import itemgetter
+from tempfile import mkstemp
+from os.path import dirname, basename
+import csv, os, stat
+import logging
+logger = logging.getLogger(__name__)
+
+
+
+"""
+	The umask of the process, read once, as os.umask() can only be read by
+	setting it.
+"""
+_umask = os.umask(0o022)
+os.umask(_umask)
+
+
+
+def getValuesFunction(headers):
+	"""
+	[List] headers => [Function] ([Dictionary] record => [Sequence] values)
+
+	The header positions are resolved once. A record missing some header
+	gives '' for it, like d.get(h, ''). A record type whose fields start
+	with the headers (see record.py) is written by position, whether it
+	is so is checked once per type.
+	"""
+	headers = tuple(headers)
+	getter = itemgetter(*headers) if len(headers) > 1 else \
+			 (lambda d: (d[headers[0]], )) if len(headers) == 1 else \
+			 (lambda d: ())
+	n = len(headers)
+	positional = {}
+
+	def toValues(d):
+		t = type(d)
+		if not t in positional:
+			positional[t] = isPositional(d, headers)
+
+		if positional[t]:
+			return d if len(d) == n else d[:n]
+
+		try:
+			return getter(d)
+		except KeyError:
+			return tuple(map(lambda h: d.get(h, ''), headers))
+
+	return toValues
+
+
+
+def getFileMode(file):
+	"""
+	[String] file => [Int] permission bits for a new version of the file
+
+	Those of the existing file, otherwise those open() gives a new file
+	under the umask. A temporary file from mkstemp() is readable by its
+	owner only.
+	"""
+	try:
+		return stat.S_IMODE(os.stat(file).st_mode)
+	except FileNotFoundError:
+		return 0o666 & ~_umask
+
+
+
+def syncDirectory(directory):
+	"""
+	[String] directory
+
+	Sync the directory entries, so a rename in it is durable. Directories
+	cannot be opened on Windows, there nothing is done.
+	"""
+	if os.name != 'posix':
+		return
+
+	fd = os.open(directory, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+
+def replaceFile(tempFile, file):
+	"""
+	[String] temporary file, [String] file
+
+	Rename the complete temporary file to the file, with the permissions
+	of getFileMode(), and sync the directory.
+	"""
+	os.chmod(tempFile, getFileMode(file))
+	os.replace(tempFile, file)
+	syncDirectory(dirname(file) or '.')
+
+
+
+def writeCsvAtomic(outputFile, headers, items, bufferSize=1024*1024, delimiter=','):
+	"""
+	[String] outputFile,
+	[List] headers,
+	[Iterable] items ([Dictionary] record),
+	[Int] buffer size in bytes,
+	[String] delimiter
+		=> [String] outputFile
+
+	Write the values of each record, in the order of headers, one row per
+	record. The header row itself is not written.
+	"""
+	logger.debug('writeCsvAtomic(): {0}'.format(outputFile))
+
+	fd, tempFile = mkstemp( dir=dirname(outputFile) or '.'
+						  , prefix='.' + basename(outputFile) + '.', suffix='.tmp')
+	try:
+		with open(fd, 'w', newline='', buffering=bufferSize) as f:
+			csv.writer(f, delimiter=delimiter).writerows(
+				map(getValuesFunction(headers), items))
+			f.flush()
+			os.fsync(f.fileno())
+
+		replaceFile(tempFile, outputFile)
+		return outputFile
+
+	except:
+		logger.error('writeCsvAtomic(): failed to write {0}'.format(outputFile))
+		if os.path.exists(tempFile):
+			os.remove(tempFile)
+		raise